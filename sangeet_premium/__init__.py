@@ -0,0 +1,6 @@
+import os
+from dotenv import load_dotenv
+
+# Modules read their settings with os.getenv at import time, so config/.env
+# must be loaded before any of them is imported.
+load_dotenv(dotenv_path=os.path.join(os.getcwd(), "config", ".env"))
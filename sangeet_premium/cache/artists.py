@@ -0,0 +1,77 @@
+import os
+import logging
+from . import swr
+from .store import SharedStore
+from ..utils import util, upstream
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Artist pages change slowly: profiles are fresh for a day and then served
+# stale (refreshed in the background) for up to a week.
+ARTIST_CACHE_TTL = int(os.getenv("ARTIST_CACHE_TTL", "86400"))
+ARTIST_CACHE_STALE = int(os.getenv("ARTIST_CACHE_STALE", str(7 * 86400)))
+ARTIST_CACHE_SIZE = int(os.getenv("ARTIST_CACHE_SIZE", "1024"))
+# Names that matched no artist are searched again after this long.
+ARTIST_NEGATIVE_TTL = int(os.getenv("ARTIST_NEGATIVE_TTL", "3600"))
+
+# normalized artist name -> {"browse_id": ...}; a mapping rarely changes,
+# so it stays fresh as long as a profile may be served stale.
+_ids = swr.SWRCache("artist_id", ARTIST_CACHE_STALE, 30 * 86400, ARTIST_CACHE_SIZE)
+# browse ID -> processed profile payload, as returned by /api/artist-info
+_profiles = swr.SWRCache("artist_profile", ARTIST_CACHE_TTL, ARTIST_CACHE_STALE, ARTIST_CACHE_SIZE)
+_missing = SharedStore("artist_missing", ttl=ARTIST_NEGATIVE_TTL)
+
+
+def _resolve(name):
+    """Browse ID of the best artist match for ``name``, or None."""
+    ytmusic = upstream.get_ytmusic()
+    results = ytmusic.search(name, filter='artists')
+    if not results:
+        # Try a more lenient search
+        results = [r for r in ytmusic.search(name) if r.get('category') == 'Artists']
+    browse_id = results[0].get('browseId') if results else None
+    if not browse_id:
+        logger.warning(f"No artist found for: {name}")
+        _missing.set(util.normalize_query(name), True)
+        return swr.Uncached(None)
+    return {"browse_id": browse_id}
+
+
+def _build(browse_id, name):
+    """Fetch an artist page and process it into the /api/artist-info payload."""
+    artist_data = upstream.get_ytmusic().get_artist(browse_id)
+    if not artist_data:
+        raise Exception("Failed to fetch artist details")
+
+    return {
+        'name': artist_data.get('name', name),
+        'thumbnail': util.get_best_thumbnail(artist_data.get('thumbnails', [])),
+        'description': util.process_description(artist_data.get('description', '')),
+        'genres': util.process_genres(artist_data),
+        'year': util.extract_year(artist_data),
+        'stats': util.get_artist_stats(artist_data),
+        'topSongs': util.process_top_songs(artist_data),
+        'links': util.process_artist_links(artist_data, browse_id),
+    }
+
+
+def get_artist_info(name):
+    """Processed profile for an artist name, or None if no artist matches.
+
+    Both the name -> browse ID mapping and the profile are served from the
+    shared SWR caches; stale entries are returned immediately and refreshed
+    in the background. Upstream errors on a cold miss propagate.
+    """
+    key = util.normalize_query(name)
+    if _missing.get(key):
+        return None
+    entry = _ids.get(key, lambda: _resolve(name))
+    if not entry:
+        return None
+    browse_id = entry["browse_id"]
+    return _profiles.get(browse_id, lambda: _build(browse_id, name))
+
+
+def stats():
+    return {"ids": _ids.stats(), "profiles": _profiles.stats()}
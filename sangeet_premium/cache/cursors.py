@@ -0,0 +1,53 @@
+import os
+import secrets
+import logging
+from .store import SharedStore
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# A search session lives this long after its last page was fetched.
+SEARCH_CURSOR_TTL = int(os.getenv("SEARCH_CURSOR_TTL", "1800"))
+# Upper bound on stored sessions; the reaper drops the oldest beyond it.
+SEARCH_CURSOR_MAX = int(os.getenv("SEARCH_CURSOR_MAX", "2000"))
+
+# Sessions are kept in the shared store so that the next page can be served
+# by whichever worker receives the request.
+_store = SharedStore("search_cursor", ttl=SEARCH_CURSOR_TTL)
+_counters = {"created": 0, "resumed": 0, "expired": 0}
+
+
+def create(state):
+    """Store a new search session and return its cursor token."""
+    token = secrets.token_urlsafe(16)
+    _store.set(token, state)
+    _counters["created"] += 1
+    return token
+
+
+def load(token):
+    """The session for ``token``, or None if it is unknown or expired."""
+    state = _store.get(token) if token else None
+    if state is None:
+        if token:
+            _counters["expired"] += 1
+        return None
+    _counters["resumed"] += 1
+    return state
+
+
+def save(token, state):
+    """Write back an updated session, extending its lifetime."""
+    _store.set(token, state)
+
+
+def trim():
+    """Bound the number of stored sessions; called periodically by the reaper."""
+    return _store.trim(SEARCH_CURSOR_MAX)
+
+
+def stats():
+    stats = dict(_counters)
+    stats["ttl"] = SEARCH_CURSOR_TTL
+    stats["stored"] = _store.count()
+    return stats
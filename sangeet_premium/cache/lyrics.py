@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ..database import pool
+from ..utils import upstream
+from . import singleflight
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Lyrics hardly ever change; "no lyrics" is re-checked much sooner since
+# YouTube Music adds lyrics to songs over time.
+LYRICS_TTL = int(os.getenv("LYRICS_TTL", str(30 * 86400)))
+LYRICS_NEGATIVE_TTL = int(os.getenv("LYRICS_NEGATIVE_TTL", str(6 * 3600)))
+LYRICS_PREFETCH_WORKERS = int(os.getenv("LYRICS_PREFETCH_WORKERS", "2"))
+# A prefetch request never queues more than this many songs.
+LYRICS_PREFETCH_MAX = 5
+
+_counters = {"hits": 0, "negative_hits": 0, "fetches": 0, "errors": 0, "prefetched": 0}
+_prefetching = set()
+_prefetch_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _background():
+    """Prefetch pool, recreated in forked worker processes."""
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=LYRICS_PREFETCH_WORKERS, thread_name_prefix="lyrics-prefetch"
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _parse(data):
+    """(lines, synced, source) from a get_lyrics() response.
+
+    Timed lines arrive as dicts: the coalesced client returns plain data.
+    """
+    if not data or not data.get("lyrics"):
+        return None, None, None
+    if data.get("hasTimestamps"):
+        synced = [{
+            "text": line["text"],
+            "start": line["start_time"],
+            "end": line["end_time"],
+        } for line in data["lyrics"]]
+        lines = [line["text"] for line in synced]
+    else:
+        synced = None
+        lines = data["lyrics"].split("\n")
+    return lines, synced, data.get("source")
+
+
+def _lookup(video_id):
+    """Stored ``(found, browse_id, entry)``; ``entry`` is None when not cached."""
+    conn = pool.get_connection()
+    try:
+        now = time.time()
+        row = conn.execute(
+            "SELECT browse_id FROM lyrics_index WHERE video_id = ? AND expires_at > ?",
+            (video_id, now)
+        ).fetchone()
+        if row is None:
+            return False, None, None
+        browse_id = row[0]
+        if browse_id is None:
+            return True, None, None
+        lyric = conn.execute(
+            "SELECT lines, synced, source FROM lyrics WHERE browse_id = ? AND expires_at > ?",
+            (browse_id, now)
+        ).fetchone()
+        if lyric is None:
+            return True, browse_id, None
+        return True, browse_id, {
+            "lines": json.loads(lyric[0]) if lyric[0] else None,
+            "synced": json.loads(lyric[1]) if lyric[1] else None,
+            "source": lyric[2],
+        }
+    finally:
+        conn.close()
+
+
+def _save(video_id, browse_id, lines=None, synced=None, source=None):
+    now = time.time()
+    conn = pool.get_connection()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO lyrics_index (video_id, browse_id, expires_at) VALUES (?, ?, ?)",
+            (video_id, browse_id, now + (LYRICS_TTL if browse_id else LYRICS_NEGATIVE_TTL))
+        )
+        if browse_id:
+            conn.execute(
+                "INSERT OR REPLACE INTO lyrics (browse_id, lines, synced, source, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (browse_id, json.dumps(lines) if lines else None,
+                 json.dumps(synced) if synced else None, source,
+                 now + (LYRICS_TTL if lines else LYRICS_NEGATIVE_TTL))
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _fetch(video_id, browse_id=None):
+    """Ask YouTube Music for the lyrics of ``video_id`` and store the answer."""
+    _counters["fetches"] += 1
+    ytmusic = upstream.get_ytmusic()
+    if browse_id is None:
+        watch_pl = ytmusic.get_watch_playlist(video_id)
+        browse_id = (watch_pl or {}).get("lyrics")
+        if not browse_id:
+            _save(video_id, None)
+            return None
+    lines, synced, source = _parse(ytmusic.get_lyrics(browse_id, timestamps=True))
+    _save(video_id, browse_id, lines, synced, source)
+    if not lines:
+        return None
+    return {"lines": lines, "synced": synced, "source": source}
+
+
+def get_lyrics(video_id):
+    """``{"lines", "synced", "source"}`` for a song, or None if it has no lyrics.
+
+    Answers come from the SQLite lyrics store when possible, including
+    cached "no lyrics" results. Otherwise YouTube Music is asked once
+    (coalesced across workers) and the answer is stored. ``synced`` holds
+    ``{"text", "start", "end"}`` lines in milliseconds when timed lyrics
+    exist. Upstream errors propagate and are not cached.
+    """
+    found, browse_id, entry = _lookup(video_id)
+    if found and (browse_id is None or entry is not None):
+        if entry is None or not entry["lines"]:
+            _counters["negative_hits"] += 1
+            return None
+        _counters["hits"] += 1
+        return entry
+
+    try:
+        return singleflight.do(
+            singleflight.key_for("lyrics", video_id), lambda: _fetch(video_id, browse_id)
+        )
+    except Exception:
+        _counters["errors"] += 1
+        raise
+
+
+def prefetch(video_ids):
+    """Fetch lyrics for upcoming songs in the background. Returns how many were queued."""
+    queued = 0
+    for video_id in video_ids[:LYRICS_PREFETCH_MAX]:
+        if not video_id or video_id.startswith("local-"):
+            continue
+        with _prefetch_lock:
+            if video_id in _prefetching:
+                continue
+            _prefetching.add(video_id)
+
+        def run(video_id=video_id):
+            try:
+                get_lyrics(video_id)
+                _counters["prefetched"] += 1
+            except Exception as e:
+                logger.warning(f"Lyrics prefetch for {video_id} failed: {e}")
+            finally:
+                with _prefetch_lock:
+                    _prefetching.discard(video_id)
+
+        _background().submit(run)
+        queued += 1
+    return queued
+
+
+def purge_expired():
+    """Delete expired lyrics rows; called periodically by the reaper."""
+    now = time.time()
+    conn = pool.get_connection()
+    try:
+        removed = conn.execute("DELETE FROM lyrics_index WHERE expires_at <= ?", (now,)).rowcount
+        removed += conn.execute("DELETE FROM lyrics WHERE expires_at <= ?", (now,)).rowcount
+        conn.commit()
+        return removed
+    finally:
+        conn.close()
+
+
+def stats():
+    return dict(_counters)
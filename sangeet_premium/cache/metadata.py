@@ -0,0 +1,103 @@
+import os
+import logging
+from .memory import TTLCache
+from .store import SharedStore
+from ..utils import upstream
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Song metadata hardly ever changes, so it is kept for a day by default.
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", "86400"))
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", "2048"))
+METADATA_STORE_MAX = int(os.getenv("METADATA_STORE_MAX", "50000"))
+
+# Only the parts of a get_song() response that callers read are cached;
+# streamingData holds short-lived URLs and is never worth keeping.
+KEPT_KEYS = ("videoDetails", "artists", "album")
+
+_cache = TTLCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+_store = SharedStore("song_metadata", ttl=METADATA_CACHE_TTL)
+_counters = {"shared_hits": 0, "upstream_fetches": 0, "upstream_errors": 0}
+
+
+def client():
+    """The YTMusic client used for metadata lookups."""
+    return upstream.get_ytmusic()
+
+
+def _slim(data):
+    return {key: data[key] for key in KEPT_KEYS if key in data}
+
+
+def get_song(video_id):
+    """Cached replacement for ``YTMusic.get_song``.
+
+    Looks in this worker's LRU first, then in the store shared by all
+    workers (which also survives restarts), and only then asks YouTube
+    Music. Responses without videoDetails (unavailable videos) are not
+    cached. Errors from the upstream call propagate like before.
+    """
+    data = _cache.get(video_id)
+    if data is not None:
+        return data
+
+    data = _store.get(video_id)
+    if data is not None:
+        _counters["shared_hits"] += 1
+        _cache.set(video_id, data)
+        return data
+
+    _counters["upstream_fetches"] += 1
+    try:
+        data = client().get_song(video_id)
+    except Exception:
+        _counters["upstream_errors"] += 1
+        raise
+    if not data or not data.get("videoDetails"):
+        return data
+
+    data = _slim(data)
+    _cache.set(video_id, data)
+    _store.set(video_id, data)
+    return data
+
+
+def remember(video_id, info):
+    """Seed the cache from a yt-dlp info dict, e.g. the one a download produced.
+
+    Data already cached from YouTube Music is richer and is kept as is.
+    """
+    if _cache.get(video_id) is not None or _store.get(video_id) is not None:
+        return
+    artists = info.get("artists") or ([info["artist"]] if info.get("artist") else [])
+    data = {"videoDetails": {
+        "videoId": video_id,
+        "title": info.get("track") or info.get("title") or "Unknown",
+        "author": (artists[0] if artists else None) or info.get("channel") or info.get("uploader") or "Unknown Artist",
+        "lengthSeconds": str(int(info.get("duration") or 0)),
+    }}
+    if artists:
+        data["artists"] = [{"name": name} for name in artists]
+    if info.get("album"):
+        data["album"] = {"name": info["album"]}
+    _cache.set(video_id, data)
+    _store.set(video_id, data)
+
+
+def invalidate(video_id):
+    _cache.delete(video_id)
+    _store.delete(video_id)
+
+
+def trim():
+    """Bound the shared store; called periodically by the reaper."""
+    return _store.trim(METADATA_STORE_MAX)
+
+
+def cache_stats():
+    stats = _cache.stats()
+    stats.update(_counters)
+    stats["ttl"] = METADATA_CACHE_TTL
+    stats["shared_entries"] = _store.count()
+    return stats
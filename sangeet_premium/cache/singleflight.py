@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import dataclasses
+from .store import SharedStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: calls are only coalesced within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+LOCK_DIR = os.path.join(os.getcwd(), "database_files", "locks")
+
+# How long a finished result stays available to workers that were waiting
+# for it. Callers that arrive after it finished never see it: this is for
+# coalescing concurrent calls, not a cache.
+SHARE_TTL = float(os.getenv("SINGLEFLIGHT_SHARE_TTL", "5"))
+# A worker never waits longer than this for another worker's call.
+LOCK_TIMEOUT = float(os.getenv("SINGLEFLIGHT_LOCK_TIMEOUT", "30"))
+LOCK_POLL = 0.05
+
+_results = SharedStore("singleflight", ttl=SHARE_TTL)
+_stats = {"calls": 0, "leaders": 0, "joined": 0, "shared": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class KeyLock:
+    """Exclusive lock on one key, shared by every worker on this host.
+
+    Each key has its own lock file, named after its SHA-1, so different
+    keys never wait for each other. Byte 0 is the lock; a shared lock on
+    byte 1 marks workers waiting for it. The holder removes the file on
+    release, and a worker that then gets the lock on the removed file
+    tries again on the current one.
+    """
+
+    def __init__(self, namespace, key):
+        self.digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        self.path = os.path.join(LOCK_DIR, namespace, f"{self.digest}.lock")
+        self.waited = False
+        self._fd = None
+
+    def acquire(self, timeout, poll=LOCK_POLL, announce=False):
+        """Take the lock within ``timeout`` seconds. Returns whether it was taken.
+
+        With ``announce`` the holder can see through ``has_waiters()`` that
+        this worker is waiting for it.
+        """
+        deadline = time.monotonic() + timeout
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if announce:
+                fcntl.lockf(fd, fcntl.LOCK_SH, 1, 1)
+            while True:
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 0)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        os.close(fd)
+                        return False
+                self.waited = True
+                time.sleep(poll)
+            if announce:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, 1)
+            if self._is_current(fd):
+                self._fd = fd
+                return True
+            os.close(fd)
+
+    def _is_current(self, fd):
+        try:
+            return os.fstat(fd).st_ino == os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def has_waiters(self):
+        """Whether another worker is waiting for this lock."""
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 1)
+        except OSError:
+            return True
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, 1)
+        return False
+
+    def release(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        # Closing the file drops its locks
+        os.close(self._fd)
+        self._fd = None
+
+
+def _plain(value):
+    """``value`` with dataclasses (e.g. ytmusicapi's LyricLine) turned into dicts.
+
+    Shared results are passed through JSON, so the leader returns the same
+    plain form that workers reusing its result get.
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def key_for(*parts):
+    """Stable key for a call from its name and arguments."""
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+class Group:
+    """Coalesce concurrent identical calls into one.
+
+    Within a process, callers of ``do()`` with the same key while a call is
+    in flight wait for it and get its result (or exception), for at most
+    LOCK_TIMEOUT before calling ``fn`` themselves. With ``shared=True`` the
+    leading thread also takes a lock on the key shared by all workers on
+    this host. A worker that finds the lock held waits and then reuses the
+    result the other worker published. Shared results are returned as plain
+    JSON-compatible data.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, shared=True):
+        _count("calls")
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            _count("joined")
+            if not call.done.wait(LOCK_TIMEOUT):
+                logger.warning("Timed out waiting for an identical call, calling directly")
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        _count("leaders")
+        try:
+            if shared:
+                call.result = self._do_shared(key, fn) if fcntl is not None else _plain(fn())
+            else:
+                call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _do_shared(self, key, fn):
+        lock = KeyLock("singleflight", key)
+        started = time.time()
+        if not lock.acquire(LOCK_TIMEOUT, announce=True):
+            # Another worker has been busy for too long; do the work ourselves.
+            logger.warning("Timed out waiting for another worker's upstream call")
+            return _plain(fn())
+        try:
+            # Only reuse a result that finished while we were waiting for it.
+            published = _results.get(lock.digest) if lock.waited else None
+            if published is not None and published["finished"] >= started:
+                _count("shared")
+                return published["result"]
+            result = _plain(fn())
+            if lock.has_waiters():
+                _results.set(lock.digest, {"result": result, "finished": time.time()})
+            return result
+        finally:
+            lock.release()
+
+
+default_group = Group()
+
+
+def do(key, fn, shared=True):
+    return default_group.do(key, fn, shared)
+
+
+class CoalescedClient:
+    """Wrap an API client so calls to ``methods`` go through single-flight.
+
+    Other attributes are passed through untouched.
+    """
+
+    def __init__(self, client, methods, name=None, group=default_group):
+        self._client = client
+        self._methods = frozenset(methods)
+        self._name = name or type(client).__name__
+        self._group = group
+
+    def __getattr__(self, attr):
+        value = getattr(self._client, attr)
+        if attr not in self._methods:
+            return value
+
+        def call(*args, **kwargs):
+            key = key_for(self._name, attr, args, kwargs)
+            return self._group.do(key, lambda: value(*args, **kwargs))
+        return call
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+import dataclasses
+from ..database import pool
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+STORE_PATH = os.path.join(os.getcwd(), "database_files", "cache_store.db")
+
+_initialized = set()
+
+
+def _connect(path):
+    conn = pool.get_connection(path)
+    if path not in _initialized:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_kv_expires ON kv(expires_at)")
+        conn.commit()
+        _initialized.add(path)
+    return conn
+
+
+def _encode(value):
+    """JSON fallback: dataclasses (e.g. ytmusicapi's LyricLine) are stored as dicts."""
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class SharedStore:
+    """Small key/value store shared by every worker process on this host.
+
+    Values are JSON-serialised into a dedicated SQLite file so that caches
+    survive restarts and are visible to all gunicorn workers.
+    """
+
+    def __init__(self, namespace, ttl=3600, path=STORE_PATH):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.path = path
+
+    def get(self, key, default=None):
+        return self.get_with_expiry(key, (default, None))[0]
+
+    def get_with_expiry(self, key, default=(None, None)):
+        """Return ``(value, expires_at)`` for a live entry, else ``default``."""
+        try:
+            conn = _connect(self.path)
+            try:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (self.namespace, key, time.time())
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared store read failed ({self.namespace}): {e}")
+            return default
+        if not row:
+            return default
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        try:
+            conn = _connect(self.path)
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value, default=_encode), time.time() + ttl)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Shared store write failed ({self.namespace}): {e}")
+
+    def delete(self, key):
+        self._execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def delete_prefix(self, prefix):
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        self._execute(
+            "DELETE FROM kv WHERE namespace = ? AND key LIKE ? ESCAPE '\\'",
+            (self.namespace, escaped + "%")
+        )
+
+    def clear(self):
+        self._execute("DELETE FROM kv WHERE namespace = ?", (self.namespace,))
+
+    def purge_expired(self):
+        return self._execute(
+            "DELETE FROM kv WHERE namespace = ? AND expires_at <= ?",
+            (self.namespace, time.time())
+        )
+
+    def values(self, limit=None):
+        """Live values of this namespace, most recently written first."""
+        try:
+            conn = _connect(self.path)
+            try:
+                rows = conn.execute(
+                    "SELECT value FROM kv WHERE namespace = ? AND expires_at > ? "
+                    "ORDER BY expires_at DESC LIMIT ?",
+                    (self.namespace, time.time(), -1 if limit is None else limit)
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared store read failed ({self.namespace}): {e}")
+            return []
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self):
+        try:
+            conn = _connect(self.path)
+            try:
+                return conn.execute(
+                    "SELECT COUNT(*) FROM kv WHERE namespace = ?", (self.namespace,)
+                ).fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared store read failed ({self.namespace}): {e}")
+            return 0
+
+    def trim(self, max_entries):
+        """Keep at most ``max_entries``, dropping the entries closest to expiry."""
+        return self._execute("""
+            DELETE FROM kv WHERE namespace = ? AND key IN (
+                SELECT key FROM kv WHERE namespace = ?
+                ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.namespace, self.namespace, max_entries))
+
+    def _execute(self, sql, params):
+        try:
+            conn = _connect(self.path)
+            try:
+                cur = conn.execute(sql, params)
+                conn.commit()
+                return cur.rowcount
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared store update failed ({self.namespace}): {e}")
+            return 0
+
+
+def purge_all_expired(path=STORE_PATH):
+    """Delete expired entries of every namespace. Returns the number removed."""
+    try:
+        conn = _connect(path)
+        try:
+            cur = conn.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            return cur.rowcount
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Shared store purge failed: {e}")
+        return 0
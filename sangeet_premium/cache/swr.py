@@ -0,0 +1,154 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .memory import TTLCache
+from .store import SharedStore
+from . import singleflight
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+REVALIDATE_WORKERS = 2
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _background():
+    """Executor for revalidations, recreated in forked worker processes."""
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=REVALIDATE_WORKERS, thread_name_prefix="swr-revalidate"
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+class Uncached:
+    """Return value for ``compute`` callbacks: pass ``value`` through without caching it."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class SWRCache:
+    """Two-tier cache that serves stale entries while refreshing them.
+
+    An entry is *fresh* for ``fresh_ttl`` seconds and is then served as
+    *stale* for up to ``stale_ttl`` seconds while a background thread
+    recomputes it. Entries live in an in-process LRU and in the SQLite store
+    shared by all workers. Misses are computed through single-flight, so a
+    burst of identical requests makes one upstream call. ``compute`` results
+    that are empty, None or wrapped in ``Uncached`` are returned but not cached.
+    """
+
+    def __init__(self, namespace, fresh_ttl=600, stale_ttl=86400, maxsize=512):
+        self.namespace = namespace
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = max(stale_ttl, fresh_ttl)
+        self._memory = TTLCache(maxsize=maxsize, ttl=self.stale_ttl)
+        self._store = SharedStore(namespace, ttl=self.stale_ttl)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._counters = {"fresh": 0, "stale": 0, "shared": 0, "computed": 0, "revalidated": 0}
+
+    def _lookup(self, key):
+        entry = self._memory.get(key)
+        if entry is None:
+            entry, expires_at = self._store.get_with_expiry(key)
+            if entry is not None:
+                self._counters["shared"] += 1
+                self._memory.set(key, entry, max(0, expires_at - time.time()))
+        return entry
+
+    def _put(self, key, value):
+        entry = {"value": value, "fresh_until": time.time() + self.fresh_ttl}
+        self._memory.set(key, entry)
+        self._store.set(key, entry)
+        return entry
+
+    def _compute(self, key, compute):
+        def run():
+            # Another worker may have filled the shared tier meanwhile.
+            entry, expires_at = self._store.get_with_expiry(key)
+            if entry is not None and entry["fresh_until"] > time.time():
+                self._memory.set(key, entry, max(0, expires_at - time.time()))
+                return entry["value"]
+            value = compute()
+            if isinstance(value, Uncached):
+                return value.value
+            if value:
+                self._put(key, value)
+            return value
+        return singleflight.do(singleflight.key_for("swr", self.namespace, key), run)
+
+    def get(self, key, compute):
+        """Return the cached value for ``key``, computing it on a miss."""
+        entry = self._lookup(key)
+        if entry is not None:
+            if entry["fresh_until"] > time.time():
+                self._counters["fresh"] += 1
+            else:
+                self._counters["stale"] += 1
+                self._revalidate(key, compute)
+            return entry["value"]
+
+        self._counters["computed"] += 1
+        return self._compute(key, compute)
+
+    def peek(self, key, compute=None):
+        """Return the cached value for ``key`` or None, never computing it inline.
+
+        A stale entry is still returned and, given ``compute``, refreshed in
+        the background like in ``get()``.
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        if entry["fresh_until"] > time.time():
+            self._counters["fresh"] += 1
+        else:
+            self._counters["stale"] += 1
+            if compute is not None:
+                self._revalidate(key, compute)
+        return entry["value"]
+
+    def set(self, key, value):
+        """Store a value computed outside ``get()``."""
+        if value:
+            self._put(key, value)
+
+    def _revalidate(self, key, compute):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._compute(key, compute)
+                self._counters["revalidated"] += 1
+            except Exception as e:
+                logger.warning(f"Revalidating {self.namespace} entry failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        _background().submit(run)
+
+    def invalidate(self, key):
+        self._memory.delete(key)
+        self._store.delete(key)
+
+    def stats(self):
+        stats = self._memory.stats()
+        stats.update(self._counters)
+        stats["fresh_ttl"] = self.fresh_ttl
+        stats["stale_ttl"] = self.stale_ttl
+        return stats
@@ -1,6 +1,7 @@
-import sqlite3
 import os
+import time
 import logging
+from . import pool
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -16,7 +17,7 @@ DB_PATH = os.path.join(os.getcwd() , "database_files" , "sangeet_database_main.d
 
 def init_db():
     """Master database initialization function."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     
     try:
@@ -164,14 +165,79 @@ def init_db():
             )
         """)
         
+        # Submitted search queries per user (feeds /api/suggest). Rows from
+        # before queries were kept per user cannot be attributed: drop them.
+        columns = {row[1] for row in c.execute("PRAGMA table_info(search_queries)")}
+        if columns and "user_id" not in columns:
+            c.execute("DROP TABLE search_queries")
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS search_queries (
+                user_id INTEGER NOT NULL,
+                query TEXT NOT NULL,
+                display TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 1,
+                last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, query)
+            )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_search_queries_recent ON search_queries(user_id, last_used)")
+        
+        # Lyrics store: video -> lyrics browse ID, and lyrics per browse ID.
+        # A NULL browse_id / lines row records that there are no lyrics.
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS lyrics_index (
+                video_id TEXT PRIMARY KEY,
+                browse_id TEXT,
+                expires_at REAL NOT NULL
+            )
+        """)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS lyrics (
+                browse_id TEXT PRIMARY KEY,
+                lines TEXT,
+                synced TEXT,
+                source TEXT,
+                expires_at REAL NOT NULL
+            )
+        """)
+        
+        # Background FLAC download jobs (queued / running / done / failed)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS download_jobs (
+                id TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                user_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'queued',
+                progress REAL NOT NULL DEFAULT 0,
+                path TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        
         # Create indexes for better performance
         c.execute("CREATE INDEX IF NOT EXISTS idx_history_session ON history(session_id, sequence_number)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_download_jobs_video ON download_jobs(video_id, status)")
+        # Runs at start-up, before any worker: nothing is downloading, so
+        # every queued/running job was cut off by the last shutdown.
+        c.execute("""
+            UPDATE download_jobs SET status = 'failed', error = 'Interrupted', updated_at = ?
+            WHERE status IN ('queued', 'running')
+        """, (time.time(),))
+        # At most one queued/running job per song, across all workers
+        c.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_download_jobs_active
+            ON download_jobs(video_id) WHERE status IN ('queued', 'running')
+        """)
         c.execute("CREATE INDEX IF NOT EXISTS idx_user_history_user ON user_history(user_id)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_user_downloads_user ON user_downloads(user_id)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_listening_history_user ON listening_history(user_id)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_listening_dates ON listening_history(started_at)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_listening_song ON listening_history(song_id)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_listening_completion ON listening_history(completion_rate)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_active_sessions_expires ON active_sessions(expires_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pending_otps_expires ON pending_otps(expires_at)")
         
         conn.commit()
         logger.info("Database initialized successfully")
@@ -187,7 +253,7 @@ def init_db():
 
 def init_auth_db():
     """Initialize authentication-related database tables"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     
     # Users table
@@ -0,0 +1,223 @@
+import sqlite3
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+DB_PATH = os.path.join(os.getcwd() , "database_files" , "sangeet_database_main.db")
+
+# Connection tuning applied once when a pooled connection is opened.
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+PRAGMAS = [
+    ("journal_mode", "WAL"),        # readers never block the single writer
+    ("synchronous", "NORMAL"),      # safe with WAL, avoids an fsync per commit
+    ("busy_timeout", BUSY_TIMEOUT_MS),
+    ("cache_size", int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000")) * -1),
+    ("mmap_size", int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))),
+    ("temp_store", "MEMORY"),
+]
+
+# Idle connections kept per database file once their thread is done with them.
+MAX_IDLE = int(os.getenv("SQLITE_POOL_MAX_IDLE", "8"))
+
+_lock = threading.Lock()
+_local = threading.local()
+_idle = {}          # db path -> list of idle sqlite3 connections
+_owner_pid = os.getpid()
+_stats = {
+    "opened": 0,
+    "closed": 0,
+    "checkouts": 0,
+    "reused": 0,
+    "shared": 0,
+    "in_use": 0,
+    "peak_in_use": 0,
+}
+
+
+class PooledConnection:
+    """Proxy around a pooled sqlite3 connection.
+
+    Behaves like a regular connection, but close() hands it back to the pool
+    instead of closing it, so the usual ``conn = ...`` / ``conn.close()``
+    pattern works unchanged. Used as a context manager it commits (or rolls
+    back on error) and then returns the connection to the pool.
+    """
+
+    def __init__(self, path, entry):
+        self._path = path
+        self._entry = entry
+        self._released = False
+
+    @property
+    def _conn(self):
+        return self._entry["conn"]
+
+    def __getattr__(self, name):
+        return getattr(self._entry["conn"], name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self._conn.__exit__(exc_type, exc, tb)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        _release(self._path, self._entry)
+
+
+def _check_fork():
+    """Drop connections inherited from a parent process (e.g. gunicorn master)."""
+    global _owner_pid, _local
+    if _owner_pid == os.getpid():
+        return
+    with _lock:
+        if _owner_pid == os.getpid():
+            return
+        # sqlite connections must never be used across fork(); abandon them.
+        _idle.clear()
+        _local = threading.local()
+        _owner_pid = os.getpid()
+        for key in _stats:
+            _stats[key] = 0
+
+
+def _open(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    for name, value in PRAGMAS:
+        try:
+            conn.execute(f"PRAGMA {name} = {value}")
+        except sqlite3.Error as e:
+            logger.warning(f"Could not apply PRAGMA {name} on {path}: {e}")
+    return conn
+
+
+def get_connection(path=DB_PATH):
+    """Return a pooled connection to ``path`` for the current thread.
+
+    Nested calls on the same thread share one connection; it goes back to the
+    idle pool when the outermost caller closes it.
+    """
+    _check_fork()
+    held = getattr(_local, "held", None)
+    if held is None:
+        held = _local.held = {}
+
+    entry = held.get(path)
+    if entry is not None:
+        entry["users"] += 1
+        with _lock:
+            _stats["shared"] += 1
+        return PooledConnection(path, entry)
+
+    conn = None
+    with _lock:
+        _stats["checkouts"] += 1
+        idle = _idle.get(path)
+        if idle:
+            conn = idle.pop()
+            _stats["reused"] += 1
+
+    if conn is None:
+        conn = _open(path)
+        with _lock:
+            _stats["opened"] += 1
+
+    with _lock:
+        _stats["in_use"] += 1
+        _stats["peak_in_use"] = max(_stats["peak_in_use"], _stats["in_use"])
+
+    entry = held[path] = {"conn": conn, "users": 1, "pid": os.getpid()}
+    return PooledConnection(path, entry)
+
+
+def _release(path, entry):
+    if entry["pid"] != os.getpid() or entry["users"] <= 0:
+        return
+    entry["users"] -= 1
+    if entry["users"] > 0:
+        return
+
+    held = getattr(_local, "held", {})
+    if held.get(path) is entry:
+        del held[path]
+
+    conn = entry["conn"]
+    try:
+        # Matches sqlite3 close() semantics: uncommitted work is discarded.
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error as e:
+        logger.warning(f"Discarding broken pooled connection to {path}: {e}")
+        _discard(conn)
+        return
+
+    with _lock:
+        _stats["in_use"] -= 1
+        idle = _idle.setdefault(path, [])
+        if len(idle) < MAX_IDLE:
+            idle.append(conn)
+            return
+        _stats["closed"] += 1
+    conn.close()
+
+
+def release_thread():
+    """Hand back every connection the current thread still holds.
+
+    Run when a request ends: a handler that raised before closing its
+    connection must not leave an open transaction (and the write lock) on
+    this thread for the next request to commit. Uncommitted work is rolled
+    back.
+    """
+    _check_fork()
+    held = getattr(_local, "held", None)
+    if not held:
+        return
+    for path, entry in list(held.items()):
+        logger.warning(f"Releasing a connection to {os.path.basename(path)} left open by a request")
+        entry["users"] = 1
+        _release(path, entry)
+
+
+def _discard(conn):
+    with _lock:
+        _stats["in_use"] -= 1
+        _stats["closed"] += 1
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def close_all():
+    """Close every idle pooled connection in this process."""
+    _check_fork()
+    with _lock:
+        conns = [c for idle in _idle.values() for c in idle]
+        _idle.clear()
+        _stats["closed"] += len(conns)
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def pool_stats():
+    """Snapshot of connection pool counters for this process."""
+    _check_fork()
+    with _lock:
+        stats = dict(_stats)
+        stats["idle"] = {os.path.basename(p): len(c) for p, c in _idle.items()}
+    stats["pid"] = os.getpid()
+    return stats
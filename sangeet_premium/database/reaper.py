@@ -0,0 +1,70 @@
+import os
+import time
+import logging
+from threading import Thread
+from . import pool
+from ..login_system import session_cache
+from ..cache import store, metadata, cursors, lyrics
+from ..downloads import jobs
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+REAPER_INTERVAL = int(os.getenv("SESSION_REAPER_INTERVAL", "300"))
+REAPER_BATCH_SIZE = int(os.getenv("SESSION_REAPER_BATCH_SIZE", "500"))
+
+
+def _purge_table(table, batch_size, returning=None):
+    """Delete expired rows in small transactions so writers are never blocked long.
+
+    Returns the number of rows removed, or the ``returning`` columns of each
+    removed row when given.
+    """
+    removed = []
+    while True:
+        conn = pool.get_connection()
+        try:
+            cur = conn.execute(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE expires_at <= CURRENT_TIMESTAMP
+                    LIMIT ?
+                ) RETURNING {returning or "id"}
+            """, (batch_size,))
+            batch = cur.fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+        removed.extend(batch)
+        if len(batch) < batch_size:
+            return removed if returning else len(removed)
+
+
+def purge_expired(batch_size=REAPER_BATCH_SIZE):
+    """Remove expired sessions, OTPs and shared cache entries. Returns counts per table."""
+    sessions = _purge_table("active_sessions", batch_size, returning="user_id, session_token")
+    session_cache.forget_expired(sessions)
+    counts = {"active_sessions": len(sessions), "pending_otps": _purge_table("pending_otps", batch_size)}
+    counts["cache_store"] = store.purge_all_expired() + metadata.trim() + cursors.trim()
+    counts["lyrics"] = lyrics.purge_expired()
+    counts["download_jobs"] = jobs.purge_finished()
+    counts["partial_downloads"] = jobs.purge_partial()
+    if any(counts.values()):
+        logger.info(f"Session reaper removed {counts}")
+    return counts
+
+
+def start_reaper(interval=REAPER_INTERVAL):
+    """Start a background thread that purges expired rows every ``interval`` seconds."""
+    def reap_loop():
+        while True:
+            try:
+                purge_expired()
+            except Exception as e:
+                logger.error(f"Error reaping expired sessions: {e}")
+            time.sleep(interval)
+
+    reaper_thread = Thread(target=reap_loop, daemon=True)
+    reaper_thread.start()
+    logger.info(f"Started session reaper thread (every {interval}s)")
+    return reaper_thread
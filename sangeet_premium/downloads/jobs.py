@@ -0,0 +1,236 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ..database import pool
+from ..utils import util
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Downloads + FLAC transcodes running at once per worker process.
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+# A queued/running job not updated for this long is treated as lost
+# (its worker was restarted) and a new job is started for the song.
+DOWNLOAD_JOB_STALE = int(os.getenv("DOWNLOAD_JOB_STALE", "900"))
+# Finished jobs are kept this long for status lookups.
+DOWNLOAD_JOB_RETENTION = int(os.getenv("DOWNLOAD_JOB_RETENTION", "86400"))
+# Progress is written at most this often per job.
+PROGRESS_INTERVAL = 1.0
+# Tries at queueing a job while other workers race on the same song.
+SUBMIT_ATTEMPTS = 3
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+ACTIVE = (QUEUED, RUNNING)
+
+FIELDS = ("id", "video_id", "user_id", "status", "progress", "path", "error", "created_at", "updated_at")
+COLUMNS = ", ".join(FIELDS)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    """Bounded download pool, recreated in forked worker processes."""
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download"
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _row_to_job(row):
+    return dict(zip(FIELDS, row)) if row else None
+
+
+def _update(job_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = pool.get_connection()
+    try:
+        conn.execute(f"UPDATE download_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _is_stale(job):
+    return job["status"] in ACTIVE and job["updated_at"] < time.time() - DOWNLOAD_JOB_STALE
+
+
+def get(job_id):
+    """The job with ``job_id`` as a dict, or None."""
+    conn = pool.get_connection()
+    try:
+        row = conn.execute(f"SELECT {COLUMNS} FROM download_jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    job = _row_to_job(row)
+    if job and _is_stale(job):
+        _update(job_id, status=FAILED, error="Interrupted")
+        job.update(status=FAILED, error="Interrupted")
+    return job
+
+
+def active_job(video_id):
+    """The queued or running job for ``video_id``, or None."""
+    conn = pool.get_connection()
+    try:
+        row = conn.execute(f"""
+            SELECT {COLUMNS} FROM download_jobs
+            WHERE video_id = ? AND status IN (?, ?)
+            ORDER BY created_at DESC LIMIT 1
+        """, (video_id, *ACTIVE)).fetchone()
+    finally:
+        conn.close()
+    job = _row_to_job(row)
+    if job and _is_stale(job):
+        _update(job["id"], status=FAILED, error="Interrupted")
+        return None
+    return job
+
+
+def downloaded_path(video_id):
+    """Path of the finished FLAC for ``video_id``, or None."""
+    path = util.get_download_info(video_id)
+    if path and os.path.exists(path):
+        return path
+    path = os.path.join(util.MUSIC_DIR, f"{video_id}.flac")
+    return path if os.path.exists(path) else None
+
+
+def _finished(video_id, path):
+    now = time.time()
+    return {"id": None, "video_id": video_id, "user_id": None, "status": DONE, "progress": 1.0,
+            "path": path, "error": None, "created_at": now, "updated_at": now}
+
+
+def _failed(video_id, error):
+    now = time.time()
+    return {"id": None, "video_id": video_id, "user_id": None, "status": FAILED, "progress": 0.0,
+            "path": None, "error": error, "created_at": now, "updated_at": now}
+
+
+def submit(video_id, user_id):
+    """Queue a FLAC download for ``video_id`` and return its job.
+
+    Returns immediately. An already downloaded song yields a finished job
+    without an ID, and a song that is already queued or downloading in any
+    worker returns the existing job instead of starting another.
+    """
+    for _ in range(SUBMIT_ATTEMPTS):
+        path = downloaded_path(video_id)
+        if path:
+            return _finished(video_id, path)
+
+        job = active_job(video_id)
+        if job:
+            return job
+
+        now = time.time()
+        job = {"id": uuid.uuid4().hex, "video_id": video_id, "user_id": user_id, "status": QUEUED,
+               "progress": 0.0, "path": None, "error": None, "created_at": now, "updated_at": now}
+        conn = pool.get_connection()
+        try:
+            conn.execute(
+                f"INSERT INTO download_jobs ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                tuple(job[name] for name in FIELDS)
+            )
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # Another worker queued this song in the meantime; its job may
+            # also have ended before we looked, so check again from the top.
+            conn.rollback()
+            continue
+        finally:
+            conn.close()
+
+        _pool().submit(_run, job["id"], video_id, user_id)
+        logger.info(f"Queued download job {job['id']} for {video_id}")
+        return job
+
+    logger.error(f"Could not queue a download job for {video_id}")
+    return _failed(video_id, "Could not queue the download")
+
+
+def _run(job_id, video_id, user_id):
+    _update(job_id, status=RUNNING)
+    last_write = [0.0]
+
+    def report(fraction):
+        now = time.monotonic()
+        if now - last_write[0] >= PROGRESS_INTERVAL:
+            last_write[0] = now
+            # The last stretch is the FLAC transcode, which reports nothing.
+            _update(job_id, progress=round(min(fraction, 1.0) * 0.95, 3))
+
+    def partial(path):
+        # The FLAC being written, for streaming before the job is done
+        _update(job_id, path=path)
+
+    try:
+        path = util.download_flac(video_id, user_id, progress=report, on_partial=partial)
+    except Exception as e:
+        logger.error(f"Download job {job_id} for {video_id} failed: {e}")
+        _update(job_id, status=FAILED, error=str(e))
+        return
+    if path:
+        _update(job_id, status=DONE, progress=1.0, path=path)
+    else:
+        _update(job_id, status=FAILED, error="Download/FLAC conversion failed")
+
+
+def is_streamable(job):
+    """Whether the song can be played already: done, or written progressively."""
+    return job["status"] == DONE or (job["status"] == RUNNING and bool(job["path"]))
+
+
+def to_json(job):
+    """Public view of a job for API responses."""
+    return {
+        "id": job["id"],
+        "video_id": job["video_id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "streamable": is_streamable(job),
+        "error": job["error"],
+        "status_url": f"/api/jobs/{job['id']}" if job["id"] else None,
+    }
+
+
+def purge_finished():
+    """Delete finished jobs past their retention; called periodically by the reaper."""
+    conn = pool.get_connection()
+    try:
+        cur = conn.execute(
+            "DELETE FROM download_jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (DONE, FAILED, time.time() - DOWNLOAD_JOB_RETENTION)
+        )
+        conn.commit()
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def purge_partial():
+    """Remove staging folders of downloads that never finished; called by the reaper."""
+    return util.purge_partial_downloads(DOWNLOAD_JOB_RETENTION)
+
+
+def stats():
+    conn = pool.get_connection()
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) FROM download_jobs GROUP BY status").fetchall()
+    finally:
+        conn.close()
+    stats = {status: count for status, count in rows}
+    stats["workers"] = DOWNLOAD_WORKERS
+    return stats
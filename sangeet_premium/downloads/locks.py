@@ -0,0 +1,66 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from ..cache.singleflight import KeyLock, fcntl
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# A download + FLAC transcode can take minutes. After waiting this long
+# for another worker, the download is started anyway; files are published
+# by atomic rename, so the worst case is duplicated work.
+DOWNLOAD_LOCK_TIMEOUT = float(os.getenv("DOWNLOAD_LOCK_TIMEOUT", "600"))
+LOCK_POLL = 0.2
+
+# POSIX record locks do not exclude threads of the same process, so
+# threads are serialized per video ID first.
+_local = {}
+_local_lock = threading.Lock()
+
+
+def _thread_lock(video_id):
+    with _local_lock:
+        entry = _local.setdefault(video_id, [threading.Lock(), 0])
+        entry[1] += 1
+    return entry
+
+
+def _release_thread_lock(video_id, entry):
+    with _local_lock:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _local.pop(video_id, None)
+
+
+@contextmanager
+def video_lock(video_id):
+    """Hold the download lock for ``video_id`` across all workers on this host.
+
+    Yields True when the lock was taken, or False when waiting for another
+    holder timed out and the caller proceeds without it.
+    """
+    deadline = time.monotonic() + DOWNLOAD_LOCK_TIMEOUT
+    entry = _thread_lock(video_id)
+    held = entry[0].acquire(timeout=DOWNLOAD_LOCK_TIMEOUT)
+    try:
+        if not held or fcntl is None:
+            if not held:
+                logger.warning(f"Timed out waiting for the download of {video_id}")
+            yield held
+            return
+
+        lock = KeyLock("download", video_id)
+        if not lock.acquire(max(0.0, deadline - time.monotonic()), LOCK_POLL):
+            logger.warning(f"Timed out waiting for another worker's download of {video_id}")
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            lock.release()
+    finally:
+        if held:
+            entry[0].release()
+        _release_thread_lock(video_id, entry)
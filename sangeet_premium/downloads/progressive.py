@@ -0,0 +1,54 @@
+import os
+import time
+import logging
+from . import jobs
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# How long a request waits for bytes that have not been written yet; kept
+# well under the gunicorn worker timeout.
+PROGRESSIVE_WAIT = float(os.getenv("PROGRESSIVE_WAIT", "10"))
+POLL_INTERVAL = 0.25
+# Largest range answered from a partial file in one response.
+MAX_CHUNK = 1024 * 1024
+
+
+def partial_job(video_id):
+    """The running job writing ``video_id`` progressively, or None."""
+    job = jobs.active_job(video_id)
+    if job and job["status"] == jobs.RUNNING and job["path"]:
+        return job
+    return None
+
+
+def _writing(job):
+    """Whether ``job`` is still writing the partial file it was found with."""
+    current = jobs.get(job["id"])
+    return bool(current) and current["status"] == jobs.RUNNING and current["path"] == job["path"]
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def wait_for(job, size):
+    """Block until the partial file holds ``size`` bytes or stops growing.
+
+    Returns ``(current_size, writing)``; ``current_size`` is None when the
+    partial file does not exist (not created yet, or already removed).
+    """
+    deadline = time.monotonic() + PROGRESSIVE_WAIT
+    while True:
+        current = _size(job["path"])
+        if current is not None and current >= size:
+            return current, _writing(job)
+        if not _writing(job):
+            return _size(job["path"]), False
+        if time.monotonic() >= deadline:
+            return current, True
+        time.sleep(POLL_INTERVAL)
+
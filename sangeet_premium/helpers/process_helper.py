@@ -0,0 +1,25 @@
+import multiprocessing
+
+_preload = []
+
+
+def pool_context(*preload):
+    """multiprocessing context for process pools started by a threaded process.
+
+    Forking a process that already runs threads (reaper, watcher, job pools)
+    copies the locks they hold into the children, which can deadlock them.
+    On POSIX, pool workers are forked from a forkserver instead: a clean,
+    single-threaded process that imports the ``preload`` modules once.
+    Elsewhere spawn is used. Either way each worker re-imports the entry
+    point as ``__mp_main__``, so its start-up must stay under
+    ``if __name__ == '__main__'``.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    ctx = multiprocessing.get_context("forkserver")
+    for module in preload:
+        if module not in _preload:
+            _preload.append(module)
+    # Only takes effect until the forkserver has started
+    ctx.set_forkserver_preload(list(_preload))
+    return ctx
@@ -0,0 +1,129 @@
+import os
+import base64
+import hashlib
+import shutil
+import logging
+import subprocess
+import tempfile
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; ffmpeg is used for resizing instead
+    Image = None
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+ARTWORK_DIR = os.path.join(os.getcwd(), "data", "artwork")
+ARTWORK_URL = "/api/artwork/"
+
+# Resized variants that may be requested with ?size=
+VARIANT_SIZES = (64, 300, 600)
+
+MIME_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/bmp": ".bmp",
+}
+EXTENSION_MIMES = {ext: mime for mime, ext in MIME_EXTENSIONS.items() if mime != "image/jpg"}
+
+
+def _shard(digest):
+    return os.path.join(ARTWORK_DIR, digest[:2])
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def store(data, mime="image/jpeg"):
+    """Store cover art by content hash and return its URL.
+
+    Identical covers (e.g. every track of an album) are written only once.
+    """
+    digest = hashlib.sha1(data).hexdigest()
+    ext = MIME_EXTENSIONS.get((mime or "").lower(), ".jpg")
+    path = os.path.join(_shard(digest), digest + ext)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    return ARTWORK_URL + digest
+
+
+def store_data_uri(uri):
+    """Move an inline ``data:<mime>;base64,...`` thumbnail into the store."""
+    try:
+        header, payload = uri.split(",", 1)
+        mime = header[5:].split(";", 1)[0]
+        return store(base64.b64decode(payload), mime)
+    except Exception as e:
+        logger.warning(f"Could not convert inline artwork: {e}")
+        return ""
+
+
+def find_original(digest):
+    """Return ``(path, mime)`` of a stored cover, or ``(None, None)``."""
+    if len(digest) != 40 or not all(c in "0123456789abcdef" for c in digest):
+        return None, None
+    for ext, mime in EXTENSION_MIMES.items():
+        path = os.path.join(_shard(digest), digest + ext)
+        if os.path.exists(path):
+            return path, mime
+    return None, None
+
+
+def can_resize():
+    return Image is not None or shutil.which("ffmpeg") is not None
+
+
+def _resize(src, dest, size):
+    if Image is not None:
+        with Image.open(src) as img:
+            img = img.convert("RGB")
+            img.thumbnail((size, size))
+            tmp_path = dest + ".tmp"
+            img.save(tmp_path, "JPEG", quality=85)
+            os.replace(tmp_path, dest)
+        return True
+    tmp_path = dest + ".tmp.jpg"
+    result = subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-i", src,
+         "-vf", f"scale='min({size},iw)':-2", tmp_path],
+        capture_output=True
+    )
+    if result.returncode == 0 and os.path.exists(tmp_path):
+        os.replace(tmp_path, dest)
+        return True
+    return False
+
+
+def get_variant(digest, size=None):
+    """Return ``(path, mime)`` for a cover at one of VARIANT_SIZES.
+
+    Variants are generated on first request and kept next to the original.
+    Falls back to the original if resizing is not possible.
+    """
+    original, mime = find_original(digest)
+    if original is None or size not in VARIANT_SIZES or not can_resize():
+        return original, mime
+
+    variant = os.path.join(_shard(digest), f"{digest}_{size}.jpg")
+    if os.path.exists(variant):
+        return variant, "image/jpeg"
+    try:
+        if _resize(original, variant, size):
+            return variant, "image/jpeg"
+    except Exception as e:
+        logger.warning(f"Could not resize artwork {digest} to {size}px: {e}")
+    return original, mime
@@ -0,0 +1,320 @@
+import os
+import mmap
+import fcntl
+import time
+import struct
+import logging
+import tempfile
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+CATALOG_PATH = os.path.join(os.getcwd(), "locals", "local.catalog")
+
+# File layout (little endian):
+#   header   magic, version, generation, record count, change count, heap size
+#   records  one fixed-size record per song, sorted by id
+#   heap     UTF-8 strings referenced from the records as (offset, length)
+#   changes  songs added, updated or removed since the file was written, each
+#            a flag (1 = song, 0 = removed), a record and the record's strings
+MAGIC = b"SGCT"
+VERSION = 2
+HEADER = struct.Struct("<4sIQIIQ")
+# Generation, record count and change count, rewritten when changes are appended
+COUNTERS = struct.Struct("<QII")
+COUNTERS_OFFSET = 8
+STRING_FIELDS = ("id", "title", "artist", "album", "path", "thumbnail")
+RECORD = struct.Struct("<" + "II" * len(STRING_FIELDS) + "I")
+CHANGE = struct.Struct("<B")
+
+# Appended changes after which the catalog is rewritten with them merged.
+CATALOG_MAX_CHANGES = int(os.getenv("CATALOG_MAX_CHANGES", "1024"))
+
+# Workers check the catalog file at most this often.
+CHECK_INTERVAL = 1.0
+
+
+def read_generation(path=CATALOG_PATH):
+    """Return the generation stored in a catalog file, or 0 if there is none."""
+    try:
+        with open(path, "rb") as f:
+            magic, version, generation = HEADER.unpack(f.read(HEADER.size))[:3]
+    except (OSError, struct.error):
+        return 0
+    return generation if magic == MAGIC and version == VERSION else 0
+
+
+@contextmanager
+def _locked(path):
+    """Serialise catalog writers, which run in several processes."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "ab") as f:
+        fcntl.lockf(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(f, fcntl.LOCK_UN)
+
+
+def _pack(song_id, song, heap):
+    """Pack one song as a record, appending its strings to ``heap``."""
+    fields = []
+    for name in STRING_FIELDS:
+        value = (song_id if name == "id" else str(song.get(name) or "")).encode("utf-8")
+        fields += (len(heap), len(value))
+        heap += value
+    return RECORD.pack(*fields, int(song.get("duration") or 0))
+
+
+def _record_bytes(song_id, song):
+    heap = bytearray()
+    return _pack(song_id, song, heap) + heap
+
+
+def write_catalog(songs, path=CATALOG_PATH):
+    """Atomically replace the catalog with ``songs`` (id -> song dict).
+
+    Returns the new generation number.
+    """
+    with _locked(path):
+        return _write(songs, path)
+
+
+def _write(songs, path):
+    generation = read_generation(path) + 1
+    ids = sorted(songs, key=lambda song_id: song_id.encode("utf-8"))
+
+    heap = bytearray()
+    records = bytearray()
+    for song_id in ids:
+        records += _pack(song_id, songs[song_id], heap)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, generation, len(ids), 0, len(heap)))
+            f.write(records)
+            f.write(heap)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(f"Wrote local catalog generation {generation} with {len(ids)} songs")
+    return generation
+
+
+def apply_changes(updated, removed, path=CATALOG_PATH):
+    """Record ``updated`` songs (id -> song dict) and ``removed`` ids in the catalog.
+
+    The changes are appended to the file and the header is rewritten last,
+    so readers never see a half-written change and mappings made before
+    stay valid. Once CATALOG_MAX_CHANGES have piled up the file is rewritten
+    with them merged. Returns the new generation, or None if there is no
+    readable catalog to change.
+    """
+    with _locked(path):
+        try:
+            with open(path, "r+b") as f:
+                snapshot = _Snapshot(f, os.fstat(f.fileno()))
+                count = snapshot.change_count + len(removed) + len(updated)
+                if count <= CATALOG_MAX_CHANGES:
+                    changes = bytearray()
+                    for song_id in removed:
+                        changes += CHANGE.pack(0) + _record_bytes(song_id, {})
+                    for song_id, song in updated.items():
+                        changes += CHANGE.pack(1) + _record_bytes(song_id, song)
+                    generation = snapshot.generation + 1
+                    os.pwrite(f.fileno(), changes, snapshot.end)
+                    os.fsync(f.fileno())
+                    os.pwrite(f.fileno(), COUNTERS.pack(generation, snapshot.base_count, count),
+                              COUNTERS_OFFSET)
+                    return generation
+                songs = dict(snapshot.items())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"Cannot change local catalog {path}: {e}")
+            return None
+        for song_id in removed:
+            songs.pop(song_id, None)
+        songs.update(updated)
+        return _write(songs, path)
+
+
+class _Snapshot:
+    """One mapped catalog file, read up to its change count when mapped."""
+
+    def __init__(self, f, st):
+        if st.st_size < HEADER.size:
+            raise ValueError("catalog file is truncated")
+        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self.mm[:HEADER.size]
+        self.key = (st.st_ino, header)
+        magic, version, self.generation, self.base_count, self.change_count, heap_size = \
+            HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported catalog format {magic!r} v{version}")
+        self.heap_start = HEADER.size + self.base_count * RECORD.size
+
+        # id -> song, or None if removed, for the changes appended so far
+        self.changes = {}
+        offset = self.heap_start + heap_size
+        for _ in range(self.change_count):
+            (present,) = CHANGE.unpack_from(self.mm, offset)
+            record = RECORD.unpack_from(self.mm, offset + CHANGE.size)
+            strings = offset + CHANGE.size + RECORD.size
+            song = self._song(record, strings)
+            self.changes[song["id"]] = song if present else None
+            offset = strings + sum(record[1:-1:2])
+        if offset > len(self.mm):
+            raise ValueError("catalog file is truncated")
+        self.end = offset
+
+        in_base = {song_id: self._find(song_id) >= 0 for song_id in self.changes}
+        self.added = sorted(
+            song_id for song_id, song in self.changes.items()
+            if song is not None and not in_base[song_id]
+        )
+        removed = sum(1 for song_id, song in self.changes.items() if song is None and in_base[song_id])
+        self.count = self.base_count - removed + len(self.added)
+
+    def _record(self, index):
+        return RECORD.unpack_from(self.mm, HEADER.size + index * RECORD.size)
+
+    def _song(self, record, strings):
+        """Decode a record whose string offsets are relative to ``strings``."""
+        song = {}
+        for i, name in enumerate(STRING_FIELDS):
+            start = strings + record[2 * i]
+            song[name] = self.mm[start:start + record[2 * i + 1]].decode("utf-8")
+        song["duration"] = record[-1]
+        return song
+
+    def _id_at(self, index):
+        offset, length = self._record(index)[:2]
+        start = self.heap_start + offset
+        return self.mm[start:start + length]
+
+    def _find(self, song_id):
+        """Binary search the records for ``song_id``; returns its index or -1."""
+        key = song_id.encode("utf-8")
+        lo, hi = 0, self.base_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.base_count and self._id_at(lo) == key else -1
+
+    def get(self, song_id):
+        """The song with ``song_id``, or None."""
+        if song_id in self.changes:
+            return self.changes[song_id]
+        index = self._find(song_id)
+        return self._song(self._record(index), self.heap_start) if index >= 0 else None
+
+    def __contains__(self, song_id):
+        if song_id in self.changes:
+            return self.changes[song_id] is not None
+        return self._find(song_id) >= 0
+
+    def ids(self):
+        for index in range(self.base_count):
+            song_id = self._id_at(index).decode("utf-8")
+            if song_id not in self.changes or self.changes[song_id] is not None:
+                yield song_id
+        yield from self.added
+
+    def items(self):
+        for index in range(self.base_count):
+            song = self._song(self._record(index), self.heap_start)
+            song = self.changes.get(song["id"], song)
+            if song is not None:
+                yield song["id"], song
+        for song_id in self.added:
+            yield song_id, self.changes[song_id]
+
+
+class LocalCatalog(Mapping):
+    """Read-only, memory-mapped view of the local library catalog.
+
+    Each worker maps the same file, so the page cache is shared instead of
+    every process holding its own parsed copy. The file is re-mapped only
+    when it has been replaced or changes were appended (new generation);
+    a replaced file stays valid for readers still holding the old mapping.
+    """
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self._snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Pick up a newer catalog file if one was written."""
+        now = time.monotonic()
+        if not force and now - self._checked < CHECK_INTERVAL:
+            return self._snapshot
+        with self._lock:
+            self._checked = now
+            try:
+                with open(self.path, "rb") as f:
+                    st = os.fstat(f.fileno())
+                    current = self._snapshot
+                    if current is not None and current.key == (st.st_ino, f.read(HEADER.size)):
+                        return current
+                    snapshot = _Snapshot(f, st)
+            except FileNotFoundError:
+                self._snapshot = None
+                return None
+            except (OSError, ValueError, struct.error) as e:
+                logger.error(f"Cannot load local catalog {self.path}: {e}")
+                return self._snapshot
+            self._snapshot = snapshot
+            logger.info(f"Loaded local catalog generation {snapshot.generation} ({snapshot.count} songs)")
+            return snapshot
+
+    @property
+    def generation(self):
+        snapshot = self.refresh()
+        return snapshot.generation if snapshot else 0
+
+    def __getitem__(self, song_id):
+        snapshot = self.refresh()
+        if snapshot is not None and isinstance(song_id, str):
+            song = snapshot.get(song_id)
+            if song is not None:
+                return song
+        raise KeyError(song_id)
+
+    def __contains__(self, song_id):
+        snapshot = self.refresh()
+        return snapshot is not None and isinstance(song_id, str) and song_id in snapshot
+
+    def __iter__(self):
+        snapshot = self.refresh()
+        if snapshot is None:
+            return
+        yield from snapshot.ids()
+
+    def __len__(self):
+        snapshot = self.refresh()
+        return snapshot.count if snapshot else 0
+
+    def values(self):
+        snapshot = self.refresh()
+        if snapshot is None:
+            return []
+        return [song for _song_id, song in snapshot.items()]
+
+    def items(self):
+        snapshot = self.refresh()
+        return list(snapshot.items()) if snapshot else []
+
+    def to_dict(self):
+        return dict(self.items())
@@ -0,0 +1,505 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from mutagen import File
+from mutagen.flac import FLAC
+from ..database import pool
+from ..cache.store import SharedStore
+from ..helpers import process_helper
+from . import artwork
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+LOCAL_DB_PATH = os.path.join(os.getcwd(), "database_files", "local_songs.db")
+
+# Set of file extensions to consider.
+AUDIO_EXTENSIONS = {".mp3", ".flac", ".m4a", ".wav", ".ogg", ".wma", ".aac", ".aiff", ".alac"}
+
+# Rows written per transaction while scanning.
+COMMIT_EVERY = int(os.getenv("LOCAL_SCAN_BATCH", "2000"))
+
+# Tag parsing moves to a process pool once a scan has this many files to read.
+PARALLEL_MIN_FILES = 64
+SCAN_WORKERS = int(os.getenv("LOCAL_SCAN_WORKERS", "0")) or os.cpu_count() or 1
+PARSE_CHUNKSIZE = 16
+
+SONG_COLUMNS = ("id", "title", "artist", "album", "path", "thumbnail", "duration")
+
+# A real upsert rather than INSERT OR REPLACE: REPLACE deletes the old row
+# without firing delete triggers, which would leave stale songs_fts entries.
+UPSERT_SQL = '''
+    INSERT INTO songs
+        (id, title, artist, album, path, thumbnail, duration, mtime, size, inode)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        title = excluded.title, artist = excluded.artist, album = excluded.album,
+        path = excluded.path, thumbnail = excluded.thumbnail, duration = excluded.duration,
+        mtime = excluded.mtime, size = excluded.size, inode = excluded.inode
+'''
+
+# Full-text index over title/artist/album, kept in sync with songs by triggers.
+# unicode61 with remove_diacritics folds "Beyoncé" to "beyonce"; the prefix
+# indexes make "bey*" queries cheap.
+FTS_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+        title, artist, album,
+        content='songs', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='1 2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN
+        INSERT INTO songs_fts (rowid, title, artist, album)
+        VALUES (new.rowid, new.title, new.artist, new.album);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN
+        INSERT INTO songs_fts (songs_fts, rowid, title, artist, album)
+        VALUES ('delete', old.rowid, old.title, old.artist, old.album);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS songs_fts_update AFTER UPDATE OF title, artist, album ON songs BEGIN
+        INSERT INTO songs_fts (songs_fts, rowid, title, artist, album)
+        VALUES ('delete', old.rowid, old.title, old.artist, old.album);
+        INSERT INTO songs_fts (rowid, title, artist, album)
+        VALUES (new.rowid, new.title, new.artist, new.album);
+    END
+    ''',
+]
+
+_scan_lock = threading.Lock()
+# Scans run in whichever process owns the refresh thread (the gunicorn
+# master); progress and the last result are shared through the store so
+# every worker can report them.
+_scan_state = SharedStore("library_scan", ttl=30 * 24 * 3600)
+PROGRESS_TTL = 600
+_migrated_artwork = False
+# PRAGMA user_version of the local database once one-off data migrations
+# have run; 1 = inline cover art moved to the artwork store.
+SCHEMA_VERSION = 1
+
+
+def init_db():
+    """
+    Initialize (or create if needed) the local library database and bring
+    older schemas up to date with the fingerprint columns.
+    """
+    os.makedirs(os.path.dirname(LOCAL_DB_PATH), exist_ok=True)
+    conn = pool.get_connection(LOCAL_DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS songs (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            artist TEXT,
+            album TEXT,
+            path TEXT UNIQUE,
+            thumbnail TEXT,
+            duration INTEGER
+        )
+    ''')
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(songs)")}
+    for column in ("mtime INTEGER", "size INTEGER", "inode INTEGER"):
+        if column.split()[0] not in existing:
+            cursor.execute(f"ALTER TABLE songs ADD COLUMN {column}")
+
+    # Counter behind "local-<number>" IDs, seeded once from existing rows so
+    # IDs already referenced from user_history/listening_history stay valid.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS id_sequence (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    if not cursor.execute("SELECT 1 FROM id_sequence WHERE name = 'local'").fetchone():
+        cursor.execute('''
+            INSERT INTO id_sequence (name, value)
+            SELECT 'local', COALESCE(MAX(CAST(substr(id, 7) AS INTEGER)), 0)
+            FROM songs WHERE id LIKE 'local-%'
+        ''')
+
+    if cursor.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        _migrate_inline_artwork(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    _init_fts(cursor)
+    conn.commit()
+    return conn
+
+
+def _init_fts(cursor):
+    """Create the songs_fts index (and fill it once) if SQLite has FTS5."""
+    existed = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'songs_fts'"
+    ).fetchone()
+    try:
+        for statement in FTS_SCHEMA:
+            cursor.execute(statement)
+        if not existed:
+            cursor.execute("INSERT INTO songs_fts (songs_fts) VALUES ('rebuild')")
+            logger.info("Built full-text index for the local library")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"SQLite FTS5 unavailable, local search falls back to scanning: {e}")
+
+
+def _migrate_inline_artwork(cursor):
+    """Move cover art that older scans stored inline as data: URIs to the artwork store."""
+    global _migrated_artwork
+    inline = cursor.execute(
+        "SELECT id, thumbnail FROM songs WHERE thumbnail LIKE 'data:%'"
+    ).fetchall()
+    if inline:
+        cursor.executemany(
+            "UPDATE songs SET thumbnail = ? WHERE id = ?",
+            [(artwork.store_data_uri(uri), song_id) for song_id, uri in inline]
+        )
+        _migrated_artwork = True
+        logger.info(f"Moved cover art of {len(inline)} local songs to the artwork store")
+
+
+def get_library_dirs(paths):
+    """Split a semicolon-separated LOCAL_SONGS_PATHS value into directories."""
+    return [d.strip() for d in (paths or "").split(";") if d.strip()]
+
+
+def iter_audio_files(root):
+    """Yield ``(path, stat_result)`` for every audio file below ``root``.
+
+    Symlinked folders are followed, but each directory is read only once,
+    so symlink loops cannot make the walk recurse forever.
+    """
+    stack = [root]
+    visited = set()
+    while stack:
+        current = stack.pop()
+        try:
+            st = os.stat(current)
+            key = (st.st_dev, st.st_ino)
+            if key in visited:
+                continue
+            visited.add(key)
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=True):
+                            # Hidden folders hold work in progress, such as
+                            # downloads that are still being transcoded.
+                            if not entry.name.startswith("."):
+                                stack.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                            yield entry.path, entry.stat(follow_symlinks=True)
+                    except OSError as e:
+                        logger.warning(f"Skipping unreadable entry {entry.path}: {e}")
+        except OSError as e:
+            logger.warning(f"Cannot read directory {current}: {e}")
+
+
+def fingerprint(st):
+    """Cheap change detector for a file: (mtime, size, inode)."""
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def read_tags(full_path):
+    """Read title/artist/album/duration/cover art from an audio file."""
+    fname = os.path.basename(full_path)
+    meta = {
+        "title": fname,
+        "artist": "Unknown Artist",
+        "album": "Unknown Album",
+        "duration": 0,
+        "thumbnail": "",
+    }
+    try:
+        # Read the audio file using Mutagen.
+        audio = File(full_path, easy=True)
+        if audio and hasattr(audio, "info") and hasattr(audio.info, "length"):
+            meta["duration"] = int(audio.info.length)
+        if audio:
+            meta["title"] = audio.get("title", [fname])[0]
+            meta["artist"] = audio.get("artist", ["Unknown Artist"])[0]
+            meta["album"] = audio.get("album", ["Unknown Album"])[0]
+
+        # Try to extract a picture (works for FLAC and ID3-based files)
+        if isinstance(audio, FLAC) or hasattr(audio, "pictures"):
+            pictures = getattr(audio, "pictures", [])
+            if pictures:
+                pic = pictures[0]
+                meta["thumbnail"] = artwork.store(pic.data, pic.mime)
+        elif getattr(audio, "tags", None):
+            tags = audio.tags
+            if "APIC:" in tags:  # Attached picture for ID3 tags.
+                pic = tags["APIC:"]
+                meta["thumbnail"] = artwork.store(pic.data, pic.mime)
+    except Exception as e:
+        logger.error(f"Error reading metadata from {fname}: {e}")
+    return meta
+
+
+def allocate_local_ids(cursor, count=1):
+    """Reserve ``count`` consecutive "local-<number>" IDs in constant time.
+
+    Numbers come from the id_sequence counter and are never handed out twice,
+    even after the song that had them is removed.
+    """
+    if count <= 0:
+        return []
+    cursor.execute("UPDATE id_sequence SET value = value + ? WHERE name = 'local'", (count,))
+    last = cursor.execute("SELECT value FROM id_sequence WHERE name = 'local'").fetchone()[0]
+    return [f"local-{num}" for num in range(last - count + 1, last + 1)]
+
+
+def new_local_id(cursor):
+    """Generate a new "local-<number>" ID."""
+    return allocate_local_ids(cursor, 1)[0]
+
+
+def _is_under(path, roots):
+    return any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _song_row(song_id, full_path, meta, fp):
+    return (song_id, meta["title"], meta["artist"], meta["album"], full_path,
+            meta["thumbnail"], meta["duration"], *fp)
+
+
+def _upsert(cursor, song_id, full_path, meta, fp):
+    """Insert or refresh one song row and return it as a song dict."""
+    row = _song_row(song_id, full_path, meta, fp)
+    cursor.execute(UPSERT_SQL, row)
+    return dict(zip(SONG_COLUMNS, row))
+
+
+def _parse_all(paths):
+    """Yield ``read_tags`` results for ``paths`` in order.
+
+    Large batches are parsed by a process pool (mutagen is CPU bound and
+    holds the GIL); small ones, or a broken pool, fall back to this thread.
+    """
+    done = 0
+    if len(paths) >= PARALLEL_MIN_FILES and SCAN_WORKERS > 1:
+        try:
+            ctx = process_helper.pool_context(__name__)
+            with ProcessPoolExecutor(max_workers=SCAN_WORKERS, mp_context=ctx) as executor:
+                for meta in executor.map(read_tags, paths, chunksize=PARSE_CHUNKSIZE):
+                    done += 1
+                    yield meta
+            return
+        except (BrokenProcessPool, OSError) as e:
+            logger.warning(f"Parallel tag parsing failed after {done} files, continuing serially: {e}")
+    for path in paths[done:]:
+        yield read_tags(path)
+
+
+def _update_progress(total, done, started):
+    elapsed = time.monotonic() - started
+    rate = done / elapsed if elapsed > 0 else 0.0
+    progress = {
+        "state": "parsing",
+        "total": total,
+        "done": done,
+        "files_per_second": round(rate, 1),
+        "eta_seconds": round((total - done) / rate, 1) if rate else None,
+    }
+    _scan_state.set("progress", progress, ttl=PROGRESS_TTL)
+    return progress
+
+
+def get_progress():
+    """Progress of the running scan (or "idle")."""
+    return _scan_state.get("progress") or {"state": "idle"}
+
+
+def get_last_stats():
+    """Statistics from the most recent completed scan, from any process."""
+    return _scan_state.get("last_stats") or {}
+
+
+def _write_batch(conn, rows):
+    """Write a batch of song rows in one transaction. Returns the number of failed rows."""
+    try:
+        conn.executemany(UPSERT_SQL, rows)
+        conn.commit()
+        return 0
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Batch insert failed ({e}), retrying {len(rows)} rows individually")
+    failed = 0
+    for row in rows:
+        try:
+            conn.execute(UPSERT_SQL, row)
+        except Exception as e:
+            failed += 1
+            logger.error(f"Error inserting/updating database for {row[4]}: {e}")
+    conn.commit()
+    return failed
+
+
+def load_songs(conn):
+    """Return every song row in the database keyed by local ID."""
+    rows = conn.execute(f"SELECT {', '.join(SONG_COLUMNS)} FROM songs").fetchall()
+    return {row[0]: dict(zip(SONG_COLUMNS, row)) for row in rows}
+
+
+def scan(dirs):
+    """Incrementally sync the ``songs`` table with the files under ``dirs``.
+
+    Only files whose (mtime, size, inode) fingerprint changed are re-parsed,
+    and rows for files that disappeared are removed in one batch.
+
+    Returns:
+        tuple: (songs: dict, stats: dict)
+    """
+    global _migrated_artwork
+    with _scan_lock:
+        started = time.monotonic()
+        stats = {"seen": 0, "parsed": 0, "skipped": 0, "removed": 0, "errors": 0}
+
+        conn = init_db()
+        try:
+            cursor = conn.cursor()
+            known = {
+                path: (song_id, (mtime, size, inode))
+                for song_id, path, mtime, size, inode in cursor.execute(
+                    "SELECT id, path, mtime, size, inode FROM songs"
+                )
+            }
+
+            scanned_roots = []
+            seen_paths = set()
+            to_parse = []   # (path, existing id or None, fingerprint)
+            _scan_state.set("progress", {"state": "walking"}, ttl=PROGRESS_TTL)
+            for d in dirs:
+                if not os.path.isdir(d):
+                    logger.warning(f"Local path is not a directory: {d}")
+                    continue
+                scanned_roots.append(d)
+
+                for full_path, st in iter_audio_files(d):
+                    stats["seen"] += 1
+                    seen_paths.add(full_path)
+                    fp = fingerprint(st)
+                    song_id, old_fp = known.get(full_path, (None, None))
+                    if old_fp == fp:
+                        stats["skipped"] += 1
+                        continue
+                    to_parse.append((full_path, song_id, fp))
+
+            # Single writer: parsed rows are written in large executemany batches.
+            new_ids = iter(allocate_local_ids(
+                cursor, sum(1 for _, song_id, _ in to_parse if song_id is None)
+            ))
+            # Commit the reservation on its own: a batch rollback must not
+            # hand these numbers out again, and parsing must not hold the
+            # write lock.
+            conn.commit()
+            batch = []
+            progress = None
+            parse_started = time.monotonic()
+            paths = [path for path, _, _ in to_parse]
+            for (full_path, song_id, fp), meta in zip(to_parse, _parse_all(paths)):
+                stats["parsed"] += 1
+                if song_id is None:
+                    song_id = next(new_ids)
+                batch.append(_song_row(song_id, full_path, meta, fp))
+                if stats["parsed"] % 100 == 0:
+                    progress = _update_progress(len(to_parse), stats["parsed"], parse_started)
+                if len(batch) >= COMMIT_EVERY:
+                    stats["errors"] += _write_batch(conn, batch)
+                    batch = []
+                    if progress:
+                        logger.info(
+                            f"Local scan progress: {progress['done']}/{progress['total']} "
+                            f"({progress['files_per_second']} files/s, ETA {progress['eta_seconds']}s)"
+                        )
+            if batch:
+                stats["errors"] += _write_batch(conn, batch)
+
+            # Rows under a root we could read are gone if we did not see them;
+            # rows elsewhere (e.g. a root that is offline) only if the file is missing.
+            vanished = [
+                (song_id,) for path, (song_id, _) in known.items()
+                if path not in seen_paths
+                and (_is_under(path, scanned_roots) or not os.path.exists(path))
+            ]
+            if vanished:
+                cursor.executemany("DELETE FROM songs WHERE id = ?", vanished)
+                stats["removed"] = len(vanished)
+            conn.commit()
+
+            songs = load_songs(conn)
+        finally:
+            conn.close()
+            _scan_state.delete("progress")
+
+        stats["changed"] = bool(stats["parsed"] or stats["removed"] or _migrated_artwork)
+        _migrated_artwork = False
+        stats["total"] = len(songs)
+        stats["seconds"] = round(time.monotonic() - started, 3)
+        _scan_state.set("last_stats", stats)
+        logger.info(
+            f"Local scan: {stats['seen']} seen, {stats['parsed']} parsed, "
+            f"{stats['skipped']} skipped, {stats['removed']} removed in {stats['seconds']}s"
+        )
+        return songs, stats
+
+
+def apply_changes(changed_paths, removed_paths):
+    """Apply filesystem events to the ``songs`` table.
+
+    ``changed_paths`` are files that were created or rewritten; ``removed_paths``
+    may be files or whole directories. Returns ``(updated, removed)`` where
+    ``updated`` maps local IDs to song dicts and ``removed`` lists local IDs.
+    """
+    with _scan_lock:
+        updated = {}
+        removed = []
+        removed_paths = set(removed_paths)
+
+        conn = init_db()
+        try:
+            cursor = conn.cursor()
+            for full_path in changed_paths:
+                if os.path.splitext(full_path)[1].lower() not in AUDIO_EXTENSIONS:
+                    continue
+                try:
+                    st = os.stat(full_path)
+                except FileNotFoundError:
+                    removed_paths.add(full_path)
+                    continue
+                row = cursor.execute(
+                    "SELECT id, mtime, size, inode FROM songs WHERE path = ?", (full_path,)
+                ).fetchone()
+                fp = fingerprint(st)
+                if row and tuple(row[1:]) == fp:
+                    continue
+                song_id = row[0] if row else new_local_id(cursor)
+                updated[song_id] = _upsert(cursor, song_id, full_path, read_tags(full_path), fp)
+
+            for path in removed_paths:
+                prefix = _escape_like(path.rstrip(os.sep) + os.sep)
+                rows = cursor.execute(
+                    "SELECT id FROM songs WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                    (path, prefix + "%")
+                ).fetchall()
+                if rows:
+                    cursor.executemany("DELETE FROM songs WHERE id = ?", rows)
+                    removed.extend(song_id for (song_id,) in rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+        if updated or removed:
+            logger.info(f"Local library events: {len(updated)} updated, {len(removed)} removed")
+        return updated, removed
@@ -0,0 +1,53 @@
+import re
+import sqlite3
+import logging
+from ..database import pool
+from . import scanner
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# bm25 column weights for (title, artist, album): a title hit ranks highest.
+RANK_WEIGHTS = (10.0, 5.0, 2.0)
+DEFAULT_LIMIT = 200
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(query):
+    """Turn free text into an FTS5 query: every word must match as a prefix.
+
+    Words are quoted so characters such as ``-`` or ``:`` in user input are
+    never interpreted as FTS5 syntax.
+    """
+    terms = _TOKEN.findall(query or "")
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search(query, limit=DEFAULT_LIMIT):
+    """Ranked local-library search over title, artist and album.
+
+    Returns a list of song dicts (best match first), or None if the
+    full-text index is not available in this database.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    columns = ", ".join(f"s.{c}" for c in scanner.SONG_COLUMNS)
+    conn = pool.get_connection(scanner.LOCAL_DB_PATH)
+    try:
+        rows = conn.execute(f"""
+            SELECT {columns}
+            FROM songs_fts
+            JOIN songs s ON s.rowid = songs_fts.rowid
+            WHERE songs_fts MATCH ?
+            ORDER BY bm25(songs_fts, ?, ?, ?)
+            LIMIT ?
+        """, (match, *RANK_WEIGHTS, limit)).fetchall()
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Local full-text search unavailable: {e}")
+        return None
+    finally:
+        conn.close()
+    return [dict(zip(scanner.SONG_COLUMNS, row)) for row in rows]
@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from threading import Thread
+from . import scanner
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Quiet period before a burst of events (e.g. a bulk copy) is applied, and
+# the longest a burst may be held back while events keep arriving.
+DEBOUNCE_SECONDS = float(os.getenv("LOCAL_SONGS_DEBOUNCE", "0.5"))
+MAX_DELAY_SECONDS = 2.0
+
+# inotify constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def resolve_mode(mode):
+    """Map the LOCAL_SONGS_WATCH setting to "inotify" or "poll"."""
+    mode = (mode or "poll").strip().lower()
+    if mode in ("auto", "inotify"):
+        if sys.platform.startswith("linux") and _load_libc() is not None:
+            return "inotify"
+        if mode == "inotify":
+            logger.warning("inotify is not available on this platform, falling back to polling")
+    return "poll"
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class InotifyWatcher:
+    """Recursive inotify watch over the local music directories.
+
+    Events are collected, debounced and handed to ``scanner.apply_changes``;
+    the resulting ``(updated, removed)`` is passed to ``on_change``. The
+    thread sleeps in ``select()`` while the library is idle.
+    """
+
+    def __init__(self, dirs, on_change, on_overflow=None):
+        self.dirs = list(dirs)
+        self.on_change = on_change
+        self.on_overflow = on_overflow
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches = {}      # watch descriptor -> directory
+        self._changed = set()
+        self._removed = set()
+        self._first_event = None
+        self._last_event = None
+        for d in self.dirs:
+            if os.path.isdir(d):
+                self._add_tree(d)
+            else:
+                logger.warning(f"Local path is not a directory: {d}")
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached (fs.inotify.max_user_watches)")
+            logger.warning(f"Cannot watch {path}: {os.strerror(err)}")
+            return
+        self._watches[wd] = path
+
+    def _drop_tree(self, path):
+        """Stop watching ``path`` and its subdirectories (moved away or deleted).
+
+        If the folder was only moved within the library, its new location is
+        watched again when the IN_MOVED_TO event arrives.
+        """
+        prefix = path.rstrip(os.sep) + os.sep
+        for wd, watched in list(self._watches.items()):
+            if watched == path or watched.startswith(prefix):
+                del self._watches[wd]
+                self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _add_tree(self, root, queue_files=False):
+        """Watch ``root`` and its subdirectories; optionally queue existing files."""
+        visited = set()
+        for current, subdirs, files in os.walk(root, followlinks=True):
+            # Like the scanner: each directory once (symlink loops), no hidden folders.
+            try:
+                st = os.stat(current)
+            except OSError:
+                subdirs[:] = []
+                continue
+            if (st.st_dev, st.st_ino) in visited:
+                subdirs[:] = []
+                continue
+            visited.add((st.st_dev, st.st_ino))
+            subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+            self._add_watch(current)
+            if queue_files:
+                self._changed.update(os.path.join(current, f) for f in files)
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            raw_name = data[offset + EVENT_HEADER.size: offset + EVENT_HEADER.size + length]
+            offset += EVENT_HEADER.size + length
+            self._handle(wd, mask, os.fsdecode(raw_name.rstrip(b"\0")))
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            logger.warning("inotify queue overflowed, running a full incremental scan")
+            self._changed.clear()
+            self._removed.clear()
+            if self.on_overflow:
+                self.on_overflow()
+            return
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+
+        directory = self._watches.get(wd)
+        if directory is None:
+            return
+        path = os.path.join(directory, name) if name else directory
+
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # A subfolder's own event follows its parent's IN_DELETE or
+            # IN_MOVED_FROM, which already handled it; by now the watch may
+            # even point at the folder's new location. Only a root going
+            # away is news.
+            if path not in self.dirs:
+                return
+            self._changed.discard(path)
+            self._removed.add(path)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            if mask & IN_ISDIR:
+                self._drop_tree(path)
+            self._changed.discard(path)
+            self._removed.add(path)
+        elif mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith("."):
+                # A whole folder was dropped or moved in.
+                self._removed.discard(path)
+                try:
+                    self._add_tree(path, queue_files=True)
+                except OSError as e:
+                    logger.error(f"Cannot watch new directory {path}: {e}")
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_ATTRIB):
+            self._removed.discard(path)
+            self._changed.add(path)
+        else:
+            return
+
+        now = time.monotonic()
+        self._first_event = self._first_event or now
+        self._last_event = now
+
+    def _flush(self):
+        changed, removed = self._changed, self._removed
+        self._changed, self._removed = set(), set()
+        self._first_event = self._last_event = None
+        try:
+            updated, removed_ids = scanner.apply_changes(changed, removed)
+            if updated or removed_ids:
+                self.on_change(updated, removed_ids)
+        except Exception as e:
+            logger.error(f"Error applying local library events: {e}")
+
+    def run(self):
+        logger.info(f"Watching {len(self._watches)} local music directories with inotify")
+        while True:
+            timeout = None
+            if self._last_event is not None:
+                now = time.monotonic()
+                timeout = max(0.0, min(
+                    self._last_event + DEBOUNCE_SECONDS - now,
+                    self._first_event + MAX_DELAY_SECONDS - now,
+                ))
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            if readable:
+                self._read_events()
+            if self._last_event is not None:
+                now = time.monotonic()
+                if (now - self._last_event >= DEBOUNCE_SECONDS
+                        or now - self._first_event >= MAX_DELAY_SECONDS):
+                    self._flush()
+
+
+def start_watcher(dirs, on_change, on_overflow=None):
+    """Start an inotify watcher thread. Returns None if it could not be set up."""
+    try:
+        watcher = InotifyWatcher(dirs, on_change, on_overflow)
+    except OSError as e:
+        logger.error(f"Could not start inotify watcher: {e}")
+        return None
+    watcher_thread = Thread(target=watcher.run, daemon=True)
+    watcher_thread.start()
+    return watcher_thread
@@ -1,9 +1,6 @@
 from flask import session, redirect
 from functools import wraps
-import sqlite3
-import os
-
-DB_PATH = os.path.join(os.getcwd(), "database_files", "sangeet_database_main.db")
+from . import session_cache
 
 def login_required(f):
     @wraps(f)
@@ -11,18 +8,8 @@ def login_required(f):
         if 'user_id' not in session or 'session_token' not in session:
             return redirect('/login')
             
-        # Verify session is still valid in database
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT 1 FROM active_sessions 
-            WHERE user_id = ? AND session_token = ? 
-            AND expires_at > CURRENT_TIMESTAMP
-        """, (session['user_id'], session['session_token']))
-        
-        valid_session = c.fetchone()
-        conn.close()
+        # Verify session is still valid (cached in front of active_sessions)
+        valid_session = session_cache.is_session_valid(session['user_id'], session['session_token'])
         
         if not valid_session:
             # Clear invalid session
@@ -30,4 +17,4 @@ def login_required(f):
             return redirect("/login")
             
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
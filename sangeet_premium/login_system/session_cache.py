@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+from flask import g, has_request_context
+from ..database import pool
+from ..cache.memory import TTLCache
+from ..cache.store import SharedStore
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# How long a validated (user_id, session_token) pair is trusted without
+# going back to active_sessions. Invalid pairs are remembered for less time.
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "60"))
+NEGATIVE_TTL = min(SESSION_CACHE_TTL, 10)
+
+# Touched on every invalidation so other workers drop their in-process copies.
+GENERATION_PATH = os.path.join(os.getcwd(), "database_files", "session_cache.gen")
+
+_cache = TTLCache(maxsize=4096, ttl=SESSION_CACHE_TTL)
+_store = SharedStore("sessions", ttl=SESSION_CACHE_TTL)
+# When a session (key "<user_id>:<token>") or every session of a user (key
+# "<user_id>") was invalidated. A validation that started earlier must not
+# cache its now stale answer.
+_tombstones = SharedStore("session_tombstones", ttl=SESSION_CACHE_TTL)
+_seen_generation = None
+
+
+def _generation():
+    try:
+        return os.stat(GENERATION_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _sync_generation():
+    """Clear the in-process cache if another worker invalidated sessions."""
+    global _seen_generation
+    current = _generation()
+    if current != _seen_generation:
+        _cache.clear()
+        _seen_generation = current
+
+
+def _bump_generation():
+    global _seen_generation
+    try:
+        os.makedirs(os.path.dirname(GENERATION_PATH), exist_ok=True)
+        with open(GENERATION_PATH, "a"):
+            pass
+        os.utime(GENERATION_PATH, None)
+    except OSError as e:
+        logger.warning(f"Could not bump session cache generation: {e}")
+    _cache.clear()
+    _seen_generation = _generation()
+
+
+def _store_key(user_id, session_token):
+    return f"{user_id}:{session_token}"
+
+
+def _invalidated_since(user_id, session_token, started):
+    for key in (_store_key(user_id, session_token), str(user_id)):
+        when = _tombstones.get(key)
+        if when is not None and when >= started:
+            return True
+    return False
+
+
+def _remember_valid(key, ttl, started):
+    """Cache a positive answer unless the session was invalidated meanwhile.
+
+    The tombstone is checked again after the write: an invalidation writes
+    its tombstone before deleting the entry, so either that delete removes
+    our write or we see the tombstone and remove it ourselves.
+    """
+    user_id, session_token = key
+    if _invalidated_since(user_id, session_token, started):
+        return
+    _cache.set(key, True, ttl)
+    _store.set(_store_key(user_id, session_token), True, ttl)
+    if _invalidated_since(user_id, session_token, started):
+        _cache.delete(key)
+        _store.delete(_store_key(user_id, session_token))
+
+
+def _query_session(user_id, session_token):
+    """Return seconds until expiry for a live session, or None."""
+    conn = pool.get_connection()
+    try:
+        row = conn.execute("""
+            SELECT (julianday(expires_at) - julianday(CURRENT_TIMESTAMP)) * 86400
+            FROM active_sessions
+            WHERE user_id = ? AND session_token = ?
+            AND expires_at > CURRENT_TIMESTAMP
+        """, (user_id, session_token)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def is_session_valid(user_id, session_token):
+    """Check a session against active_sessions through the TTL cache.
+
+    The answer is also memoised on ``flask.g`` so the blueprint
+    ``before_request`` hook and ``login_required`` share one lookup.
+    """
+    key = (user_id, session_token)
+    if has_request_context():
+        memo = getattr(g, "_session_validation", None)
+        if memo and memo[0] == key:
+            return memo[1]
+
+    _sync_generation()
+    valid = _cache.get(key)
+    if valid is None:
+        valid = _store.get(_store_key(user_id, session_token))
+        if valid is not None:
+            _cache.set(key, valid)
+    if valid is None:
+        started = time.time()
+        remaining = _query_session(user_id, session_token)
+        valid = remaining is not None
+        if valid:
+            _remember_valid(key, min(SESSION_CACHE_TTL, int(remaining)), started)
+        else:
+            _cache.set(key, False, NEGATIVE_TTL)
+            _store.set(_store_key(user_id, session_token), False, NEGATIVE_TTL)
+
+    if has_request_context():
+        g._session_validation = (key, valid)
+    return valid
+
+
+def invalidate_session(user_id, session_token):
+    """Forget a single session, e.g. on logout."""
+    _tombstones.set(_store_key(user_id, session_token), time.time())
+    _store.delete(_store_key(user_id, session_token))
+    _bump_generation()
+
+
+def invalidate_user(user_id):
+    """Forget every cached session of a user, e.g. when they log in again."""
+    _tombstones.set(str(user_id), time.time())
+    _store.delete_prefix(f"{user_id}:")
+    _bump_generation()
+
+
+def forget_expired(sessions):
+    """Drop the shared entries of purged ``(user_id, session_token)`` pairs.
+
+    Entries are cached no longer than their session has left, so the
+    in-process copies run out on their own and other workers keep theirs.
+    """
+    for user_id, session_token in sessions:
+        _store.delete(_store_key(user_id, session_token))
+
+
+def cache_stats():
+    stats = _cache.stats()
+    stats["ttl"] = SESSION_CACHE_TTL
+    return stats
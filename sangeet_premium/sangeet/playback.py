@@ -1,14 +1,17 @@
-from flask import Blueprint , session , jsonify , send_file  , url_for , render_template , request , redirect , render_template_string , make_response
-from ytmusicapi import YTMusic
-import sqlite3
+from flask import Blueprint , session , jsonify , send_file  , url_for , render_template , request , redirect , render_template_string , make_response , Response , stream_with_context
 import logging
 from ..utils import util
+from ..database import pool
+from ..login_system.login_warps import login_required
+from ..login_system import session_cache
+from ..library import artwork
+from ..downloads import jobs, progressive
+from ..cache import metadata, singleflight, swr, cursors, lyrics, artists
+from ..utils import upstream, suggest, playlist_import, ytdlp_engine
 import random
 import time
-import concurrent.futures
 import json
 from urllib.parse import urlparse, parse_qs
-from functools import wraps
 from urllib.parse import urlparse
 import secrets
 from sangeet_premium import var_templates
@@ -16,7 +19,6 @@ from datetime import datetime , timedelta
 import re
 import os
 import bcrypt
-local_songs = {}
 bp = Blueprint('playback', __name__)  # Create a blueprint
 from threading import Thread
 import time
@@ -24,93 +26,35 @@ from flask import current_app
 
 
 
-ytmusic =YTMusic()
+ytmusic = upstream.get_ytmusic()
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 DB_PATH = os.path.join(os.getcwd() , "database_files" , "sangeet_database_main.db")
 
+# Same read-only catalog view as util; it re-maps itself when a newer
+# generation is published, so every worker sees scanner updates lazily.
+local_songs = util.local_songs
 
 
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session or 'session_token' not in session:
-            return redirect('/login')
-            
-        # Verify session is still valid in database
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT 1 FROM active_sessions 
-            WHERE user_id = ? AND session_token = ? 
-            AND expires_at > CURRENT_TIMESTAMP
-        """, (session['user_id'], session['session_token']))
-        
-        valid_session = c.fetchone()
-        conn.close()
-        
-        if not valid_session:
-            # Clear invalid session
-            session.clear()
-            return redirect("/login")
-            
-        return f(*args, **kwargs)
-    return decorated_function
-def load_local_songs_from_file():
-    """Load songs from a JSON file and append them to the local_songs dictionary."""
-    global local_songs  # Make sure we're modifying the global dictionary
-    
-    # Generate the file path
-    json_file_path = os.path.join(os.getcwd(), "locals", "local.json")
-    
-    # Check if the file exists
-    if not os.path.isfile(json_file_path):
-        print(f"JSON file not found at: {json_file_path}")
-        return
-    
-    try:
-        # Read the JSON file
-        with open(json_file_path, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        
-        # Clear existing local songs to prevent duplicates
-        local_songs.clear()
-        
-        # Validate and append the data
-        if isinstance(data, dict):
-            for key, song in data.items():
-                if isinstance(song, dict) and {"id", "title", "artist", "album", "path", "thumbnail", "duration"}.issubset(song.keys()):
-                    # Verify file exists before adding
-                    if os.path.exists(song["path"]):
-                        local_songs[key] = song
-                    else:
-                        print(f"Skipped missing file for key: {key}")
-                else:
-                    print(f"Skipped invalid song format for key: {key}")
-                    
-            print(f"Loaded {len(data)} songs from {json_file_path}.")
-            
-            # Update search cache to include local songs
-            if "" in search_cache:
-                # Get the timestamp from cache
-                _, timestamp = search_cache[""]
-                # Update cache with new local songs included
-                search_cache[""] = (list(local_songs.values()), timestamp)
-        else:
-            print("Invalid JSON structure. Expected a dictionary.")
-    except Exception as e:
-        print(f"Error reading JSON file: {e}")
 
+def load_local_songs_from_file():
+    """Map the latest local library catalog if a new generation was published."""
+    local_songs.refresh(force=True)
     return local_songs
 
 
 CACHE_DURATION = 3600
-search_cache = {}
-song_cache = {}
-lyrics_cache = {}
+suggester = suggest.Suggester(local_songs)
+search_results_cache = swr.SWRCache(
+    "search", util.SEARCH_CACHE_TTL, util.SEARCH_CACHE_STALE, util.SEARCH_CACHE_SIZE
+)
 
 SERVER_DOMAIN = os.getenv('sangeet_backend', f'http://127.0.0.1:{os.getenv("port")}')
+@bp.teardown_app_request
+def release_db_connections(exc):
+    """Roll back and release any pooled connection a request left open."""
+    pool.release_thread()
+
 @bp.route('/')
 @login_required
 def home():
@@ -125,7 +69,7 @@ def api_play_sequence(song_id, action):
     """Enhanced previous/next handling with proper sequence tracking."""
     try:
         # Get current song's session and sequence info
-        with sqlite3.connect(DB_PATH) as conn:
+        with pool.get_connection() as conn:
             c = conn.cursor()
             c.execute("""
                 SELECT session_id, sequence_number 
@@ -195,7 +139,7 @@ def api_play_sequence(song_id, action):
                         if song_id.startswith("local-"):
                             song_info = local_songs.get(song_id)
                         else:
-                            song_info = ytmusic.get_song(song_id)
+                            song_info = metadata.get_song(song_id)
 
                         if not song_info:
                             return jsonify({"error": "Failed to get song info"}), 404
@@ -239,6 +183,13 @@ def api_play_sequence(song_id, action):
 
 
 
+def download_job_response(job):
+    """202 with the handle of a download job that has not finished yet."""
+    response = jsonify({"status": "pending", "job": jobs.to_json(job)})
+    response.status_code = 202
+    response.headers["Retry-After"] = "2"
+    return response
+
 @bp.route("/api/download/<song_id>")
 @login_required
 def api_download2(song_id):
@@ -254,7 +205,7 @@ def api_download2(song_id):
                 existing_path = util.get_download_info(potential_vid)
                 if existing_path and os.path.exists(existing_path):
                     # Get title from database
-                    conn = sqlite3.connect(DB_PATH)
+                    conn = pool.get_connection()
                     c = conn.cursor()
                     c.execute("SELECT title FROM downloads WHERE video_id = ?", (potential_vid,))
                     row = c.fetchone()
@@ -274,14 +225,15 @@ def api_download2(song_id):
                     )
                 
                 # Try getting YouTube metadata
-                info = ytmusic.get_song(potential_vid)
+                info = metadata.get_song(potential_vid)
                 title = info.get("videoDetails", {}).get("title", "Unknown")
                 safe_title = util.sanitize_filename(title)
                 
-                # Download the file
-                flac_path = util.download_flac(potential_vid , session.get('user_id') )
-                if not flac_path:
-                    raise Exception("Download failed")
+                # Queue the download; the client polls the job and retries
+                job = jobs.submit(potential_vid, session.get('user_id'))
+                if job["status"] != jobs.DONE:
+                    return download_job_response(job)
+                flac_path = job["path"]
                     
                 # Send file with proper name
                 download_name = f"{safe_title}.flac" if safe_title else f"{potential_vid}.flac"
@@ -323,13 +275,14 @@ def api_download2(song_id):
             
         # If not local- prefix, treat as direct YouTube ID
         try:
-            info = ytmusic.get_song(song_id)
+            info = metadata.get_song(song_id)
             title = info.get("videoDetails", {}).get("title", "Unknown")
             safe_title = util.sanitize_filename(title)
             
-            flac_path = util.download_flac(song_id , session.get('user_id'))
-            if not flac_path:
-                return jsonify({"error": "Download failed"}), 500
+            job = jobs.submit(song_id, session.get('user_id'))
+            if job["status"] != jobs.DONE:
+                return download_job_response(job)
+            flac_path = job["path"]
                 
             download_name = f"{safe_title}.flac" if safe_title else f"{song_id}.flac"
             return send_file(
@@ -357,162 +310,173 @@ def api_download2(song_id):
 
 
 
+def artist_fallback(name, description):
+    """Minimal artist payload so the UI still renders when lookup fails."""
+    return {
+        'name': name,
+        'thumbnail': '',
+        'description': description,
+        'genres': [],
+        'year': None,
+        'stats': {
+            'subscribers': '0',
+            'views': '0',
+            'monthlyListeners': '0'
+        },
+        'topSongs': [],
+        'links': {}
+    }
+
 @bp.route('/api/artist-info/<artist_name>')
 @login_required
 def get_artist_info(artist_name):
+    # Split multiple artists and try to get info for the primary artist
+    primary_artist = artist_name.split(',')[0].strip()
     try:
-        # Split multiple artists and try to get info for the primary artist
-        primary_artist = artist_name.split(',')[0].strip()
-        
-        # Search for artist
-        results = ytmusic.search(primary_artist, filter='artists')
-        if not results:
-            # Try a more lenient search
-            results = ytmusic.search(primary_artist)
-            # Filter for artist results
-            results = [r for r in results if r.get('category') == 'Artists']
-            
-            if not results:
-                logger.warning(f"No artist found for: {primary_artist}")
-                # Return minimal info to prevent UI errors
-                return jsonify({
-                    'name': primary_artist,
-                    'thumbnail': '',
-                    'description': 'Artist information not available',
-                    'genres': [],
-                    'year': None,
-                    'stats': {
-                        'subscribers': '0',
-                        'views': '0',
-                        'monthlyListeners': '0'
-                    },
-                    'topSongs': [],
-                    'links': {}
-                })
-            
-        artist = results[0]
-        artist_id = artist.get('browseId')
-        
-        if not artist_id:
-            logger.warning(f"No artist ID found for: {primary_artist}")
-            return jsonify({
-                'name': primary_artist,
-                'thumbnail': '',
-                'description': 'Artist information not available',
-                'genres': [],
-                'year': None,
-                'stats': {
-                    'subscribers': '0',
-                    'views': '0',
-                    'monthlyListeners': '0'
-                },
-                'topSongs': [],
-                'links': {}
-            })
-
-        # Get detailed artist info
-        artist_data = ytmusic.get_artist(artist_id)
-        if not artist_data:
-            raise Exception("Failed to fetch artist details")
-
-        # Rest of the processing remains same
-        description = util.process_description(artist_data.get('description', ''))
-        thumbnail_url = util.get_best_thumbnail(artist_data.get('thumbnails', []))
-        genres = util.process_genres(artist_data)
-        stats = util.get_artist_stats(artist_data)
-        top_songs = util.process_top_songs(artist_data)
-        links = util.process_artist_links(artist_data, artist_id)
-
-        response = {
-            'name': artist_data.get('name', primary_artist),
-            'thumbnail': thumbnail_url,
-            'description': description,
-            'genres': genres,
-            'year': util.extract_year(artist_data),
-            'stats': stats,
-            'topSongs': top_songs,
-            'links': links
-        }
-
-        return jsonify(response)
-
+        info = artists.get_artist_info(primary_artist)
+        if info is None:
+            return jsonify(artist_fallback(primary_artist, 'Artist information not available'))
+        return jsonify(info)
     except Exception as e:
         logger.error(f"Error in get_artist_info: {str(e)}")
-        # Return minimal info to prevent UI errors
-        return jsonify({
-            'name': artist_name.split(',')[0].strip(),
-            'thumbnail': '',
-            'description': 'Failed to load artist information',
-            'genres': [],
-            'year': None,
-            'stats': {
-                'subscribers': '0',
-                'views': '0',
-                'monthlyListeners': '0'
-            },
-            'topSongs': [],
-            'links': {}
-        })
+        return jsonify(artist_fallback(primary_artist, 'Failed to load artist information'))
     
-from concurrent.futures import ThreadPoolExecutor
-import yt_dlp
 from functools import partial
 import asyncio
 
-# First add this helper function to extract playlist info
-def extract_playlist_info(url, max_workers=4):
-    """Extract playlist information using yt-dlp"""
+def search_ytdlp(q, limit):
+    """Search YouTube through yt-dlp's ytsearch syntax."""
     try:
         ydl_opts = {
             'quiet': True,
             'extract_flat': True,
             'force_generic_extractor': False
         }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            if info and 'entries' in info:
-                # Process entries in parallel
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    # Create a partial function with ydl options
-                    extract_func = partial(extract_video_info, ydl_opts=ydl_opts)
-                    # Map the extraction function over all video URLs
-                    video_urls = [entry['url'] if 'url' in entry else f"https://youtube.com/watch?v={entry['id']}" 
-                                for entry in info['entries'] if entry]
-                    results = list(executor.map(extract_func, video_urls))
-                    return [r for r in results if r]  # Filter out None results
-            return []
+        info = upstream.extract_info(f"ytsearch{limit}:{q}", ydl_opts)
+        results = []
+        if info and 'entries' in info:
+            for entry in info['entries']:
+                if not entry:
+                    continue
+                video_id = entry.get('id')
+                if not video_id:
+                    continue
+                results.append({
+                    "id": video_id,
+                    "title": entry.get('title', 'Unknown'),
+                    "artist": entry.get('artist', entry.get('uploader', 'Unknown Artist')),
+                    "album": entry.get('album', ''),
+                    "duration": int(entry.get('duration', 0)),
+                    "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+                })
+        return results
     except Exception as e:
-        logger.error(f"Error extracting playlist info: {e}")
+        logger.error(f"Error in YouTube search via yt-dlp: {e}")
         return []
 
-def extract_video_info(url, ydl_opts):
-    """Extract single video information"""
+def fetch_upstream_results(q, limit):
+    """Query YTMusic and yt-dlp concurrently and merge, YTMusic results first.
+
+    Each source has its own deadline; if one is slow or fails, the other's
+    results are returned on their own and not cached.
+    """
+    results, complete = upstream.run_sources(upstream_sources(q, limit))
+    merged = merge_upstream_results(results)
+    return merged if complete else swr.Uncached(merged)
+
+def upstream_sources(q, limit):
+    """The federated search sources for a query, in merge order."""
+    return {
+        "ytmusic": partial(util.search_songs, q),
+        "ytdlp": partial(search_ytdlp, q, limit),
+    }
+
+def merge_upstream_results(results):
+    """Merge per-source results, YTMusic first, dropping duplicate IDs."""
+    merged = []
+    seen_ids = set()
+    for song in results.get("ytmusic", []) + results.get("ytdlp", []):
+        if song["id"] not in seen_ids:
+            merged.append(song)
+            seen_ids.add(song["id"])
+    return merged
+
+def search_upstream(q, limit):
+    """Merged upstream results for a query, cached by normalized query and limit.
+
+    The page is not part of the key: this merged list is the first batch
+    of every search session for the query, deeper pages extend the session.
+    """
+    key = f"{limit}:{util.normalize_query(q)}"
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            if info:
-                return {
-                    "id": info.get('id', ''),
-                    "title": info.get('title', 'Unknown'),
-                    "artist": info.get('artist', info.get('uploader', 'Unknown Artist')),
-                    "album": info.get('album', ''),
-                    "duration": int(info.get('duration', 0)),
-                    "thumbnail": get_best_thumbnail(info.get('thumbnails', [])),
-                }
+        return search_results_cache.get(key, lambda: fetch_upstream_results(q, limit))
     except Exception as e:
-        logger.error(f"Error extracting video info: {e}")
-    return None
-
-def get_best_thumbnail(thumbnails):
-    """Get the best quality thumbnail URL"""
-    if not thumbnails:
-        return ""
-    # Sort by resolution if available
-    sorted_thumbs = sorted(thumbnails, 
-                         key=lambda x: x.get('height', 0) * x.get('width', 0),
-                         reverse=True)
-    return sorted_thumbs[0].get('url', '')
+        logger.error(f"Upstream search error: {e}")
+        return []
+
+def new_search_session(q, limit, results):
+    """Start a paginated search over ``results``; returns ``(cursor, session)``."""
+    session_state = {
+        "q": q,
+        "limit": limit,
+        "results": results,
+        "depth": limit,
+        "exhausted": False,
+    }
+    return cursors.create(session_state), session_state
+
+def extend_search_session(session_state):
+    """Fetch the next, deeper batch from upstream and append unseen results.
+
+    YTMusic follows its search continuations for a larger limit and yt-dlp
+    asks for more ``ytsearch`` entries. The session is marked exhausted
+    once a batch brings nothing new or SEARCH_MAX_DEPTH is reached.
+    """
+    q, limit = session_state["q"], session_state["limit"]
+    depth = min(session_state["depth"] + max(limit, 20), util.SEARCH_MAX_DEPTH)
+    if depth <= session_state["depth"]:
+        session_state["exhausted"] = True
+        return
+
+    results, _ = upstream.run_sources({
+        "ytmusic": partial(util.search_songs, q, depth),
+        "ytdlp": partial(search_ytdlp, q, depth),
+    })
+    seen_ids = {song["id"] for song in session_state["results"]}
+    added = [song for song in merge_upstream_results(results) if song["id"] not in seen_ids]
+    session_state["results"].extend(added)
+    session_state["depth"] = depth
+    if not added:
+        session_state["exhausted"] = True
+
+def search_page(q, page, limit, cursor=None):
+    """One page of a text search and the cursor of its search session.
+
+    The first request merges local matches with the cached upstream results
+    and opens a session. Requests that pass the cursor back are served from
+    the session's result list, which is only extended from upstream when a
+    page reaches past its end.
+    """
+    session_state = cursors.load(cursor) if cursor else None
+    if session_state is None or session_state["q"] != q or session_state["limit"] != limit:
+        seen_ids = set()
+        results = []
+        for song in util.filter_local_songs(q) + search_upstream(q, limit):
+            if song["id"] not in seen_ids:
+                results.append(song)
+                seen_ids.add(song["id"])
+        cursor, session_state = new_search_session(q, limit, results)
+
+    start = page * limit
+    end = start + limit
+    changed = False
+    while len(session_state["results"]) < end and not session_state["exhausted"]:
+        extend_search_session(session_state)
+        changed = True
+    if changed:
+        cursors.save(cursor, session_state)
+    return session_state["results"][start:end], cursor
+
 @bp.route("/api/search")
 @login_required
 def api_search():
@@ -535,40 +499,16 @@ def api_search():
     if "youtube.com" in q or "youtu.be" in q:
         try:
             # --- Handle as a playlist if the URL contains "playlist" or "list=" ---
-            if "playlist" in q or "list=" in q:
-                ydl_opts = {
-                    'quiet': True,
-                    'extract_flat': True,
-                    'force_generic_extractor': False
-                }
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(q, download=False)
-                    if info and 'entries' in info:
-                        results = []
-                        seen_ids = set()
-                        for entry in info['entries']:
-                            if not entry:
-                                continue
-                            video_id = entry.get('id')
-                            if not video_id or video_id in seen_ids:
-                                continue
-
-                            result = {
-                                "id": video_id,
-                                "title": entry.get('title', 'Unknown'),
-                                "artist": entry.get('artist', entry.get('uploader', 'Unknown Artist')),
-                                "album": entry.get('album', ''),
-                                "duration": int(entry.get('duration', 0)),
-                                "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
-                            }
-                            results.append(result)
-                            seen_ids.add(video_id)
-                            if len(results) >= limit:
-                                break
-
-                        start = page * limit
-                        end = start + limit
-                        return jsonify(results[start:end])
+            if playlist_import.is_playlist_url(q):
+                playlist_page = playlist_import.get_page(q, page, limit)
+                if playlist_page is not None:
+                    results, pending = playlist_page
+                    response = jsonify(results)
+                    if pending:
+                        # The rest of the playlist is still being listed
+                        response.headers["X-Playlist-Pending"] = "true"
+                        response.headers["Retry-After"] = "1"
+                    return response
 
             # --- Handle as a single video/song ---
             parsed = urlparse(q)
@@ -585,18 +525,17 @@ def api_search():
                     'extract_flat': False,
                     'force_generic_extractor': False
                 }
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(f"https://youtube.com/watch?v={video_id}", download=False)
-                    if info:
-                        result = [{
-                            "id": video_id,
-                            "title": info.get('title', 'Unknown'),
-                            "artist": info.get('artist', info.get('uploader', 'Unknown Artist')),
-                            "album": info.get('album', ''),
-                            "duration": int(info.get('duration', 0)),
-                            "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
-                        }]
-                        return jsonify(result)
+                info = upstream.extract_info(f"https://youtube.com/watch?v={video_id}", ydl_opts)
+                if info:
+                    result = [{
+                        "id": video_id,
+                        "title": info.get('title', 'Unknown'),
+                        "artist": info.get('artist', info.get('uploader', 'Unknown Artist')),
+                        "album": info.get('album', ''),
+                        "duration": int(info.get('duration', 0)),
+                        "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+                    }]
+                    return jsonify(result)
         except Exception as e:
             logger.error(f"Error processing link '{q}': {e}")
             # Fall through to regular search if link processing fails
@@ -609,18 +548,17 @@ def api_search():
                 'extract_flat': False,
                 'force_generic_extractor': False
             }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(f"https://youtube.com/watch?v={q}", download=False)
-                if info:
-                    result = [{
-                        "id": q,
-                        "title": info.get('title', 'Unknown'),
-                        "artist": info.get('artist', info.get('uploader', 'Unknown Artist')),
-                        "album": info.get('album', ''),
-                        "duration": int(info.get('duration', 0)),
-                        "thumbnail": f"https://i.ytimg.com/vi/{q}/hqdefault.jpg"
-                    }]
-                    return jsonify(result)
+            info = upstream.extract_info(f"https://youtube.com/watch?v={q}", ydl_opts)
+            if info:
+                result = [{
+                    "id": q,
+                    "title": info.get('title', 'Unknown'),
+                    "artist": info.get('artist', info.get('uploader', 'Unknown Artist')),
+                    "album": info.get('album', ''),
+                    "duration": int(info.get('duration', 0)),
+                    "thumbnail": f"https://i.ytimg.com/vi/{q}/hqdefault.jpg"
+                }]
+                return jsonify(result)
         except Exception as e:
             logger.error(f"Error processing video ID '{q}': {e}")
             return jsonify([])
@@ -653,64 +591,103 @@ def api_search():
         return jsonify(full_list[start:end])
 
     # === 4. Regular text search ===
-    seen_ids = set()
-    combined_res = []
+    # Local matches plus upstream (YTMusic + yt-dlp) results, paginated
+    # through a search session identified by the X-Search-Cursor header.
+    if page == 0:
+        suggest.record_query(session['user_id'], q)
+    results, cursor = search_page(q, page, limit, request.args.get("cursor"))
+    response = jsonify(results)
+    response.headers["X-Search-Cursor"] = cursor
+    return response
+
+def is_direct_query(q):
+    """Empty queries, YouTube links and bare video IDs are not federated searches."""
+    return (not q or "youtube.com" in q or "youtu.be" in q
+            or re.match(r'^[a-zA-Z0-9_-]{11}$', q) is not None)
+
+@bp.route("/api/search/stream")
+@login_required
+def api_search_stream():
+    """Progressive first page of a search as NDJSON.
+
+    Emits one ``{"source": ..., "results": [...]}`` line per batch: local
+    matches straight away, then each upstream source as it finishes, every
+    batch deduplicated against what was already sent. The last line is
+    ``{"done": true, "complete": ..., "total": ..., "cursor": ...}``. A
+    complete merge is stored in the search cache, and the results sent open
+    a search session so /api/search continues from the cursor.
+    """
+    q = request.args.get("q", "").strip()
+    limit = int(request.args.get("limit", 20))
 
-    # Add local songs matching the query.
-    local_res = util.filter_local_songs(q)
-    for song in local_res:
-        if song["id"] not in seen_ids:
-            combined_res.append(song)
-            seen_ids.add(song["id"])
+    if is_direct_query(q):
+        # Links, IDs and the default listing resolve in a single step.
+        batches = [("direct", api_search().get_json() or [])]
+        return stream_search_batches(iter(batches), lambda sent: {"complete": True})
 
-    # --- Define helper function to search using yt-dlp ---
-    def search_ytdlp():
-        try:
-            ydl_opts = {
-                'quiet': True,
-                'extract_flat': True,
-                'force_generic_extractor': False
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(f"ytsearch{limit}:{q}", download=False)
-                results = []
-                if info and 'entries' in info:
-                    for entry in info['entries']:
-                        if not entry:
-                            continue
-                        video_id = entry.get('id')
-                        if not video_id:
-                            continue
-                        results.append({
-                            "id": video_id,
-                            "title": entry.get('title', 'Unknown'),
-                            "artist": entry.get('artist', entry.get('uploader', 'Unknown Artist')),
-                            "album": entry.get('album', ''),
-                            "duration": int(entry.get('duration', 0)),
-                            "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
-                        })
-                return results
-        except Exception as e:
-            logger.error(f"Error in YouTube search via yt-dlp: {e}")
-            return []
-
-    # --- Run both search methods concurrently ---
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Submit YTMusic search first so its results appear first.
-        future_utmusic = executor.submit(util.search_songs, q)
-        future_yt = executor.submit(search_ytdlp)
-        utmusic_results = future_utmusic.result()
-        yt_results = future_yt.result()
-
-    # Merge the results with YTMusic results first, then append yt-dlp results.
-    for song in (utmusic_results + yt_results):
-        if song["id"] not in seen_ids:
-            combined_res.append(song)
-            seen_ids.add(song["id"])
+    suggest.record_query(session['user_id'], q)
+    key = f"{limit}:{util.normalize_query(q)}"
+    state = {"complete": True}
 
-    start = page * limit
-    end = start + limit
-    return jsonify(combined_res[start:end])
+    def batches():
+        yield "local", util.filter_local_songs(q)
+
+        cached = search_results_cache.peek(key, lambda: fetch_upstream_results(q, limit))
+        if cached is not None:
+            yield "cache", cached
+            return
+
+        results = {}
+        for name, ok, result in upstream.iter_sources(upstream_sources(q, limit)):
+            if not ok:
+                state["complete"] = False
+                continue
+            results[name] = result
+            yield name, result
+        if state["complete"]:
+            search_results_cache.set(key, merge_upstream_results(results))
+
+    def finish(sent):
+        cursor, _ = new_search_session(q, limit, sent)
+        return {"complete": state["complete"], "cursor": cursor}
+
+    return stream_search_batches(batches(), finish)
+
+def stream_search_batches(batches, finish):
+    """NDJSON response for ``(source, songs)`` batches, skipping songs already sent.
+
+    ``finish(sent)`` returns extra fields for the closing line.
+    """
+    def generate():
+        sent = []
+        seen_ids = set()
+        for source, songs in batches:
+            fresh = []
+            for song in songs:
+                if song["id"] not in seen_ids:
+                    fresh.append(song)
+                    seen_ids.add(song["id"])
+            if fresh:
+                sent.extend(fresh)
+                yield json.dumps({"source": source, "results": fresh}) + "\n"
+        done = {"done": True, "total": len(sent)}
+        done.update(finish(sent))
+        yield json.dumps(done) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    response.headers["Cache-Control"] = "no-store"
+    # Keep reverse proxies from buffering the stream.
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@bp.route("/api/suggest")
+@login_required
+def api_suggest():
+    """Type-ahead suggestions from the user's past queries, the local library
+    and cached search results. Never calls upstream services."""
+    q = request.args.get("q", "")
+    limit = min(int(request.args.get("limit", 8)), 20)
+    return jsonify(suggester.suggest(q, limit, session['user_id']))
 
 @bp.route("/api/song-info/<song_id>")
 @login_required
@@ -723,11 +700,7 @@ def api_song_info(song_id):
         return jsonify(meta)
 
     try:
-        if song_id not in song_cache:
-            data = ytmusic.get_song(song_id)
-            song_cache[song_id] = data
-        else:
-            data = song_cache[song_id]
+        data = metadata.get_song(song_id)
 
         vd = data.get("videoDetails", {})
         title = vd.get("title", "Unknown")
@@ -758,7 +731,7 @@ def api_song_info(song_id):
 def api_random_song():
     """Return a random song from downloads or recent history."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
         
         # First try to get from downloads
@@ -799,7 +772,7 @@ def api_random_song():
             else:
                 # Get from YouTube
                 try:
-                    info = ytmusic.get_song(song_id)
+                    info = metadata.get_song(song_id)
                     vd = info.get("videoDetails", {})
                     return jsonify({
                         "id": song_id,
@@ -814,7 +787,7 @@ def api_random_song():
         # If no history, return a default popular song
         default_songs = ["dQw4w9WgXcQ", "kJQP7kiw5Fk", "9bZkp7q19f0"]  # Some popular songs
         random_id = random.choice(default_songs)
-        info = ytmusic.get_song(random_id)
+        info = metadata.get_song(random_id)
         vd = info.get("videoDetails", {})
         
         return jsonify({
@@ -844,7 +817,7 @@ def api_get_recommendations(song_id):
         seen_songs = set()
 
         # 1. Get current song info
-        song_info = ytmusic.get_song(song_id)
+        song_info = metadata.get_song(song_id)
         if not song_info:
             return util.fallback_recommendations()
 
@@ -930,7 +903,7 @@ def reset_password():
                     error='Email is required'
                 )
                 
-            conn = sqlite3.connect(DB_PATH)
+            conn = pool.get_connection()
             c = conn.cursor()
             c.execute('SELECT id FROM users WHERE email = ?', (email,))
             user = c.fetchone()
@@ -970,7 +943,7 @@ def reset_password():
                     error='Invalid or expired code'
                 )
                 
-            conn = sqlite3.connect(DB_PATH)
+            conn = pool.get_connection()
             c = conn.cursor()
             c.execute('SELECT id FROM users WHERE email = ?', (email,))
             user_id = c.fetchone()[0]
@@ -1007,7 +980,7 @@ def reset_password():
                 bcrypt.gensalt()
             ).decode()
             
-            conn = sqlite3.connect(DB_PATH)
+            conn = pool.get_connection()
             c = conn.cursor()
             c.execute(
                 'UPDATE users SET password_hash = ? WHERE id = ?',
@@ -1039,7 +1012,7 @@ def forgot_username():
                     error='Email is required'
                 )
                 
-            conn = sqlite3.connect(DB_PATH)
+            conn = pool.get_connection()
             c = conn.cursor()
             c.execute('SELECT username FROM users WHERE email = ?', (email,))
             user = c.fetchone()
@@ -1069,7 +1042,7 @@ def forgot_username():
 @bp.route('/logout')
 def logout():
     if 'user_id' in session and 'session_token' in session:
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
         c.execute("""
             DELETE FROM active_sessions 
@@ -1077,6 +1050,7 @@ def logout():
         """, (session['user_id'], session['session_token']))
         conn.commit()
         conn.close()
+        session_cache.invalidate_session(session['user_id'], session['session_token'])
     
     session.clear()
     return redirect(url_for('playback.login'))
@@ -1086,15 +1060,8 @@ def logout():
 def login():
     # First check if user is already logged in with valid session
     if 'user_id' in session and 'session_token' in session:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
         try:
-            c.execute("""
-                SELECT 1 FROM active_sessions 
-                WHERE user_id = ? AND session_token = ? 
-                AND expires_at > CURRENT_TIMESTAMP
-            """, (session['user_id'], session['session_token']))
-            valid_session = c.fetchone()
+            valid_session = session_cache.is_session_valid(session['user_id'], session['session_token'])
             
             if valid_session:
                 return redirect(url_for('playback.home'))
@@ -1104,8 +1071,6 @@ def login():
         except Exception as e:
             logger.error(f"Session check error: {e}")
             session.clear()
-        finally:
-            conn.close()
     
     if request.method == 'POST':
         login_id = request.form.get('login_id')
@@ -1123,7 +1088,7 @@ def login():
         if 'temp_login' in session:
             session.pop('temp_login')
             
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
         
         try:
@@ -1150,6 +1115,7 @@ def login():
                         WHERE user_id = ? 
                     """, (user_id,))
                     conn.commit()
+                    session_cache.invalidate_user(user_id)
                     logger.info(f"Terminated existing sessions for user {user_id}")
                 
                 if twofa_method != 'none':  # 2FA enabled
@@ -1241,7 +1207,7 @@ def login_verify():
     
     if temp['twofa_method'] == 'email':
         # Verify email OTP
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
         c.execute('SELECT email FROM users WHERE id = ?', (temp['user_id'],))
         email = c.fetchone()[0]
@@ -1260,7 +1226,7 @@ def login_verify():
     session_token = secrets.token_urlsafe(32)
     expires_at = datetime.now() + timedelta(days=7)
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     c.execute("""
         INSERT INTO active_sessions (user_id, session_token, expires_at)
@@ -1296,7 +1262,7 @@ def register():
                 error='All fields are required'
             )
             
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
         
         # Check if email/username exists
@@ -1367,7 +1333,7 @@ def register_verify():
         )
         
     # Create user account
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     
     password_hash = bcrypt.hashpw(
@@ -1406,7 +1372,7 @@ def register_verify():
 @login_required
 def get_insights():
     """Get comprehensive listening insights."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     
     try:
@@ -1540,7 +1506,7 @@ def sangeet_download(video_id):
 
     # Get metadata from ytmusicapi
     try:
-        info = ytmusic.get_song(video_id)
+        info = metadata.get_song(video_id)
         vd = info.get("videoDetails", {})
         title = vd.get("title", "Unknown")
         artist = vd.get("author", "Unknown Artist")
@@ -1572,13 +1538,14 @@ def download_file(video_id):
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
 
-    flac_path = util.download_flac(video_id, user_id)
-    if not flac_path:
-        return jsonify({"error": "Failed to process FLAC"}), 500
+    job = jobs.submit(video_id, user_id)
+    if job["status"] != jobs.DONE:
+        return download_job_response(job)
+    flac_path = job["path"]
     
     # Get metadata for file name
     try:
-        info = ytmusic.get_song(video_id)
+        info = metadata.get_song(video_id)
         vd = info.get("videoDetails", {})
         title = vd.get("title", "Unknown")
         safe_title = util.sanitize_filename(title) or "Track"
@@ -1639,6 +1606,7 @@ def embed_player(song_id):
         size = request.args.get("size", "normal")  # small, normal, large
         theme = request.args.get("theme", "default")  # default, purple, blue, dark
         autoplay = request.args.get("autoplay", "false").lower() == "true"
+        job_url = None
         
         # Get song info
         if song_id.startswith("local-"):
@@ -1656,11 +1624,7 @@ def embed_player(song_id):
             stream_url = url_for('playback.api_stream_local', song_id=song_id)
         else:
             try:
-                if song_id not in song_cache:
-                    data = ytmusic.get_song(song_id)
-                    song_cache[song_id] = data
-                else:
-                    data = song_cache[song_id]
+                data = metadata.get_song(song_id)
 
                 vd = data.get("videoDetails", {})
                 song_info = {
@@ -1671,10 +1635,10 @@ def embed_player(song_id):
                     "duration": int(vd.get("lengthSeconds", 0))
                 }
                 
-                # Download/get FLAC stream URL
-                flac_path = util.download_flac(song_id , session.get('user_id')  )
-                if not flac_path:
-                    return jsonify({"error": "Failed to process audio"}), 500
+                # Queue the FLAC; the player waits on the job before loading it
+                job = jobs.submit(song_id, session.get('user_id'))
+                if job["status"] != jobs.DONE:
+                    job_url = jobs.to_json(job)["status_url"]
                 
                 stream_url = url_for('playback.stream_file', song_id=song_id)
                 
@@ -1690,6 +1654,7 @@ def embed_player(song_id):
             theme=theme,
             autoplay=autoplay,
             stream_url=stream_url,
+            job_url=job_url,
             host_url=SERVER_DOMAIN
         )
         
@@ -1704,20 +1669,10 @@ def play_song(song_id):
 
 @bp.before_request
 def before_request():
-    # Clear expired sessions
-    util.cleanup_expired_sessions()
-    
+    # Read-only: expired rows are purged by the background session reaper.
     # Check if current session is expired
     if 'user_id' in session and 'session_token' in session:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            SELECT 1 FROM active_sessions 
-            WHERE user_id = ? AND session_token = ? 
-            AND expires_at > CURRENT_TIMESTAMP
-        """, (session['user_id'], session['session_token']))
-        valid_session = c.fetchone()
-        conn.close()
+        valid_session = session_cache.is_session_valid(session['user_id'], session['session_token'])
         
         if not valid_session:
             session.clear()
@@ -1774,7 +1729,7 @@ def api_stats():
     """Return user-specific usage stats."""
     try:
         user_id = session['user_id']
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
 
         # Get user's stats
@@ -1834,11 +1789,7 @@ def api_stats():
                             "plays": count
                         })
                 else:
-                    if sid not in song_cache:
-                        data = ytmusic.get_song(sid)
-                        song_cache[sid] = data
-                    else:
-                        data = song_cache[sid]
+                    data = metadata.get_song(sid)
                     vd = data.get("videoDetails", {})
                     title = vd.get("title", "Unknown")
                     artist = vd.get("author", "Unknown Artist")
@@ -1870,6 +1821,98 @@ def api_stats():
         logger.error(f"Stats error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@bp.route("/api/system/db-pool")
+@login_required
+def api_db_pool_stats():
+    """Return SQLite connection pool counters for this worker process."""
+    return jsonify(pool.pool_stats())
+
+@bp.route("/api/system/session-cache")
+@login_required
+def api_session_cache_stats():
+    """Return session validation cache counters for this worker process."""
+    return jsonify(session_cache.cache_stats())
+
+@bp.route("/api/system/metadata-cache")
+@login_required
+def api_metadata_cache_stats():
+    """Return song metadata cache counters for this worker process."""
+    return jsonify(metadata.cache_stats())
+
+@bp.route("/api/system/lyrics")
+@login_required
+def api_lyrics_stats():
+    """Return lyrics store counters for this worker process."""
+    return jsonify(lyrics.stats())
+
+@bp.route("/api/system/artist-cache")
+@login_required
+def api_artist_cache_stats():
+    """Return artist cache counters for this worker process."""
+    return jsonify(artists.stats())
+
+@bp.route("/api/system/download-jobs")
+@login_required
+def api_download_jobs_stats():
+    """Return download job counts by status."""
+    return jsonify(jobs.stats())
+
+@bp.route("/api/system/ytdlp-engine")
+@login_required
+def api_ytdlp_engine_stats():
+    """Return yt-dlp engine counters for this worker process."""
+    return jsonify(ytdlp_engine.stats())
+
+@bp.route("/api/system/singleflight")
+@login_required
+def api_singleflight_stats():
+    """Return request coalescing counters for this worker process."""
+    return jsonify(singleflight.stats())
+
+@bp.route("/api/system/search-cache")
+@login_required
+def api_search_cache_stats():
+    """Return search cache and upstream source counters for this worker process."""
+    return jsonify({
+        "search": search_results_cache.stats(),
+        "ytmusic_search": util.ytmusic_search_cache.stats(),
+        "sources": upstream.source_stats(),
+        "late_calls": upstream.late_calls(),
+        "cursors": cursors.stats(),
+    })
+
+@bp.route("/api/system/library-scan")
+@login_required
+def api_library_scan_stats():
+    """Return statistics from the most recent local library scan."""
+    return jsonify(util.get_local_scan_stats())
+
+@bp.route("/api/artwork/<digest>")
+def api_artwork(digest):
+    """Serve stored cover art. Optional ?size=64|300|600 returns a resized copy.
+
+    Artwork is content-addressed, so a URL never changes meaning and can be
+    cached by browsers indefinitely.
+    """
+    size = request.args.get("size", type=int)
+    path, mime = artwork.get_variant(digest, size)
+    if path is None:
+        return jsonify({"error": "Artwork not found"}), 404
+
+    served = os.path.splitext(os.path.basename(path))[0]
+    etag = f'"{served}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        resp = make_response("", 304)
+    else:
+        resp = make_response(send_file(path, mimetype=mime, conditional=False, etag=False))
+    resp.headers["ETag"] = etag
+    if size in artwork.VARIANT_SIZES and served == digest:
+        # Resizing was not possible; let clients pick up the variant later.
+        resp.headers["Cache-Control"] = "public, max-age=86400"
+    else:
+        resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
 @bp.errorhandler(404)
 def not_found(e):
     return jsonify({"error": "Not found"}), 404
@@ -1880,6 +1923,25 @@ def internal_error(e):
 
 
 
+@bp.route("/api/jobs", methods=["POST"])
+@login_required
+def api_submit_job():
+    """Queue a FLAC download: ``{"video_id": ...}``. Returns the job."""
+    video_id = (request.get_json(silent=True) or {}).get("video_id", "")
+    if video_id.startswith("local-") or not util.is_potential_video_id(video_id):
+        return jsonify({"error": "Invalid video ID"}), 400
+    job = jobs.submit(video_id, session['user_id'])
+    return jsonify(jobs.to_json(job)), (200 if job["status"] == jobs.DONE else 202)
+
+@bp.route("/api/jobs/<job_id>")
+@login_required
+def api_job_status(job_id):
+    """Status and progress of a download job."""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(jobs.to_json(job))
+
 @bp.route("/api/stream/<song_id>")
 @login_required
 def api_stream(song_id):
@@ -1893,14 +1955,20 @@ def api_stream(song_id):
             "url": f"/api/stream-local/{song_id}"
         })
 
-    flac_path = util.download_flac(song_id, user_id)
-    if not flac_path:
-        return jsonify({"error": "Download/FLAC conversion failed"}), 500
-
-    return jsonify({
+    # Downloading and transcoding happens on the job pool; the client polls
+    # the job and loads the URL once it is streamable (done, or being
+    # written progressively).
+    job = jobs.submit(song_id, user_id)
+    ready = jobs.is_streamable(job)
+    response = jsonify({
         "url": f"/api/stream-file/{song_id}",
-        "local": False
+        "local": False,
+        "ready": ready,
+        "job": jobs.to_json(job)
     })
+    if not ready:
+        response.status_code = 202
+    return response
 
 @bp.route("/api/download/<song_id>")
 @login_required
@@ -1920,13 +1988,14 @@ def api_download(song_id):
             mimetype="audio/flac"
         )
 
-    flac_path = util.download_flac(song_id, user_id)
-    if not flac_path:
-        return jsonify({"error": "Failed to process FLAC"}), 500
+    job = jobs.submit(song_id, user_id)
+    if job["status"] != jobs.DONE:
+        return download_job_response(job)
+    flac_path = job["path"]
 
     # Get metadata and record download
     try:
-        info = ytmusic.get_song(song_id)
+        info = metadata.get_song(song_id)
         vd = info.get("videoDetails", {})
         title = vd.get("title", "Unknown")
         artist = vd.get("author", "Unknown Artist")
@@ -1957,7 +2026,7 @@ def api_similar(song_id):
         if song_id.startswith("local-"):
             return util.fallback_recommendations()
 
-        song_info = ytmusic.get_song(song_id)
+        song_info = metadata.get_song(song_id)
         if not song_info:
             return util.fallback_recommendations()
 
@@ -2066,7 +2135,7 @@ def api_similar(song_id):
 def api_clear_history():
     """Clear play history."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
         c.execute("DELETE FROM history")
         conn.commit()
@@ -2082,7 +2151,7 @@ def api_clear_history():
 def api_clear_downloads():
     """Clear all downloads in DB and remove files from disk."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
         c.execute("SELECT path FROM downloads")
         paths = [row[0] for row in c.fetchall()]
@@ -2104,49 +2173,115 @@ def api_clear_downloads():
 
 
 
-@bp.route("/api/stream-file/<song_id>")
-@login_required
-def stream_file(song_id):
-    """Serve the FLAC file with range requests for seeking."""
-    flac_path = os.path.join(os.getenv("music_path"), f"{song_id}.flac")
-    if not os.path.exists(flac_path):
-        return jsonify({"error": "File not found"}), 404
+def serve_flac(flac_path):
+    """Serve a finished FLAC file with range requests for seeking."""
+    file_size = os.path.getsize(flac_path)
+    range_header = request.headers.get("Range", None)
 
-    try:
-        file_size = os.path.getsize(flac_path)
-        range_header = request.headers.get("Range", None)
+    if not range_header:
+        resp = make_response(send_file(flac_path, mimetype="audio/flac"))
+        resp.headers["Content-Length"] = str(file_size)
+        return resp
 
-        if not range_header:
-            resp = make_response(send_file(flac_path, mimetype="audio/flac"))
-            resp.headers["Content-Length"] = str(file_size)
+    match = re.search(r"bytes=(\d+)-(\d*)", range_header)
+    if not match:
+        return jsonify({"error": "Invalid Range header"}), 400
+
+    start = int(match.group(1))
+    end = match.group(2)
+    if not end:
+        end = file_size - 1
+    else:
+        end = int(end)
+
+    if start > end or start < 0 or end >= file_size:
+        return jsonify({"error": "Invalid range"}), 416
+
+    length = end - start + 1
+    with open(flac_path, "rb") as f:
+        f.seek(start)
+        chunk = f.read(length)
+
+    resp = make_response(chunk)
+    resp.status_code = 206
+    resp.headers["Content-Type"] = "audio/flac"
+    resp.headers["Accept-Ranges"] = "bytes"
+    resp.headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    resp.headers["Content-Length"] = str(length)
+    return resp
+
+
+def serve_partial(job, flac_path):
+    """Serve a FLAC that is still being written.
+
+    Every request gets at most ``progressive.MAX_CHUNK`` bytes of what is
+    written so far, as a 206 with an unknown total length; the player asks
+    for the next range itself. Bytes that are not there yet get a 503 with
+    Retry-After, so no request holds a worker for the whole download.
+    """
+    range_header = request.headers.get("Range", None)
+    match = re.search(r"bytes=(\d+)-(\d*)", range_header) if range_header else None
+    if range_header and not match:
+        return jsonify({"error": "Invalid Range header"}), 400
+
+    start = int(match.group(1)) if match else 0
+    end = int(match.group(2)) if match and match.group(2) else None
+    if end is not None and start > end:
+        return jsonify({"error": "Invalid range"}), 416
+
+    size, writing = progressive.wait_for(job, start + 1)
+    if not writing and os.path.exists(flac_path):
+        # Finished while we waited
+        return serve_flac(flac_path)
+    if size is None:
+        return jsonify({"error": "File not found"}), 404
+
+    if size <= start:
+        if writing:
+            resp = jsonify({"error": "Not downloaded yet"})
+            resp.status_code = 503
+            resp.headers["Retry-After"] = "1"
             return resp
+        return jsonify({"error": "Invalid range"}), 416
 
-        match = re.search(r"bytes=(\d+)-(\d*)", range_header)
-        if not match:
-            return jsonify({"error": "Invalid Range header"}), 400
+    last = min(size, start + progressive.MAX_CHUNK) - 1
+    end = last if end is None else min(end, last)
+    length = end - start + 1
+    with open(job["path"], "rb") as f:
+        f.seek(start)
+        chunk = f.read(length)
 
-        start = int(match.group(1))
-        end = match.group(2)
-        if not end:
-            end = file_size - 1
-        else:
-            end = int(end)
+    resp = make_response(chunk)
+    resp.status_code = 206
+    resp.headers["Content-Type"] = "audio/flac"
+    resp.headers["Accept-Ranges"] = "bytes"
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["Content-Range"] = f"bytes {start}-{end}/{'*' if writing else size}"
+    resp.headers["Content-Length"] = str(length)
+    return resp
 
-        if start > end or start < 0 or end >= file_size:
-            return jsonify({"error": "Invalid range"}), 416
 
-        length = end - start + 1
-        with open(flac_path, "rb") as f:
-            f.seek(start)
-            chunk = f.read(length)
+@bp.route("/api/stream-file/<song_id>")
+@login_required
+def stream_file(song_id):
+    """Serve the FLAC file with range requests for seeking.
 
-        resp = make_response(chunk)
-        resp.status_code = 206
-        resp.headers["Content-Type"] = "audio/flac"
-        resp.headers["Accept-Ranges"] = "bytes"
-        resp.headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
-        resp.headers["Content-Length"] = str(length)
-        return resp
+    While a song is downloaded progressively, the partial file is served.
+    """
+    flac_path = os.path.join(os.getenv("music_path"), f"{song_id}.flac")
+    try:
+        if os.path.exists(flac_path):
+            return serve_flac(flac_path)
+        job = progressive.partial_job(song_id)
+        if job is None:
+            return jsonify({"error": "File not found"}), 404
+        try:
+            return serve_partial(job, flac_path)
+        except FileNotFoundError:
+            # The partial file was removed right after the download finished
+            if os.path.exists(flac_path):
+                return serve_flac(flac_path)
+            raise
 
     except Exception as e:
         logger.error(f"stream_file error: {e}")
@@ -2205,32 +2340,38 @@ def api_stream_local(song_id):
 @bp.route("/api/lyrics/<song_id>")
 @login_required
 def api_lyrics(song_id):
-    """Return YTMusic lyrics array or [] for local/no lyrics."""
-    if song_id.startswith("local-"):
-        return jsonify([])
+    """Return YTMusic lyrics array or [] for local/no lyrics.
 
-    if song_id in lyrics_cache:
-        return jsonify(lyrics_cache[song_id])
+    With ``?synced=1`` the response is ``{"lines", "synced", "source"}``
+    instead, where ``synced`` holds timed lines (milliseconds) or null.
+    """
+    want_synced = request.args.get("synced") == "1"
+    empty = {"lines": [], "synced": None, "source": None} if want_synced else []
+    if song_id.startswith("local-"):
+        return jsonify(empty)
 
     try:
-        watch_pl = ytmusic.get_watch_playlist(song_id)
-        if not watch_pl or "lyrics" not in watch_pl:
-            lbid = watch_pl.get("lyrics")
-            if not lbid:
-                return jsonify([])
-        else:
-            lbid = watch_pl["lyrics"]
-
-        data = ytmusic.get_lyrics(lbid)
-        if data and "lyrics" in data:
-            lines = data["lyrics"].split("\n")
-            lines.append("\n Sangeet Premium")
-            lyrics_cache[song_id] = lines
-            return jsonify(lines)
-        return jsonify([])
+        entry = lyrics.get_lyrics(song_id)
     except Exception as e:
         logger.error(f"api_lyrics error: {e}")
-        return jsonify([])
+        return jsonify(empty)
+    if not entry:
+        return jsonify(empty)
+
+    lines = entry["lines"] + ["\n Sangeet Premium"]
+    if want_synced:
+        return jsonify({"lines": lines, "synced": entry["synced"], "source": entry["source"]})
+    return jsonify(lines)
+
+@bp.route("/api/lyrics/prefetch", methods=["POST"])
+@login_required
+def api_lyrics_prefetch():
+    """Warm the lyrics store for upcoming songs: ``{"ids": [...]}``."""
+    ids = (request.get_json(silent=True) or {}).get("ids") or []
+    if not isinstance(ids, list):
+        return jsonify({"error": "ids must be a list"}), 400
+    queued = lyrics.prefetch([str(i) for i in ids])
+    return jsonify({"queued": queued}), 202
 
 
 
@@ -2238,7 +2379,7 @@ def api_lyrics(song_id):
 @login_required
 def api_downloads():
     """Return all downloads that exist on disk."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     c.execute("""
         SELECT video_id, title, artist, album, downloaded_at
@@ -2283,7 +2424,7 @@ def resend_otp():
             if data['login_token'] != temp['token']:
                 return jsonify({'error': 'Invalid token'}), 400
                 
-            conn = sqlite3.connect(DB_PATH)
+            conn = pool.get_connection()
             c = conn.cursor()
             c.execute('SELECT email FROM users WHERE id = ?', (temp['user_id'],))
             email = c.fetchone()[0]
@@ -2328,7 +2469,7 @@ def check_session_status():
         }), 401
 
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
 
         # Check if this specific session token is still valid
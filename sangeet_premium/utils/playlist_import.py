@@ -0,0 +1,226 @@
+import os
+import logging
+import threading
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, wait
+from ..cache import metadata
+from ..cache.memory import TTLCache
+from ..cache.store import SharedStore
+from . import upstream
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Flat playlist listings are kept this long before they are fetched again.
+PLAYLIST_SNAPSHOT_TTL = int(os.getenv("PLAYLIST_SNAPSHOT_TTL", "1800"))
+# Entries fetched before the first page is answered; the rest of the
+# playlist is listed in the background.
+PLAYLIST_FIRST_CHUNK = int(os.getenv("PLAYLIST_FIRST_CHUNK", "200"))
+PLAYLIST_MAX_ENTRIES = int(os.getenv("PLAYLIST_MAX_ENTRIES", "5000"))
+PLAYLIST_ENRICH_WORKERS = int(os.getenv("PLAYLIST_ENRICH_WORKERS", "6"))
+# Entries not enriched within this time are returned as listed.
+PLAYLIST_ENRICH_TIMEOUT = float(os.getenv("PLAYLIST_ENRICH_TIMEOUT", "5"))
+
+_snapshots = SharedStore("playlist_snapshot", ttl=PLAYLIST_SNAPSHOT_TTL)
+_memory = TTLCache(maxsize=32, ttl=PLAYLIST_SNAPSHOT_TTL)
+_loading = {}
+_loading_lock = threading.Lock()
+
+# Full listings get their own threads so they never queue behind page
+# enrichment.
+PLAYLIST_LIST_WORKERS = 2
+
+_executor = None
+_list_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _pools():
+    """``(enrich_pool, list_pool)``, recreated in forked workers."""
+    global _executor, _list_executor, _executor_pid, _loading
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=PLAYLIST_ENRICH_WORKERS, thread_name_prefix="playlist-enrich"
+                )
+                _list_executor = ThreadPoolExecutor(
+                    max_workers=PLAYLIST_LIST_WORKERS, thread_name_prefix="playlist-list"
+                )
+                _loading = {}
+                _executor_pid = os.getpid()
+    return _executor, _list_executor
+
+
+def is_playlist_url(url):
+    return ("youtube.com" in url or "youtu.be" in url) and ("playlist" in url or "list=" in url)
+
+
+def playlist_key(url):
+    """The playlist ID of a link, so different links to one playlist share a snapshot."""
+    list_id = parse_qs(urlparse(url).query).get("list")
+    return list_id[0] if list_id else url
+
+
+def _song_from_entry(entry):
+    video_id = entry.get("id")
+    artist = entry.get("artist") or entry.get("uploader") or entry.get("channel") or "Unknown Artist"
+    if artist.endswith(" - Topic"):
+        artist = artist[:-len(" - Topic")]
+    return {
+        "id": video_id,
+        "title": entry.get("title") or "Unknown",
+        "artist": artist,
+        "album": entry.get("album") or "",
+        "duration": int(entry.get("duration") or 0),
+        "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+    }
+
+
+def _list(url, max_entries):
+    """Flat listing of up to ``max_entries`` playlist entries (no per-video requests)."""
+    ydl_opts = {
+        'quiet': True,
+        'extract_flat': True,
+        'force_generic_extractor': False,
+        'playlistend': max_entries,
+    }
+    info = upstream.extract_info(url, ydl_opts)
+    if not info or 'entries' not in info:
+        return None
+
+    songs = []
+    seen_ids = set()
+    for entry in info['entries']:
+        if not entry or not entry.get('id') or entry['id'] in seen_ids:
+            continue
+        songs.append(_song_from_entry(entry))
+        seen_ids.add(entry['id'])
+    count = sum(1 for entry in info['entries'] if entry)
+    return {
+        "title": info.get("title", ""),
+        "songs": songs,
+        "complete": count < max_entries or max_entries >= PLAYLIST_MAX_ENTRIES,
+    }
+
+
+def _save(key, snapshot):
+    if not snapshot["complete"]:
+        # Never replace a full listing another worker already published.
+        stored = _snapshots.get(key)
+        if stored is not None and stored["complete"]:
+            _memory.set(key, stored)
+            return
+    _memory.set(key, snapshot)
+    _snapshots.set(key, snapshot)
+
+
+def _load(key):
+    snapshot = _memory.get(key)
+    if snapshot is None or not snapshot["complete"]:
+        stored = _snapshots.get(key)
+        if stored is not None:
+            _memory.set(key, stored)
+            snapshot = stored
+    return snapshot
+
+
+def _load_full(key, url):
+    """Start (or join) the background listing of the whole playlist."""
+    pool = _pools()[1]
+    with _loading_lock:
+        future = _loading.get(key)
+        if future is None:
+            def run():
+                try:
+                    snapshot = _list(url, PLAYLIST_MAX_ENTRIES)
+                    if snapshot is not None:
+                        _save(key, snapshot)
+                    return snapshot
+                finally:
+                    with _loading_lock:
+                        _loading.pop(key, None)
+            future = _loading[key] = pool.submit(run)
+    return future
+
+
+def _needs_enrichment(song):
+    return song["artist"] == "Unknown Artist" or not song["duration"]
+
+
+def _enrich(song):
+    try:
+        data = metadata.get_song(song["id"])
+    except Exception as e:
+        logger.warning(f"Could not enrich playlist entry {song['id']}: {e}")
+        return song
+    vd = (data or {}).get("videoDetails") or {}
+    if not vd:
+        return song
+    enriched = dict(song)
+    enriched["title"] = vd.get("title") or song["title"]
+    enriched["artist"] = vd.get("author") or song["artist"]
+    if data.get("artists"):
+        enriched["artist"] = data["artists"][0].get("name", enriched["artist"])
+    enriched["duration"] = int(vd.get("lengthSeconds") or song["duration"])
+    return enriched
+
+
+def enrich(songs):
+    """Fill in missing artist/duration from cached song metadata, in parallel.
+
+    Lookups that do not finish within PLAYLIST_ENRICH_TIMEOUT are left as
+    listed: those not started yet are cancelled, running ones finish and
+    land in the metadata cache for next time.
+    """
+    pool = _pools()[0]
+    pending = {i: pool.submit(_enrich, song) for i, song in enumerate(songs) if _needs_enrichment(song)}
+    if not pending:
+        return songs
+    wait(pending.values(), timeout=PLAYLIST_ENRICH_TIMEOUT)
+    out = list(songs)
+    for i, future in pending.items():
+        if future.done() and not future.cancelled() and future.exception() is None:
+            out[i] = future.result()
+        else:
+            future.cancel()
+    return out
+
+
+def get_page(url, page, limit):
+    """``(songs, pending)`` for one enriched page of a playlist, or None if
+    the link is not a playlist.
+
+    The first request lists only PLAYLIST_FIRST_CHUNK entries and starts
+    listing the rest in the background. The listing is kept as a snapshot
+    shared by all workers for PLAYLIST_SNAPSHOT_TTL, so paging through a
+    large playlist never lists it again. Only the requested page is enriched.
+    A page past what is listed so far is answered at once with ``pending``
+    set, and the client asks again later.
+    """
+    key = playlist_key(url)
+    start = page * limit
+    end = start + limit
+
+    snapshot = _load(key)
+    if snapshot is None:
+        snapshot = _list(url, PLAYLIST_FIRST_CHUNK)
+        if snapshot is None:
+            return None
+        _save(key, snapshot)
+        if not snapshot["complete"]:
+            _load_full(key, url)
+
+    pending = False
+    if len(snapshot["songs"]) < end and not snapshot["complete"]:
+        future = _load_full(key, url)
+        if not future.done():
+            pending = True
+        elif future.exception() is not None:
+            logger.warning(f"Playlist listing for {key} failed: {future.exception()}")
+        elif future.result() is not None:
+            snapshot = future.result()
+
+    return enrich(snapshot["songs"][start:end]), pending
+
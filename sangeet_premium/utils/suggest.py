@@ -0,0 +1,204 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+from ..database import pool
+from ..cache.store import SharedStore
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# The index is rebuilt in the background at most this often.
+SUGGEST_REBUILD_INTERVAL = int(os.getenv("SUGGEST_REBUILD_INTERVAL", "60"))
+SUGGEST_MAX_QUERIES = 5000
+SUGGEST_MAX_CACHED_SEARCHES = 500
+# Prefixes this short match a large slice of the index; their answers are
+# precomputed at build time so lookups stay constant-time.
+PRECOMPUTED_PREFIX_LEN = 2
+TOP_K = 10
+
+# Library entries outrank cached results; a user's own past queries are
+# looked up separately and come before both.
+SOURCE_WEIGHTS = {"song": 2.0, "artist": 2.0, "result": 1.0}
+
+CACHED_SEARCH_NAMESPACES = ("search", "ytmusic_search")
+
+
+def normalize(text):
+    return " ".join((text or "").casefold().split())
+
+
+class SuggestIndex:
+    """Sorted prefix index over suggestion keys.
+
+    Every suggestion is indexed under its full text and under each later
+    word, so "rhap" finds "Bohemian Rhapsody". Lookups bisect into the
+    sorted key list and rank the matching slice by weight.
+    """
+
+    def __init__(self, entries):
+        best = {}
+        for text, kind, weight in entries:
+            display = text.strip()
+            if not display:
+                continue
+            norm = normalize(display)
+            current = best.get(norm)
+            if current is None or weight > current[2]:
+                best[norm] = (display, kind, weight)
+
+        keys = []
+        for norm, (display, kind, weight) in best.items():
+            words = norm.split(" ")
+            for i in range(len(words)):
+                keys.append((" ".join(words[i:]), -weight, display, kind))
+        keys.sort()
+        self._keys = [k[0] for k in keys]
+        self._entries = [(k[2], k[3], -k[1]) for k in keys]
+        self.size = len(best)
+
+        self._short = {}
+        for n in range(1, PRECOMPUTED_PREFIX_LEN + 1):
+            i = 0
+            while i < len(self._keys):
+                prefix = self._keys[i][:n]
+                if len(prefix) < n:
+                    i += 1
+                    continue
+                end = self._prefix_end(prefix, i)
+                self._short[prefix] = self._top(range(i, end), TOP_K)
+                i = end
+
+    def _top(self, positions, k):
+        seen = set()
+        out = []
+        for i in heapq.nlargest(k * 3, positions, key=lambda i: self._entries[i][2]):
+            display, kind, weight = self._entries[i]
+            if display in seen:
+                continue
+            seen.add(display)
+            out.append({"text": display, "type": kind})
+            if len(out) >= k:
+                break
+        return out
+
+    def lookup(self, prefix, limit=8):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= PRECOMPUTED_PREFIX_LEN:
+            return self._short.get(prefix, [])[:limit]
+        start = bisect_left(self._keys, prefix)
+        return self._top(range(start, self._prefix_end(prefix, start)), limit)
+
+    def _prefix_end(self, prefix, start):
+        return bisect_left(self._keys, prefix + "\U0010ffff", lo=start)
+
+
+def past_queries(user_id, prefix, limit=8):
+    """``user_id``'s recent queries with a word starting with ``prefix``, most used first."""
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    conn = pool.get_connection()
+    try:
+        rows = conn.execute("""
+            SELECT display FROM (
+                SELECT query, display, count, last_used FROM search_queries
+                WHERE user_id = ? ORDER BY last_used DESC LIMIT ?
+            )
+            WHERE query LIKE ? ESCAPE '\\' OR query LIKE ? ESCAPE '\\'
+            ORDER BY count DESC, last_used DESC LIMIT ?
+        """, (user_id, SUGGEST_MAX_QUERIES, pattern, "% " + pattern, limit)).fetchall()
+    except Exception as e:
+        logger.warning(f"Could not read past search queries: {e}")
+        return []
+    finally:
+        conn.close()
+    return [{"text": display, "type": "query"} for display, in rows]
+
+
+def collect_entries(local_songs):
+    """(text, type, weight) tuples from the library and cached results."""
+    entries = []
+    for song in local_songs.values():
+        entries.append((song["title"], "song", SOURCE_WEIGHTS["song"]))
+        entries.append((song["artist"], "artist", SOURCE_WEIGHTS["artist"]))
+    for namespace in CACHED_SEARCH_NAMESPACES:
+        for entry in SharedStore(namespace).values(SUGGEST_MAX_CACHED_SEARCHES):
+            for song in entry.get("value") or []:
+                entries.append((song.get("title", ""), "song", SOURCE_WEIGHTS["result"]))
+                entries.append((song.get("artist", ""), "artist", SOURCE_WEIGHTS["result"]))
+    return [e for e in entries if e[0] and e[0] != "Unknown Artist"]
+
+
+class Suggester:
+    """Holds the current SuggestIndex and rebuilds it in the background."""
+
+    def __init__(self, local_songs):
+        self._local_songs = local_songs
+        self._index = None
+        self._built_at = 0.0
+        self._building = False
+        self._lock = threading.Lock()
+
+    def _build(self):
+        started = time.monotonic()
+        try:
+            index = SuggestIndex(collect_entries(self._local_songs))
+            self._index = index
+            logger.info(f"Built suggestion index with {index.size} entries "
+                        f"in {time.monotonic() - started:.3f}s")
+        except Exception as e:
+            logger.error(f"Error building suggestion index: {e}")
+        finally:
+            self._built_at = time.monotonic()
+            self._building = False
+
+    def _maybe_rebuild(self):
+        if time.monotonic() - self._built_at < SUGGEST_REBUILD_INTERVAL and self._index is not None:
+            return
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        # Requests keep using the previous index (or get no suggestions
+        # before the first build finishes) so a lookup never waits on a build.
+        threading.Thread(target=self._build, daemon=True).start()
+
+    def suggest(self, prefix, limit=8, user_id=None):
+        """The user's own past queries first, then the shared index."""
+        self._maybe_rebuild()
+        index = self._index
+        out = past_queries(user_id, prefix, limit) if user_id is not None else []
+        seen = {normalize(s["text"]) for s in out}
+        for suggestion in index.lookup(prefix, limit) if index is not None else []:
+            if len(out) >= limit:
+                break
+            if normalize(suggestion["text"]) not in seen:
+                seen.add(normalize(suggestion["text"]))
+                out.append(suggestion)
+        return out
+
+
+def record_query(user_id, query):
+    """Remember a search submitted by ``user_id`` so it can be suggested to them later."""
+    display = " ".join((query or "").split())
+    if not display:
+        return
+    conn = pool.get_connection()
+    try:
+        conn.execute("""
+            INSERT INTO search_queries (user_id, query, display, count, last_used)
+            VALUES (?, ?, ?, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT(user_id, query) DO UPDATE SET
+                count = count + 1, display = excluded.display, last_used = CURRENT_TIMESTAMP
+        """, (user_id, normalize(display), display))
+        conn.commit()
+    except Exception as e:
+        logger.warning(f"Could not record search query: {e}")
+    finally:
+        conn.close()
@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from ytmusicapi import YTMusic
+from ..cache import singleflight
+from . import ytdlp_engine
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# YTMusic calls that are coalesced when identical requests overlap.
+YTMUSIC_METHODS = (
+    "get_song", "get_watch_playlist", "search", "get_artist",
+    "get_album", "get_lyrics", "get_charts",
+)
+
+# Long-lived pool shared by every federated search and playlist expansion.
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "8"))
+# Per-source deadlines (seconds); a slower source is left out of the response.
+SOURCE_TIMEOUTS = {
+    "ytmusic": float(os.getenv("SEARCH_TIMEOUT_YTMUSIC", "4")),
+    "ytdlp": float(os.getenv("SEARCH_TIMEOUT_YTDLP", "6")),
+}
+DEFAULT_TIMEOUT = 8.0
+# Calls that passed their deadline but are still running occupy pool
+# threads. Past this many, new calls are not started at all, so a stalled
+# upstream makes searches skip it instead of queueing behind it.
+SEARCH_MAX_LATE = int(os.getenv("SEARCH_MAX_LATE", str(max(1, SEARCH_WORKERS // 2))))
+
+_ytmusic = None
+_ytmusic_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_late = 0
+_late_lock = threading.Lock()
+_source_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_ytmusic():
+    """The process-wide YTMusic client, wrapped with single-flight."""
+    global _ytmusic
+    if _ytmusic is None:
+        with _ytmusic_lock:
+            if _ytmusic is None:
+                _ytmusic = singleflight.CoalescedClient(YTMusic(), YTMUSIC_METHODS, name="ytmusic")
+    return _ytmusic
+
+
+def get_executor():
+    """The shared search pool, created lazily in each (forked) worker process."""
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=SEARCH_WORKERS, thread_name_prefix="upstream"
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _record(name, outcome, seconds):
+    with _stats_lock:
+        stats = _source_stats.setdefault(
+            name, {"ok": 0, "error": 0, "timeout": 0, "skipped": 0, "seconds": 0.0}
+        )
+        stats[outcome] += 1
+        stats["seconds"] = round(stats["seconds"] + seconds, 3)
+
+
+def _late_done(future):
+    global _late
+    with _late_lock:
+        _late -= 1
+
+
+def _give_up(future):
+    """Drop a call that passed its deadline: cancel it if it has not started,
+    otherwise count it as late until it finishes."""
+    global _late
+    if future.cancel():
+        return
+    with _late_lock:
+        _late += 1
+    future.add_done_callback(_late_done)
+
+
+def late_calls():
+    with _late_lock:
+        return _late
+
+
+def iter_sources(sources, timeouts=None):
+    """Run ``{name: callable}`` concurrently on the shared pool.
+
+    Yields ``(name, ok, result)`` as each source finishes, fails or passes
+    its own deadline, so callers can use fast sources without waiting for
+    slow ones. Late calls that already started keep running in the
+    background so their caches still get filled; while SEARCH_MAX_LATE of
+    them are running, sources are skipped rather than queued.
+    """
+    timeouts = timeouts or SOURCE_TIMEOUTS
+    started = time.monotonic()
+    if late_calls() >= SEARCH_MAX_LATE:
+        logger.warning(f"{late_calls()} timed-out upstream calls still running, skipping upstream sources")
+        for name in sources:
+            _record(name, "skipped", 0.0)
+            yield name, False, None
+        return
+    executor = get_executor()
+    pending = {executor.submit(fn): name for name, fn in sources.items()}
+    deadlines = {name: started + timeouts.get(name, DEFAULT_TIMEOUT) for name in sources}
+
+    while pending:
+        now = time.monotonic()
+        for future, name in list(pending.items()):
+            if not future.done() and deadlines[name] <= now:
+                logger.warning(f"Upstream source '{name}' timed out after {timeouts.get(name, DEFAULT_TIMEOUT)}s")
+                _record(name, "timeout", now - started)
+                del pending[future]
+                _give_up(future)
+                yield name, False, None
+        if not pending:
+            break
+        next_deadline = min(deadlines[name] for name in pending.values())
+        done, _ = wait(list(pending), timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            name = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Upstream source '{name}' failed: {e}")
+                _record(name, "error", time.monotonic() - started)
+                yield name, False, None
+                continue
+            _record(name, "ok", time.monotonic() - started)
+            yield name, True, result
+
+
+def run_sources(sources, timeouts=None):
+    """Wait for all of ``iter_sources`` and return ``(results, complete)``.
+
+    ``results`` maps names to return values for the sources that finished
+    in time, ``complete`` is False if any source failed or timed out.
+    """
+    results = {}
+    complete = True
+    for name, ok, result in iter_sources(sources, timeouts):
+        if ok:
+            results[name] = result
+        else:
+            complete = False
+    return results, complete
+
+
+def source_stats():
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _source_stats.items()}
+
+
+def extract_info(url, ydl_opts):
+    """``YoutubeDL(ydl_opts).extract_info(url, download=False)`` with single-flight.
+
+    Runs on the warm yt-dlp engine. Concurrent requests for the same URL
+    and options, in this worker or any other, share one extraction. The
+    result is sanitised to plain JSON types so it can be handed to other
+    workers.
+    """
+    return singleflight.do(
+        singleflight.key_for("yt_dlp.extract_info", url, ydl_opts),
+        lambda: ytdlp_engine.extract(url, ydl_opts)
+    )
@@ -1,21 +1,21 @@
 import time
-import sqlite3
 import os
-import base64
-import json
 import logging
-from flask import session, redirect
-from functools import wraps
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import re
 import requests
 from mutagen import File as MutagenFile
-from mutagen import  File
 from ..helpers import time_helper
+from ..database import pool, reaper
+from ..library import scanner, catalog
+from ..library import search as local_search
+from ..cache import metadata, swr
+from ..downloads import locks
+from . import upstream, ytdlp_engine
+from ..login_system.login_warps import login_required
 import random
-from mutagen.flac import FLAC
 from datetime import timedelta
 import os
 import platform
@@ -23,7 +23,6 @@ import requests
 import stat
 from pathlib import Path
 
-from ytmusicapi import YTMusic
 import secrets
 import subprocess
 import platform
@@ -149,18 +148,24 @@ MUSIC_DIR = os.getenv("music_path")
 
 FFMPEG_BIN_DIR = os.path.join(os.getcwd(), "ffmpeg", "bin")  # Path to ffmpeg binary
 
-song_cache = {}
-
 
 LOCAL_SONGS_PATHS = os.getenv("LOCAL_SONGS_PATHS", "")
-ytmusic = YTMusic()
+ytmusic = upstream.get_ytmusic()
 
 time_sync = time_helper.TimeSync()
 
 CACHE_DURATION = 3600
-search_cache = {}
-song_cache = {}
-lyrics_cache = {}
+
+# Upstream search results: fresh for SEARCH_CACHE_TTL, then served stale
+# (and refreshed in the background) for up to SEARCH_CACHE_STALE seconds.
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_STALE = int(os.getenv("SEARCH_CACHE_STALE", "86400"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+# Paginated searches stop asking upstream for more after this many results per source.
+SEARCH_MAX_DEPTH = int(os.getenv("SEARCH_MAX_DEPTH", "200"))
+ytmusic_search_cache = swr.SWRCache(
+    "ytmusic_search", SEARCH_CACHE_TTL, SEARCH_CACHE_STALE, SEARCH_CACHE_SIZE
+)
 SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
@@ -171,37 +176,11 @@ def generate_session_id():
     """Generate a unique session ID for grouping played songs."""
     return f"session_{int(time.time())}"
 
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session or 'session_token' not in session:
-            return redirect('/login')
-            
-        # Verify session is still valid in database
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT 1 FROM active_sessions 
-            WHERE user_id = ? AND session_token = ? 
-            AND expires_at > CURRENT_TIMESTAMP
-        """, (session['user_id'], session['session_token']))
-        
-        valid_session = c.fetchone()
-        conn.close()
-        
-        if not valid_session:
-            # Clear invalid session
-            session.clear()
-            return redirect("/login")
-            
-        return f(*args, **kwargs)
-    return decorated_function
 @login_required
 def record_song(song_id, user_id):
     """Record song play with user association."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
         
         # Get or create current session
@@ -279,10 +258,9 @@ def get_recent_activity(c) :
             
     return activities
 
-@login_required
 def record_download(video_id, title, artist, album, path, user_id):
     """Store a downloaded track with user association."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     try:
         c.execute("""
@@ -298,7 +276,7 @@ def record_download(video_id, title, artist, album, path, user_id):
 def get_play_history(user_id, limit=50):
     """Get user's play history."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = pool.get_connection()
         c = conn.cursor()
         
         c.execute("""
@@ -340,11 +318,7 @@ def get_play_history(user_id, limit=50):
                     })
             else:
                 try:
-                    if song_id not in song_cache:
-                        data = ytmusic.get_song(song_id)
-                        song_cache[song_id] = data
-                    else:
-                        data = song_cache[song_id]
+                    data = metadata.get_song(song_id)
                     
                     vd = data.get("videoDetails", {})
                     history.append({
@@ -367,10 +341,8 @@ def get_play_history(user_id, limit=50):
         logger.error(f"Error getting play history: {e}")
         return []
     
-local_songs = {}
-
-from mutagen import File
-from mutagen.flac import FLAC
+# Shared, memory-mapped view of the local library written by load_local_songs().
+local_songs = catalog.LocalCatalog()
 
 
 
@@ -381,175 +353,64 @@ LOCAL_SONGS_PATHS = os.getenv("LOCAL_SONGS_PATHS")
 
 def init_db_local():
     """
-    Initialize (or create if needed) the SQLite database.
-    The database file is stored in a subfolder called "locals".
+    Initialize (or create if needed) the local songs SQLite database.
+    The schema lives in library.scanner, which owns the fingerprint columns.
     """
-    db_dir = os.path.join(os.getcwd(), "database_files")
-    if not os.path.exists(db_dir):
-        os.makedirs(db_dir)
-    db_path = os.path.join(db_dir, "local_songs.db")
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    # Create the table if it doesn’t exist.
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS songs (
-            id TEXT PRIMARY KEY,
-            title TEXT,
-            artist TEXT,
-            album TEXT,
-            path TEXT UNIQUE,
-            thumbnail TEXT,
-            duration INTEGER
-        )
-    ''')
-    conn.commit()
-    return conn
+    return scanner.init_db()
 
 def get_new_local_id(cursor):
-    """
-    Look through the current song IDs (which are of the form "local-<number>")
-    and generate a new one with an incremented number.
-    """
-    cursor.execute("SELECT id FROM songs")
-    rows = cursor.fetchall()
-    max_num = 0
-    for (song_id,) in rows:
-        if song_id.startswith("local-"):
-            try:
-                num = int(song_id.split("-")[1])
-                if num > max_num:
-                    max_num = num
-            except ValueError:
-                # In case the format is not as expected, ignore it.
-                pass
-    return "local-" + str(max_num + 1)
+    """Generate the next "local-<number>" ID."""
+    return scanner.new_local_id(cursor)
+
+def save_local_catalog(songs):
+    """Publish the current list of songs to the catalog file read by the workers."""
+    try:
+        catalog.write_catalog(songs)
+        local_songs.refresh(force=True)
+    except Exception as e:
+        logger.error(f"Error saving local songs catalog: {e}")
 
 def load_local_songs():
-    """Scan local directories for music files, update/read the database,
-    and then dump the current list of songs to a JSON file."""
+    """Incrementally scan local directories for music files, sync the database,
+    and publish a new catalog generation when something changed."""
     if not LOCAL_SONGS_PATHS:
         return {}
 
-    # Split the directories and log what we’re scanning.
-    dirs = [d.strip() for d in LOCAL_SONGS_PATHS.split(";") if d.strip()]
-    logger.info(f"Loading local songs from: {dirs}")
-
-    # Set of file extensions to consider.
-    file_exts = {".mp3", ".flac", ".m4a", ".wav", ".ogg", ".wma", ".aac", ".aiff", ".alac"}
+    dirs = scanner.get_library_dirs(LOCAL_SONGS_PATHS)
+    songs, stats = scanner.scan(dirs)
 
-    # Open (or create) the SQLite database.
-    conn = init_db_local()
-    cursor = conn.cursor()
+    if stats["changed"] or not catalog.read_generation():
+        save_local_catalog(songs)
 
-    # Walk through each provided directory.
-    for d in dirs:
-        if not os.path.isdir(d):
-            logger.warning(f"Local path is not a directory: {d}")
-            continue
-
-        for root, _, files in os.walk(d):
-            for fname in files:
-                _, ext = os.path.splitext(fname)
-                if ext.lower() not in file_exts:
-                    continue
-                full_path = os.path.join(root, fname)
-
-                # (Extra check: if the file does not exist, skip it.)
-                if not os.path.exists(full_path):
-                    continue
-
-                # See if this song file is already in the database.
-                cursor.execute("SELECT id FROM songs WHERE path = ?", (full_path,))
-                result = cursor.fetchone()
-                if result:
-                    local_id = result[0]
-                else:
-                    local_id = get_new_local_id(cursor)
-
-                # Default metadata values.
-                title = fname
-                artist = "Unknown Artist"
-                album = "Unknown Album"
-                duration = 0
-                thumbnail = ""
-
-                try:
-                    # Read the audio file using Mutagen.
-                    audio = File(full_path, easy=True)
-                    if audio and hasattr(audio, "info") and hasattr(audio.info, "length"):
-                        duration = int(audio.info.length)
-                    if audio:
-                        title = audio.get("title", [fname])[0]
-                        artist = audio.get("artist", ["Unknown Artist"])[0]
-                        album = audio.get("album", ["Unknown Album"])[0]
-
-                    # Try to extract a picture (works for FLAC and ID3-based files)
-                    if isinstance(audio, FLAC) or hasattr(audio, "pictures"):
-                        pictures = getattr(audio, "pictures", [])
-                        if pictures:
-                            pic = pictures[0]
-                            thumbnail = f"data:{pic.mime};base64,{base64.b64encode(pic.data).decode()}"
-                    elif hasattr(audio, "tags"):
-                        tags = audio.tags
-                        if "APIC:" in tags:  # Attached picture for ID3 tags.
-                            pic = tags["APIC:"]
-                            thumbnail = f"data:{pic.mime};base64,{base64.b64encode(pic.data).decode()}"
-                except Exception as e:
-                    logger.error(f"Error reading metadata from {fname}: {e}")
-
-                # Insert (or update) the song’s record in the database.
-                try:
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO songs (id, title, artist, album, path, thumbnail, duration)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (local_id, title, artist, album, full_path, thumbnail, duration))
-                    conn.commit()
-                except Exception as e:
-                    logger.error(f"Error inserting/updating database for {full_path}: {e}")
-
-    # After scanning the directories, load all songs from the database.
-    cursor.execute("SELECT id, title, artist, album, path, thumbnail, duration FROM songs")
-    rows = cursor.fetchall()
-    local_songs = {}
-    for row in rows:
-        song_id, title, artist, album, path, thumbnail, duration = row
-        # Only add songs for which the file still exists.
-        if os.path.exists(path):
-            local_songs[song_id] = {
-                "id": song_id,
-                "title": title,
-                "artist": artist,
-                "album": album,
-                "path": path,
-                "thumbnail": thumbnail,
-                "duration": duration,
-            }
-        else:
-            # Optionally, remove songs from the DB if the file no longer exists.
-            cursor.execute("DELETE FROM songs WHERE id = ?", (song_id,))
-            conn.commit()
+    logger.info(f"Loaded {len(songs)} local songs with metadata.")
+    return songs
 
-    # Save the collected song metadata to a JSON file.
+def apply_local_changes(updated, removed):
+    """Apply incremental library changes (from the watcher) to the catalog."""
     try:
-        json_dir = os.path.join(os.getcwd(), "locals")
-        if not os.path.exists(json_dir):
-            os.makedirs(json_dir)
-        json_path = os.path.join(json_dir, "local.json")
-        with open(json_path, "w", encoding="utf-8") as json_file:
-            json.dump(local_songs, json_file, ensure_ascii=False, indent=4)
-        logger.info(f"Local songs saved to {json_path}.")
+        if catalog.apply_changes(updated, removed) is None:
+            # No usable catalog to change yet: publish the whole songs table
+            conn = scanner.init_db()
+            try:
+                songs = scanner.load_songs(conn)
+            finally:
+                conn.close()
+            catalog.write_catalog(songs)
+        local_songs.refresh(force=True)
     except Exception as e:
-        logger.error(f"Error saving local songs to JSON file: {e}")
+        logger.error(f"Error updating local songs catalog: {e}")
 
-    conn.close()
-    logger.info(f"Loaded {len(local_songs)} local songs with metadata.")
-    return local_songs
+def get_local_scan_stats():
+    """Statistics from the most recent library scan plus live progress."""
+    stats = scanner.get_last_stats()
+    stats["progress"] = scanner.get_progress()
+    return stats
 
 
 def get_song_info(song_id):
     """Get song metadata with error handling."""
     try:
-        info = ytmusic.get_song(song_id)
+        info = metadata.get_song(song_id)
         if not info:
             return jsonify({"error": "Song not found"}), 404
             
@@ -654,7 +515,7 @@ def process_genres(artist_data):
         return []
     except:
         return []
-@login_required
+
 def get_artist_stats(artist_data):
     """Extract all artist statistics"""
     try:
@@ -842,7 +703,7 @@ def safe_format_count(count):
         return str(count)
 def get_download_info(video_id):
     """Return file path if already downloaded, else None."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     c.execute("SELECT path FROM downloads WHERE video_id = ?", (video_id,))
     row = c.fetchone()
@@ -851,7 +712,7 @@ def get_download_info(video_id):
 
 def get_recent_plays(limit=10):
     """Get user's recent play history for context."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     c.execute("""
         SELECT DISTINCT song_id 
@@ -867,71 +728,83 @@ def get_recent_plays(limit=10):
 
 
 def filter_local_songs(query: str):
-    """Return deduplicated local songs with title/artist matching the query."""
-    qlow = query.lower()
+    """Return deduplicated local songs matching the query, best match first.
+
+    Uses the FTS5 index in local_songs.db (prefix matching, diacritics folded);
+    falls back to a substring scan of the catalog if the index is unavailable.
+    """
+    results = local_search.search(query)
+    if results is None:
+        qlow = query.lower()
+        results = [
+            meta for meta in local_songs.values()
+            if qlow in meta["title"].lower() or qlow in meta["artist"].lower()
+        ]
+
     seen_titles = set()  # Track seen title+artist combinations
     out = []
-    
-    for sid, meta in local_songs.items():
+    for meta in results:
         title_artist = (meta["title"].lower(), meta["artist"].lower())
-        
-        if (qlow in meta["title"].lower() or qlow in meta["artist"].lower()) and \
-           title_artist not in seen_titles:
+        if title_artist not in seen_titles:
             out.append(meta)
             seen_titles.add(title_artist)
-    
+
     return out
 
-@lru_cache(maxsize=100)
-def search_songs(query: str):
-    """YTMusic search (songs) with deduplication, cached for 1 hour."""
-    now_ts = datetime.now().timestamp()
-    if query in search_cache:
-        old_data, old_ts = search_cache[query]
-        if now_ts - old_ts < CACHE_DURATION:
-            return old_data
-            
+def normalize_query(query: str):
+    """Case- and whitespace-insensitive form of a search query, used as cache key."""
+    return " ".join(query.casefold().split())
+
+def search_songs(query: str, limit: int = 20):
+    """YTMusic search (songs) with deduplication, through the shared SWR cache.
+
+    A larger ``limit`` makes YTMusic follow its result continuations.
+    """
+    key = normalize_query(query)
+    if limit != 20:
+        key = f"{limit}:{key}"
     try:
-        raw = ytmusic.search(query, filter="songs")
-        seen_titles = set()  # Track seen title+artist combinations
-        results = []
-        
-        for item in raw:
-            vid = item.get("videoId")
-            if not vid:
-                continue
-                
-            artist = "Unknown Artist"
-            if item.get("artists"):
-                artist = item["artists"][0].get("name", "Unknown Artist")
-                
-            title = item.get("title", "Unknown")
-            title_artist = (title.lower(), artist.lower())
-            
-            # Skip if we've seen this title+artist combination
-            if title_artist in seen_titles:
-                continue
-                
-            dur = item.get("duration_seconds", 0)
-            thumb = f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg"
+        return ytmusic_search_cache.get(key, lambda: _search_songs_upstream(query, limit))
+    except Exception as e:
+        logger.error(f"search_songs error: {e}")
+        return []
+
+def _search_songs_upstream(query: str, limit: int = 20):
+    raw = ytmusic.search(query, filter="songs", limit=limit)
+    seen_titles = set()  # Track seen title+artist combinations
+    results = []
+    
+    for item in raw:
+        vid = item.get("videoId")
+        if not vid:
+            continue
             
-            results.append({
-                "id": vid,
-                "title": title,
-                "artist": artist,
-                "album": "",
-                "duration": dur,
-                "thumbnail": thumb
-            })
+        artist = "Unknown Artist"
+        if item.get("artists"):
+            artist = item["artists"][0].get("name", "Unknown Artist")
             
-            seen_titles.add(title_artist)
+        title = item.get("title", "Unknown")
+        title_artist = (title.lower(), artist.lower())
+        
+        # Skip if we've seen this title+artist combination
+        if title_artist in seen_titles:
+            continue
             
-        search_cache[query] = (results, now_ts)
-        return results
+        dur = item.get("duration_seconds", 0)
+        thumb = f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg"
         
-    except Exception as e:
-        logger.error(f"search_songs error: {e}")
-        return []
+        results.append({
+            "id": vid,
+            "title": title,
+            "artist": artist,
+            "album": "",
+            "duration": dur,
+            "thumbnail": thumb
+        })
+        
+        seen_titles.add(title_artist)
+        
+    return results
 
 def fallback_recommendations():
     """Simplified fallback using search instead of unavailable methods."""
@@ -1057,12 +930,8 @@ def add_recommendation(track, recommendations, seen_songs, current_song_id=None)
         logger.warning(f"Error processing track: {e}")
         return False
 def cleanup_expired_sessions():
-    """Remove expired sessions from database"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM active_sessions WHERE expires_at <= CURRENT_TIMESTAMP")
-    conn.commit()
-    conn.close()
+    """Remove expired sessions and OTPs from database (batched, see database.reaper)"""
+    return reaper.purge_expired()
 
 
 def get_fallback_tracks(seen_songs):
@@ -1282,7 +1151,7 @@ def get_average_completion(c) -> float:
 
 def record_listen_end(listen_id: int, duration: int, listened_duration: int):
     """Record the end of a song listen with analytics."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     
     try:
@@ -1322,7 +1191,7 @@ def record_listen_end(listen_id: int, duration: int, listened_duration: int):
 
 def record_listen_start(song_id: str, title: str, artist: str, session_id: str) -> int:
     """Record listen start with accurate IST timestamp."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     
     try:
@@ -1387,7 +1256,7 @@ from email.mime.multipart import MIMEMultipart
 
 def store_otp(email, otp, purpose):
     """Store OTP in database"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     expires_at = datetime.now() + timedelta(minutes=10)
     
@@ -1407,7 +1276,7 @@ def store_otp(email, otp, purpose):
 
 def verify_otp(email, otp, purpose):
     """Verify OTP from database"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = pool.get_connection()
     c = conn.cursor()
     
     c.execute("""
@@ -1461,22 +1330,28 @@ def send_email(to_email, subject, body):
         return False
     
 
-from yt_dlp import YoutubeDL
 import subprocess
 import platform
-import sqlite3
 import os
+import json
+import shutil
+import tempfile
+import threading
 import logging
+from mutagen.flac import FLAC, Picture
 
 logger = logging.getLogger(__name__)
 
-def download_flac(video_id: str, user_id: int) -> str:
+def download_flac(video_id: str, user_id: int, progress=None, on_partial=None) -> str:
     """
-    Download song with metadata and thumbnail using yt-dlp.exe with fallback to yt-dlp module.
+    Download song with metadata and thumbnail using the in-process yt-dlp engine with fallback to yt-dlp.exe.
     
     Args:
         video_id: str - The YouTube video ID
         user_id: int - The ID of the user downloading the song
+        progress: optional callable receiving the download fraction (0.0-1.0)
+        on_partial: optional callable receiving the path of the FLAC while it
+            is still being written (progressive mode), or None if that failed
         
     Returns:
         str: Path to the FLAC file if successful or existing, None if failed
@@ -1487,12 +1362,12 @@ def download_flac(video_id: str, user_id: int) -> str:
         if existing_path:
             if os.path.exists(existing_path):
                 logger.info(f"Using existing download for {video_id}")
-                load_local_songs()
+                add_local_file(existing_path)
                 return existing_path
             else:
                 # Clean up DB if file is missing
-                load_local_songs()
-                conn = sqlite3.connect(DB_PATH)
+                add_local_file(existing_path)
+                conn = pool.get_connection()
                 c = conn.cursor()
                 c.execute("DELETE FROM downloads WHERE video_id = ?", (video_id,))
                 conn.commit()
@@ -1503,15 +1378,27 @@ def download_flac(video_id: str, user_id: int) -> str:
         if os.path.exists(flac_path):
             return flac_path
 
-        logger.info(f"Downloading new song: {video_id}")
-        yt_music_url = f"https://music.youtube.com/watch?v={video_id}"
+        # One download per song across all workers; later callers wait here
+        with locks.video_lock(video_id):
+            if os.path.exists(flac_path):
+                logger.info(f"{video_id} was downloaded by another worker")
+                return flac_path
 
-        # Try executable first
-        try:
-            return download_with_executable(video_id, user_id, yt_music_url, flac_path, is_init=False)
-        except Exception as exe_error:
-            logger.warning(f"Executable download failed, falling back to module: {str(exe_error)}")
-            return download_with_module(video_id, user_id, yt_music_url, flac_path, is_init=False)
+            logger.info(f"Downloading new song: {video_id}")
+            yt_music_url = f"https://music.youtube.com/watch?v={video_id}"
+
+            if on_partial is not None and PROGRESSIVE_STREAMING:
+                try:
+                    return download_progressive(video_id, user_id, yt_music_url, flac_path, progress, on_partial)
+                except Exception as stream_error:
+                    logger.warning(f"Progressive download failed, falling back: {str(stream_error)}")
+
+            # Try the in-process engine first; the executable is the fallback
+            try:
+                return download_with_module(video_id, user_id, yt_music_url, flac_path, is_init=False, progress=progress)
+            except Exception as module_error:
+                logger.warning(f"Module download failed, falling back to executable: {str(module_error)}")
+                return download_with_executable(video_id, user_id, yt_music_url, flac_path, is_init=False, progress=progress)
 
     except Exception as e:
         logger.error(f"Error downloading song {video_id}: {str(e)}")
@@ -1519,7 +1406,7 @@ def download_flac(video_id: str, user_id: int) -> str:
 
 def download_flac_init(video_id: str) -> str:
     """
-    Version of download_flac that works during initialization with fallback to yt-dlp module.
+    Version of download_flac that works during initialization with fallback to yt-dlp.exe.
     
     Args:
         video_id: str - The YouTube video ID
@@ -1539,149 +1426,399 @@ def download_flac_init(video_id: str) -> str:
         if os.path.exists(flac_path):
             return flac_path
 
-        logger.info(f"Downloading new song during initialization: {video_id}")
-        yt_music_url = f"https://music.youtube.com/watch?v={video_id}"
+        with locks.video_lock(video_id):
+            if os.path.exists(flac_path):
+                return flac_path
 
-        # Try executable first
-        try:
-            return download_with_executable(video_id, None, yt_music_url, flac_path, is_init=True)
-        except Exception as exe_error:
-            logger.warning(f"Executable download failed during init, falling back to module: {str(exe_error)}")
-            return download_with_module(video_id, None, yt_music_url, flac_path, is_init=True)
+            logger.info(f"Downloading new song during initialization: {video_id}")
+            yt_music_url = f"https://music.youtube.com/watch?v={video_id}"
+
+            # Try the in-process engine first; the executable is the fallback
+            try:
+                return download_with_module(video_id, None, yt_music_url, flac_path, is_init=True)
+            except Exception as module_error:
+                logger.warning(f"Module download failed during init, falling back to executable: {str(module_error)}")
+                return download_with_executable(video_id, None, yt_music_url, flac_path, is_init=True)
 
     except Exception as e:
         logger.error(f"Error downloading song {video_id} during initialization: {str(e)}")
         return None
 
-def download_with_executable(video_id: str, user_id: int | None, url: str, flac_path: str, is_init: bool) -> str:
-    """Helper function to download using yt-dlp executable"""
-    # Get metadata first
-    result = subprocess.run([
-        YTDLP_PATH,
-        "--quiet",
-        "--print", "%(title)s",
-        "--print", "%(artist)s",
-        "--print", "%(album)s",
-        url
-    ], capture_output=True, text=True)
-    
-    if result.returncode != 0:
-        raise Exception(f"Metadata extraction failed: {result.stderr}")
-        
-    title, artist, album = result.stdout.strip().split("\n")
-
-    command = [
-        YTDLP_PATH,
-        "--quiet",
-        "--no-warnings",
-        "--extract-audio",
-        "--audio-format", "flac",
-        "--audio-quality", "0",
-        "--embed-metadata",
-        "--embed-thumbnail",
-        "-o", os.path.join(MUSIC_DIR, "%(id)s.%(ext)s"),
+PARTIAL_DIR_NAME = ".partial"
+
+
+def _staging_dir(video_id: str) -> str:
+    """Fresh folder for one download attempt, on the same filesystem as MUSIC_DIR.
+
+    yt-dlp writes its intermediate and final files here; the library scanner
+    skips hidden folders, so a half-written FLAC is never picked up.
+    """
+    partial_dir = os.path.join(MUSIC_DIR, PARTIAL_DIR_NAME)
+    os.makedirs(partial_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{video_id}.", dir=partial_dir)
+
+
+def _publish(staging: str, video_id: str, flac_path: str) -> bool:
+    """Atomically move a finished FLAC into MUSIC_DIR; False if none was produced."""
+    staged_path = os.path.join(staging, f"{video_id}.flac")
+    if not os.path.exists(staged_path):
+        return False
+    os.replace(staged_path, flac_path)
+    return True
+
+
+def purge_partial_downloads(max_age: float) -> int:
+    """Remove download folders left behind by workers that died mid-download."""
+    partial_dir = os.path.join(MUSIC_DIR, PARTIAL_DIR_NAME)
+    removed = 0
+    try:
+        entries = list(os.scandir(partial_dir))
+    except FileNotFoundError:
+        return 0
+    cutoff = time.time() - max_age
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+# Stream-while-downloading: the audio the yt-dlp engine downloads is piped
+# into ffmpeg as it arrives, which writes the FLAC progressively so playback
+# can start within seconds.
+PROGRESSIVE_STREAMING = os.getenv("PROGRESSIVE_STREAMING", "true").lower() == "true"
+# Written straight to its final name (no .part rename) so it can be read
+# while it grows; no post-processing, ffmpeg does the transcode.
+STREAM_YDL_OPTS = {
+    'format': 'bestaudio/best',
+    'outtmpl': '%(id)s.%(ext)s',
+    'nopart': True,
+    'quiet': True,
+    'no_warnings': True,
+}
+PUMP_INTERVAL = 0.1
+# Room reserved in the header of a progressively written FLAC, so tags and
+# cover art can be added later without moving the audio frames clients may
+# already be reading at known offsets.
+TAG_PADDING = 256 * 1024
+
+
+def _ffmpeg_path() -> str:
+    if platform.system().lower() == "windows":
+        return os.path.join(FFMPEG_BIN_DIR, "ffmpeg.exe")
+    return "ffmpeg"
+
+
+def _progress_command(command: list) -> None:
+    """Make yt-dlp print one "progress:<percent>" line per update, even with --quiet."""
+    command.extend(["--progress", "--newline",
+                    "--progress-template", "download:progress:%(progress._percent_str)s"])
+
+
+def _read_progress(lines, progress) -> list:
+    """Feed yt-dlp progress lines to ``progress``; returns the last other lines."""
+    errors = []
+    for line in lines:
+        if line.startswith("progress:"):
+            if progress is None:
+                continue
+            try:
+                progress(float(line[len("progress:"):].strip().rstrip("%")) / 100)
+            except ValueError:
+                pass
+        elif line.strip():
+            errors = (errors + [line.strip()])[-5:]
+    return errors
+
+
+# Fields yt-dlp writes (as one JSON line) while extracting for a download,
+# so no separate metadata pass is needed.
+INFO_TEMPLATE = "%(.{id,title,track,artist,artists,album,duration,channel,uploader})j"
+
+
+def _read_info(info_path: str) -> dict:
+    """The info dict yt-dlp wrote with --print-to-file INFO_TEMPLATE, or {}."""
+    try:
+        with open(info_path, encoding="utf-8") as f:
+            return json.loads(f.readline())
+    except (OSError, ValueError):
+        return {}
+
+
+def _record(video_id: str, user_id: int | None, info: dict, flac_path: str, is_init: bool) -> None:
+    """Keep the metadata of a finished download and add it to the library."""
+    metadata.remember(video_id, info)
+    if not is_init:
+        record_download(
+            video_id=video_id,
+            title=info.get("title") or info.get("track") or "Unknown Title",
+            artist=info.get("artist") or "Unknown Artist",
+            album=info.get("album") or "Unknown Album",
+            path=flac_path,
+            user_id=user_id
+        )
+        add_local_file(flac_path)
+
+
+def add_local_file(path: str) -> None:
+    """Add, update or (if it is gone) remove one file under a library folder
+    in the songs table and the catalog, without rescanning the whole library."""
+    dirs = scanner.get_library_dirs(LOCAL_SONGS_PATHS)
+    if not any(path.startswith(d.rstrip(os.sep) + os.sep) for d in dirs):
+        return
+    try:
+        updated, removed = scanner.apply_changes([path], [])
+        if updated or removed:
+            apply_local_changes(updated, removed)
+    except Exception as e:
+        logger.error(f"Error adding {path} to the local library: {e}")
+
+
+class _LayoutChanged(Exception):
+    """Tags do not fit the header space of a FLAC whose layout must not change."""
+
+
+def _fixed_padding(padding_info) -> int:
+    if padding_info.padding < 0:
+        raise _LayoutChanged()
+    return padding_info.padding
+
+
+def _tag_flac(path: str, video_id: str, info: dict, keep_layout: bool = False) -> None:
+    """Write title/artist/album and the cover image into a finished FLAC.
+
+    With ``keep_layout`` the tags must fit the existing header padding so no
+    audio byte moves; the cover, and then all tags, are dropped if they do not.
+    """
+    audio = FLAC(path)
+    for key in ("title", "artist", "album"):
+        if info.get(key):
+            audio[key] = str(info[key])
+    try:
+        response = requests.get(f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg", timeout=10)
+        response.raise_for_status()
+        picture = Picture()
+        picture.type = 3  # front cover
+        picture.mime = "image/jpeg"
+        picture.data = response.content
+        audio.add_picture(picture)
+    except Exception as e:
+        logger.warning(f"Could not embed thumbnail for {video_id}: {e}")
+    if not keep_layout:
+        audio.save()
+        return
+    try:
+        audio.save(padding=_fixed_padding)
+    except _LayoutChanged:
+        logger.warning(f"Cover art for {video_id} does not fit the reserved header space, leaving it out")
+        audio.clear_pictures()
+        try:
+            audio.save(padding=_fixed_padding)
+        except _LayoutChanged:
+            logger.warning(f"Tags for {video_id} do not fit the reserved header space, publishing untagged")
+
+
+def _pump(staging: str, video_id: str, sink, finished: threading.Event) -> None:
+    """Copy the download being written into ``staging`` to ``sink`` as it grows,
+    until ``finished`` is set and everything written has been copied."""
+    try:
+        source = None
+        while source is None:
+            names = [n for n in os.listdir(staging)
+                     if n.startswith(f"{video_id}.") and not n.endswith(".ytdl")]
+            if names:
+                source = open(os.path.join(staging, names[0]), "rb")
+            elif finished.is_set():
+                return
+            else:
+                time.sleep(PUMP_INTERVAL)
+        with source:
+            while True:
+                done = finished.is_set()
+                data = source.read(1024 * 1024)
+                if data:
+                    sink.write(data)
+                elif done:
+                    return
+                else:
+                    time.sleep(PUMP_INTERVAL)
+    except (OSError, ValueError) as e:
+        # ffmpeg exited early; its exit status reports why
+        logger.warning(f"Stopped piping {video_id} into ffmpeg: {e}")
+    finally:
+        try:
+            sink.close()
+        except OSError:
+            pass
+
+
+def download_progressive(video_id: str, user_id: int | None, url: str, flac_path: str, progress=None, on_partial=None) -> str:
+    """Download on the yt-dlp engine while ffmpeg transcodes, exposing the FLAC as it is written.
+
+    The engine writes the chosen audio format into the staging folder and
+    a thread feeds it to ffmpeg as it grows. ``on_partial`` gets the path
+    of the growing FLAC as soon as ffmpeg is started, and None if the
+    attempt fails. Tags and cover art are written to a copy that is then
+    moved into MUSIC_DIR, so clients still reading the partial file never
+    see it rewritten.
+    """
+    staging = _staging_dir(video_id)
+    partial_path = os.path.join(staging, "stream.flac")
+    ffmpeg_command = [
+        _ffmpeg_path(), "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0", "-vn", "-c:a", "flac",
+        "-metadata_header_padding", str(TAG_PADDING), "-y", partial_path,
     ]
+
+    ffmpeg = None
+    try:
+        ffmpeg = subprocess.Popen(ffmpeg_command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        if on_partial is not None:
+            on_partial(partial_path)
+
+        finished = threading.Event()
+        pump = threading.Thread(target=_pump, args=(staging, video_id, ffmpeg.stdin, finished),
+                                name=f"pump-{video_id}", daemon=True)
+        pump.start()
+        try:
+            info = ytdlp_engine.download(url, STREAM_YDL_OPTS, staging, progress) or {}
+        finally:
+            finished.set()
+            pump.join()
+
+        ffmpeg_errors = ffmpeg.stderr.read().decode("utf-8", "replace").strip()
+        if ffmpeg.wait() != 0 or not os.path.exists(partial_path):
+            raise Exception(f"ffmpeg exited with {ffmpeg.returncode}: {ffmpeg_errors}".strip())
+
+        # Tag a copy; the partial file may still be streamed to clients, who
+        # continue from the published file at the same byte offsets
+        shutil.copyfile(partial_path, os.path.join(staging, f"{video_id}.flac"))
+        _tag_flac(os.path.join(staging, f"{video_id}.flac"), video_id, info, keep_layout=True)
+        _publish(staging, video_id, flac_path)
+
+        _record(video_id, user_id, info, flac_path, is_init=False)
+        logger.info(f"Successfully downloaded {video_id} progressively")
+        return flac_path
+    except Exception:
+        if ffmpeg is not None and ffmpeg.poll() is None:
+            ffmpeg.kill()
+        if on_partial is not None:
+            on_partial(None)
+        raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def download_with_executable(video_id: str, user_id: int | None, url: str, flac_path: str, is_init: bool, progress=None) -> str:
+    """Helper function to download using yt-dlp executable"""
+    staging = _staging_dir(video_id)
+    info_path = os.path.join(staging, "info.json")
+    try:
+        command = [
+            YTDLP_PATH,
+            "--quiet",
+            "--no-warnings",
+            "--extract-audio",
+            "--audio-format", "flac",
+            "--audio-quality", "0",
+            "--embed-metadata",
+            "--embed-thumbnail",
+            # Metadata comes from the same extraction as the download
+            "--print-to-file", INFO_TEMPLATE, info_path,
+            "-o", os.path.join(staging, "%(id)s.%(ext)s"),
+        ]
     
-    # Only add ffmpeg path on Windows
-    if platform.system().lower() == "windows":
-        command.extend(["--ffmpeg-location", FFMPEG_BIN_DIR])
+        # Only add ffmpeg path on Windows
+        if platform.system().lower() == "windows":
+            command.extend(["--ffmpeg-location", FFMPEG_BIN_DIR])
+
+        if progress is not None:
+            _progress_command(command)
     
-    command.append(url)
+        command.append(url)
     
-    download_result = subprocess.run(command)
-
-    if download_result.returncode == 0 and os.path.exists(flac_path):
-        if not is_init:
-            record_download(video_id, title, artist, album, flac_path, user_id)
-            load_local_songs()
-        logger.info(f"Successfully downloaded {video_id} using executable")
-        return flac_path
+        if progress is None:
+            returncode = subprocess.run(command).returncode
+        else:
+            # With --quiet, yt-dlp writes progress lines to stderr
+            proc = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+            errors = _read_progress(proc.stderr, progress)
+            returncode = proc.wait()
+            if returncode != 0 and errors:
+                logger.warning(f"yt-dlp output for {video_id}: {' | '.join(errors)}")
+
+        if returncode == 0 and _publish(staging, video_id, flac_path):
+            _record(video_id, user_id, _read_info(info_path), flac_path, is_init)
+            logger.info(f"Successfully downloaded {video_id} using executable")
+            return flac_path
         
-    raise Exception(f"Executable download failed with code {download_result.returncode}")
+        raise Exception(f"Executable download failed with code {returncode}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
 
-def download_with_module(video_id: str, user_id: int | None, url: str, flac_path: str, is_init: bool) -> str:
-    """Helper function to download using yt-dlp Python module with optimized settings"""
-    ydl_opts = {
-        # Basic options
-        'format': 'bestaudio/best',  # Get best quality audio
-        'outtmpl': os.path.join(MUSIC_DIR, '%(id)s.%(ext)s'),
-        
-        # Audio processing
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'flac',
-            'preferredquality': '0',  # Best quality
-            'nopostoverwrites': False,  # Allow overwriting postprocessed files
-        }, {
-            # Add metadata
-            'key': 'FFmpegMetadata',
-            'add_metadata': True,
-            'add_chapters': True,
-        }, {
-            # Add thumbnail
-            'key': 'EmbedThumbnail',
-            'already_have_thumbnail': False,
-        }],
-        
-        # Additional options
-        'writethumbnail': True,  # Write thumbnail to disk before embedding
-        'embedthumbnail': True,  # Embed thumbnail in audio file
-        'addmetadata': True,     # Write metadata to file
-        'prefer_ffmpeg': True,   # Prefer ffmpeg for post-processing
-        
-        # Quality settings
-        'audioformat': 'flac',   # Force FLAC format
-        'audioquality': '0',     # Best quality
-        
-        # Optimization settings
-        'concurrent_fragment_downloads': 1,  # Download fragments concurrently
-        'retries': 10,           # Retry on download errors
-        'fragment_retries': 10,  # Retry on fragment download errors
-        
-        # Output settings
-        'extract_flat': False,   # Extract audio
-        'keepvideo': False,      # Don't keep video file after extraction
-        'clean_infojson': True,  # Remove info json after download
-        
-        # Progress settings
-        'progress_hooks': [],    # Can add progress tracking if needed
-        'postprocessor_hooks': [], # Can add post-processing tracking
-    }
+MODULE_YDL_OPTS = {
+    # Basic options
+    'format': 'bestaudio/best',  # Get best quality audio
+    'outtmpl': '%(id)s.%(ext)s',  # Inside the staging folder (paths.home)
+    
+    # Audio processing
+    'postprocessors': [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'flac',
+        'preferredquality': '0',  # Best quality
+        'nopostoverwrites': False,  # Allow overwriting postprocessed files
+    }, {
+        # Add metadata
+        'key': 'FFmpegMetadata',
+        'add_metadata': True,
+        'add_chapters': True,
+    }, {
+        # Add thumbnail
+        'key': 'EmbedThumbnail',
+        'already_have_thumbnail': False,
+    }],
+    
+    # Additional options
+    'writethumbnail': True,  # Write thumbnail to disk before embedding
+    'embedthumbnail': True,  # Embed thumbnail in audio file
+    'addmetadata': True,     # Write metadata to file
+    'prefer_ffmpeg': True,   # Prefer ffmpeg for post-processing
+    
+    # Quality settings
+    'audioformat': 'flac',   # Force FLAC format
+    'audioquality': '0',     # Best quality
+    
+    # Optimization settings
+    'concurrent_fragment_downloads': 1,  # Download fragments concurrently
+    'retries': 10,           # Retry on download errors
+    'fragment_retries': 10,  # Retry on fragment download errors
+    
+    # Output settings
+    'extract_flat': False,   # Extract audio
+    'keepvideo': False,      # Don't keep video file after extraction
+    'clean_infojson': True,  # Remove info json after download
+}
 
+def download_with_module(video_id: str, user_id: int | None, url: str, flac_path: str, is_init: bool, progress=None) -> str:
+    """Helper function to download using yt-dlp Python module with optimized settings"""
+    staging = _staging_dir(video_id)
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            # Extract metadata first
-            info = ydl.extract_info(url, download=False)
-            title = info.get('title', '')
-            artist = info.get('artist', '')
-            album = info.get('album', '')
-            
-            # Get additional metadata if available
-            track = info.get('track', '')
-            release_year = info.get('release_year', '')
-            release_date = info.get('release_date', '')
-            genre = info.get('genre', '')
-            
-            # Download and process the file
-            ydl.download([url])
+        # One extraction yields both the metadata and the download, on a
+        # warm yt-dlp engine process
+        info = ytdlp_engine.download(url, MODULE_YDL_OPTS, staging, progress) or {}
+        
+        if _publish(staging, video_id, flac_path):
+            _record(video_id, user_id, info, flac_path, is_init)
+            logger.info(f"Successfully downloaded {video_id} using module")
+            return flac_path
             
-            if os.path.exists(flac_path):
-                if not is_init:
-                    # Record download with extended metadata
-                    record_download(
-                        video_id=video_id,
-                        title=title or track or "Unknown Title",
-                        artist=artist or "Unknown Artist",
-                        album=album or "Unknown Album",
-                        path=flac_path,
-                        user_id=user_id
-                    )
-                    load_local_songs()
-                logger.info(f"Successfully downloaded {video_id} using module")
-                return flac_path
-                
-            raise Exception("Module download failed - file not found")
+        raise Exception("Module download failed - file not found")
             
     except Exception as e:
         logger.error(f"Download error for {video_id}: {str(e)}")
         raise Exception(f"Download failed: {str(e)}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
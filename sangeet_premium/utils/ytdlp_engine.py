@@ -0,0 +1,194 @@
+import os
+import json
+import logging
+import threading
+import itertools
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import yt_dlp
+from ..helpers import process_helper
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Long-lived processes that run yt-dlp extractions and downloads. Each keeps
+# its YoutubeDL instances (HTTP sessions, cookies, player JS) warm between
+# calls. Downloads get their own processes so a few long downloads never
+# hold up searches and link lookups. 0 runs that kind of call in the
+# calling thread instead.
+YTDLP_ENGINE_WORKERS = int(os.getenv("YTDLP_ENGINE_WORKERS", "2"))
+YTDLP_DOWNLOAD_WORKERS = int(os.getenv("YTDLP_DOWNLOAD_WORKERS", "2"))
+# An extraction not answered by the engine within this time runs in the
+# calling thread instead (kept well under the gunicorn worker timeout).
+YTDLP_EXTRACT_TIMEOUT = float(os.getenv("YTDLP_EXTRACT_TIMEOUT", "10"))
+
+_ydl_local = threading.local()
+
+_executors = {}     # "extract" / "download" -> (executor, pid)
+_executor_lock = threading.Lock()
+_progress_queue = None
+_listeners = {}
+_tokens = itertools.count()
+_counters = {"extractions": 0, "downloads": 0, "timeouts": 0, "restarts": 0}
+
+
+def get_ydl(ydl_opts):
+    """A YoutubeDL for ``ydl_opts`` reused by the calling thread.
+
+    Building a YoutubeDL loads every extractor and sets up networking, so
+    each thread (and engine process) keeps one per distinct option set.
+    """
+    if getattr(_ydl_local, "pid", None) != os.getpid():
+        _ydl_local.pid = os.getpid()
+        _ydl_local.instances = {}
+    key = json.dumps(ydl_opts, sort_keys=True, default=str)
+    ydl = _ydl_local.instances.get(key)
+    if ydl is None:
+        ydl = _ydl_local.instances[key] = yt_dlp.YoutubeDL(dict(ydl_opts))
+        ydl.add_progress_hook(_report)
+    return ydl
+
+
+def _report(d):
+    report = getattr(_ydl_local, "progress", None)
+    total = d.get("total_bytes") or d.get("total_bytes_estimate")
+    if report is not None and d.get("status") == "downloading" and total:
+        report(d.get("downloaded_bytes", 0) / total)
+
+
+class EngineError(Exception):
+    """A yt-dlp failure, carried back from an engine process as plain text."""
+
+
+# --- Run inside the engine processes (or the calling thread) ---
+
+def _init_process(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _extract(url, ydl_opts):
+    ydl = get_ydl(ydl_opts)
+    try:
+        info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        # yt-dlp errors hold tracebacks, which cannot be pickled
+        raise EngineError(str(e)) from None
+    return ydl.sanitize_info(info) if info else info
+
+
+def _download(url, ydl_opts, home, token=None, progress=None):
+    ydl = get_ydl(ydl_opts)
+    # Files go to the caller's folder; the instance stays reusable
+    ydl.params["paths"] = {"home": home}
+    if token is not None:
+        progress = lambda fraction: _progress_queue.put((token, fraction))
+    _ydl_local.progress = progress
+    try:
+        info = ydl.extract_info(url, download=True)
+        return ydl.sanitize_info(info) if info else info
+    except Exception as e:
+        raise EngineError(str(e)) from None
+    finally:
+        _ydl_local.progress = None
+
+
+# --- Called by the web workers ---
+
+def _dispatch_progress(progress_queue):
+    while True:
+        token, fraction = progress_queue.get()
+        listener = _listeners.get(token)
+        if listener is not None:
+            try:
+                listener(fraction)
+            except Exception as e:
+                logger.warning(f"Download progress callback failed: {e}")
+
+
+def _pool(kind):
+    """The engine pool for ``kind`` ("extract" or "download"), recreated in
+    forked worker processes and after a crash."""
+    executor, pid = _executors.get(kind, (None, None))
+    if pid != os.getpid() or executor is None:
+        with _executor_lock:
+            executor, pid = _executors.get(kind, (None, None))
+            if pid != os.getpid() or executor is None:
+                ctx = process_helper.pool_context(__name__)
+                if kind == "download":
+                    progress_queue = ctx.Queue()
+                    executor = ProcessPoolExecutor(
+                        max_workers=YTDLP_DOWNLOAD_WORKERS, mp_context=ctx,
+                        initializer=_init_process, initargs=(progress_queue,)
+                    )
+                    threading.Thread(
+                        target=_dispatch_progress, args=(progress_queue,),
+                        name="ytdlp-engine-progress", daemon=True
+                    ).start()
+                else:
+                    executor = ProcessPoolExecutor(max_workers=YTDLP_ENGINE_WORKERS, mp_context=ctx)
+                _executors[kind] = (executor, os.getpid())
+    return executor
+
+
+def _restart(kind, executor, error):
+    logger.warning(f"yt-dlp engine process died, restarting the {kind} pool: {error}")
+    _counters["restarts"] += 1
+    with _executor_lock:
+        if _executors.get(kind, (None, None))[0] is executor:
+            del _executors[kind]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extract(url, ydl_opts):
+    """``extract_info(url, download=False)`` on a warm engine, sanitised to JSON types.
+
+    Falls back to the calling thread if the engine pool is unavailable or
+    does not answer within YTDLP_EXTRACT_TIMEOUT.
+    """
+    _counters["extractions"] += 1
+    if YTDLP_ENGINE_WORKERS <= 0:
+        return _extract(url, ydl_opts)
+    executor = _pool("extract")
+    future = executor.submit(_extract, url, ydl_opts)
+    try:
+        return future.result(timeout=YTDLP_EXTRACT_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        _counters["timeouts"] += 1
+        logger.warning(f"yt-dlp engine busy for {YTDLP_EXTRACT_TIMEOUT}s, extracting in this thread")
+        return _extract(url, ydl_opts)
+    except BrokenProcessPool as e:
+        _restart("extract", executor, e)
+        return _extract(url, ydl_opts)
+
+
+def download(url, ydl_opts, home, progress=None):
+    """Extract and download ``url`` in one pass into the folder ``home``.
+
+    ``ydl_opts`` must be picklable (no hooks); ``progress`` receives the
+    download fraction. Returns the sanitised info dict. Raises
+    BrokenProcessPool if the engine died, so callers can fall back.
+    """
+    _counters["downloads"] += 1
+    if YTDLP_DOWNLOAD_WORKERS <= 0:
+        return _download(url, ydl_opts, home, progress=progress)
+    executor = _pool("download")
+    token = None
+    if progress is not None:
+        token = next(_tokens)
+        _listeners[token] = progress
+    try:
+        return executor.submit(_download, url, ydl_opts, home, token).result()
+    except BrokenProcessPool as e:
+        _restart("download", executor, e)
+        raise
+    finally:
+        _listeners.pop(token, None)
+
+
+def stats():
+    stats = dict(_counters)
+    stats["workers"] = YTDLP_ENGINE_WORKERS
+    stats["download_workers"] = YTDLP_DOWNLOAD_WORKERS
+    return stats
@@ -11,8 +11,9 @@ from time import strftime
 import subprocess
 from termcolor import colored
 from logging.handlers import RotatingFileHandler
-from sangeet_premium.database import database
+from sangeet_premium.database import database, reaper
 from sangeet_premium.utils import cloudflarerun, util, download_cloudflare
+from sangeet_premium.library import scanner, watcher
 from colorama import init, Fore, Style
 import pyfiglet
 import os
@@ -47,26 +48,43 @@ def print_banner():
     print(f"{Fore.GREEN}Starting server at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{Style.RESET_ALL}")
     print("="*80)
 def start_local_songs_refresh(app):
-    """Start a background thread to refresh local songs every 20 seconds."""
+    """Keep local songs in sync: inotify events when enabled, else poll every LOCAL_SONGS_POLL_INTERVAL seconds."""
+    mode = watcher.resolve_mode(os.getenv("LOCAL_SONGS_WATCH", "poll"))
+    interval = int(os.getenv("LOCAL_SONGS_POLL_INTERVAL", "20"))
+
+    def refresh():
+        with app.app_context():
+            util.load_local_songs()
+
+    if mode == "inotify":
+        def on_change(updated, removed):
+            with app.app_context():
+                util.apply_local_changes(updated, removed)
+
+        dirs = scanner.get_library_dirs(util.LOCAL_SONGS_PATHS)
+        if watcher.start_watcher(dirs, on_change, on_overflow=refresh):
+            logger.info("Started local songs watcher (inotify)")
+            return
+        logger.warning("Falling back to polling for local songs")
+
     def refresh_loop():
         while True:
             try:
                 # Create a new application context for each iteration
-                with app.app_context():
-                    util.load_local_songs()
-                    playback.load_local_songs_from_file()
+                refresh()
             except Exception as e:
                 logger.error(f"Error refreshing local songs: {e}")
-            time.sleep(20)  # Wait 20 seconds before next refresh
+            time.sleep(interval)  # Wait before next refresh
     
     # Start the refresh thread
     refresh_thread = Thread(target=refresh_loop, daemon=True)
     refresh_thread.start()
-    logger.info("Started local songs refresh thread")
+    logger.info(f"Started local songs refresh thread (every {interval}s)")
 
 def init_app(app):
     """Initialize the blueprint with the main Flask app."""
     start_local_songs_refresh(app)
+    reaper.start_reaper()
 if __name__ == '__main__':
     try:
         print_banner()
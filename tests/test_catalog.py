@@ -0,0 +1,51 @@
+import os
+from sangeet_premium.library import catalog
+
+
+def _song(song_id, title):
+    return {"id": song_id, "title": title, "artist": "a", "album": "b",
+            "path": f"/music/{song_id}.flac", "thumbnail": "", "duration": 60}
+
+
+def test_changes_are_appended_without_rewriting(tmp_path):
+    path = str(tmp_path / "local.catalog")
+    catalog.write_catalog({"local-1": _song("local-1", "one"), "local-2": _song("local-2", "two")}, path)
+    inode = os.stat(path).st_ino
+    view = catalog.LocalCatalog(path)
+    before = view.refresh(force=True)
+
+    catalog.apply_changes({"local-2": _song("local-2", "TWO"), "local-3": _song("local-3", "three")},
+                          ["local-1"], path)
+
+    assert os.stat(path).st_ino == inode
+    assert view.refresh(force=True).generation == before.generation + 1
+    assert sorted(view) == ["local-2", "local-3"]
+    assert len(view) == 2
+    assert "local-1" not in view
+    assert view["local-2"]["title"] == "TWO"
+    assert view["local-3"]["title"] == "three"
+    # A mapping made before the change still sees its own generation
+    assert before.get("local-1")["title"] == "one"
+    assert before.count == 2
+
+
+def test_too_many_changes_rewrite_the_catalog(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, "CATALOG_MAX_CHANGES", 2)
+    path = str(tmp_path / "local.catalog")
+    catalog.write_catalog({"local-1": _song("local-1", "one")}, path)
+    catalog.apply_changes({"local-2": _song("local-2", "two")}, [], path)
+    inode = os.stat(path).st_ino
+
+    catalog.apply_changes({"local-3": _song("local-3", "three"), "local-4": _song("local-4", "four")},
+                          [], path)
+
+    assert os.stat(path).st_ino != inode
+    snapshot = catalog.LocalCatalog(path).refresh(force=True)
+    assert snapshot.change_count == 0
+    assert list(snapshot.ids()) == ["local-1", "local-2", "local-3", "local-4"]
+
+
+def test_missing_catalog_is_not_patched(tmp_path):
+    path = str(tmp_path / "local.catalog")
+    assert catalog.apply_changes({"local-1": _song("local-1", "one")}, [], path) is None
+    assert not os.path.exists(path)
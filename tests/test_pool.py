@@ -0,0 +1,28 @@
+from sangeet_premium.database import pool
+
+
+def test_release_thread_rolls_back_leaked_transaction(tmp_path):
+    path = str(tmp_path / "test.db")
+    conn = pool.get_connection(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.close()
+
+    # A handler that raises between its INSERT and commit()
+    leaked = pool.get_connection(path)
+    leaked.execute("INSERT INTO t VALUES (1)")
+    pool.release_thread()
+
+    conn = pool.get_connection(path)
+    try:
+        assert not conn.in_transaction
+        conn.execute("INSERT INTO t VALUES (2)")
+        conn.commit()
+        assert conn.execute("SELECT x FROM t").fetchall() == [(2,)]
+    finally:
+        conn.close()
+
+    # Closing the stale handle later must not hand the connection back twice
+    idle = pool.pool_stats()["idle"]["test.db"]
+    leaked.close()
+    assert pool.pool_stats()["idle"]["test.db"] == idle
@@ -0,0 +1,77 @@
+import os
+import sys
+import struct
+import pytest
+from sangeet_premium.utils import util
+
+AUDIO = bytes(range(256)) * 4096    # 1 MiB standing in for FLAC frames
+
+FAKE_FFMPEG = """#!{python}
+import struct, sys
+# Header like ffmpeg's flac muxer: STREAMINFO, then -metadata_header_padding
+padding = int(sys.argv[sys.argv.index("-metadata_header_padding") + 1])
+info = struct.pack(">HH3s3sQ16s", 4096, 4096, b"\\0\\0\\0", b"\\0\\0\\0",
+                   (44100 << 44) | (1 << 41) | (15 << 36) | 441000, b"\\0" * 16)
+with open(sys.argv[-1], "wb") as out:
+    out.write(b"fLaC" + bytes([0, 0, 0, 34]) + info)
+    out.write(bytes([0x81]) + padding.to_bytes(3, "big") + b"\\0" * padding)
+    while True:
+        data = sys.stdin.buffer.read1(65536)
+        if not data:
+            break
+        out.write(data)
+"""
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def progressive(tmp_path, monkeypatch):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(FAKE_FFMPEG.format(python=sys.executable))
+    ffmpeg.chmod(0o755)
+    monkeypatch.setattr(util, "MUSIC_DIR", str(tmp_path / "music"))
+    os.makedirs(util.MUSIC_DIR)
+    monkeypatch.setattr(util, "_ffmpeg_path", lambda: str(ffmpeg))
+    monkeypatch.setattr(util, "_record", lambda *args, **kwargs: None)
+
+    def download(url, ydl_opts, home, progress=None):
+        with open(os.path.join(home, "vid.webm"), "wb") as f:
+            f.write(AUDIO)
+        return {"title": "Title", "artist": "Artist", "album": "Album"}
+    monkeypatch.setattr(util.ytdlp_engine, "download", download)
+
+    # What a client read from the partial file just before it was replaced
+    seen = {}
+    publish = util._publish
+
+    def read_then_publish(staging, video_id, flac_path):
+        with open(os.path.join(staging, "stream.flac"), "rb") as f:
+            f.seek(300 * 1024)
+            seen["range"] = f.read(4096)
+            seen["size"] = f.seek(0, os.SEEK_END)
+        return publish(staging, video_id, flac_path)
+    monkeypatch.setattr(util, "_publish", read_then_publish)
+    return seen
+
+
+@pytest.mark.parametrize("cover_size", [40 * 1024, 400 * 1024])
+def test_published_file_keeps_partial_byte_offsets(progressive, monkeypatch, cover_size):
+    monkeypatch.setattr(util.requests, "get", lambda *args, **kwargs: FakeResponse(b"\xff" * cover_size))
+    flac_path = os.path.join(util.MUSIC_DIR, "vid.flac")
+
+    assert util.download_progressive("vid", 1, "url", flac_path) == flac_path
+
+    with open(flac_path, "rb") as f:
+        f.seek(300 * 1024)
+        assert f.read(4096) == progressive["range"]
+        assert f.seek(0, os.SEEK_END) == progressive["size"]
+    tags = util.FLAC(flac_path)
+    assert tags["title"] == ["Title"]
+    assert bool(tags.pictures) == (cover_size < util.TAG_PADDING)
@@ -0,0 +1,17 @@
+from sangeet_premium.library import scanner
+
+
+def test_inline_artwork_migration_runs_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, "LOCAL_DB_PATH", str(tmp_path / "local_songs.db"))
+    calls = []
+    monkeypatch.setattr(scanner, "_migrate_inline_artwork", calls.append)
+
+    for _ in range(3):
+        scanner.init_db().close()
+
+    assert len(calls) == 1
+    conn = scanner.init_db()
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == scanner.SCHEMA_VERSION
+    finally:
+        conn.close()
@@ -0,0 +1,41 @@
+import pytest
+from sangeet_premium.cache.store import SharedStore
+from sangeet_premium.login_system import session_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache_store.db")
+    monkeypatch.setattr(session_cache, "_store", SharedStore("sessions", ttl=60, path=path))
+    monkeypatch.setattr(session_cache, "_tombstones", SharedStore("session_tombstones", ttl=60, path=path))
+    monkeypatch.setattr(session_cache, "GENERATION_PATH", str(tmp_path / "session_cache.gen"))
+    session_cache._cache.clear()
+    yield session_cache
+    session_cache._cache.clear()
+
+
+def test_logout_during_validation_is_not_cached(cache, monkeypatch):
+    live = {("u1", "tok")}
+
+    def query(user_id, session_token):
+        # The session was still live when read, then logout runs before
+        # the answer is cached
+        remaining = 3600 if (user_id, session_token) in live else None
+        live.discard((user_id, session_token))
+        cache.invalidate_session(user_id, session_token)
+        return remaining
+
+    monkeypatch.setattr(cache, "_query_session", query)
+    assert cache.is_session_valid("u1", "tok")
+    assert cache._store.get("u1:tok") is None
+    assert not cache.is_session_valid("u1", "tok")
+
+
+def test_forget_expired_keeps_other_sessions(cache, monkeypatch):
+    monkeypatch.setattr(cache, "_query_session", lambda user_id, session_token: 3600)
+    assert cache.is_session_valid("u1", "old")
+    assert cache.is_session_valid("u2", "live")
+
+    cache.forget_expired([("u1", "old")])
+    assert cache._store.get("u1:old") is None
+    assert cache._store.get("u2:live") is True
@@ -0,0 +1,49 @@
+import dataclasses
+import multiprocessing
+import pytest
+from sangeet_premium.cache import singleflight
+
+pytestmark = pytest.mark.skipif(singleflight.fcntl is None, reason="needs POSIX record locks")
+
+
+def _hold(key, locked, done):
+    lock = singleflight.KeyLock("test", key)
+    lock.acquire(5)
+    locked.set()
+    done.wait(10)
+    lock.release()
+
+
+def test_keys_do_not_block_each_other(tmp_path, monkeypatch):
+    monkeypatch.setattr(singleflight, "LOCK_DIR", str(tmp_path))
+    ctx = multiprocessing.get_context("fork")
+    locked, done = ctx.Event(), ctx.Event()
+    holder = ctx.Process(target=_hold, args=("a", locked, done))
+    holder.start()
+    try:
+        assert locked.wait(5)
+        other = singleflight.KeyLock("test", "b")
+        assert other.acquire(0)
+        other.release()
+        assert not singleflight.KeyLock("test", "a").acquire(0.2, poll=0.05)
+    finally:
+        done.set()
+        holder.join(5)
+
+    # The holder removed the file it locked; the key can be taken again
+    same = singleflight.KeyLock("test", "a")
+    assert same.acquire(1, poll=0.05)
+    same.release()
+    assert not list(tmp_path.rglob("*.lock"))
+
+
+@dataclasses.dataclass
+class Line:
+    text: str
+    start_time: int
+
+
+def test_shared_results_are_plain(tmp_path, monkeypatch):
+    monkeypatch.setattr(singleflight, "LOCK_DIR", str(tmp_path))
+    result = singleflight.Group().do("lyrics", lambda: {"lyrics": [Line("hi", 0)], "hasTimestamps": True})
+    assert result == {"lyrics": [{"text": "hi", "start_time": 0}], "hasTimestamps": True}
@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import pytest
+from sangeet_premium.library import scanner, watcher
+
+pytestmark = pytest.mark.skipif(
+    watcher.resolve_mode("inotify") != "inotify", reason="inotify is not available"
+)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, "LOCAL_DB_PATH", str(tmp_path / "local_songs.db"))
+    monkeypatch.setattr(scanner._scan_state, "path", str(tmp_path / "cache_store.db"))
+    root = tmp_path / "lib"
+    for folder in ("a", "b", "b/inner"):
+        (root / folder).mkdir(parents=True)
+    for name in ("a/1.mp3", "b/2.mp3", "b/inner/3.mp3"):
+        (root / name).write_bytes(b"not really audio")
+    scanner.scan([str(root)])
+    return root
+
+
+def _paths():
+    conn = scanner.init_db()
+    try:
+        return sorted(path for (path,) in conn.execute("SELECT path FROM songs"))
+    finally:
+        conn.close()
+
+
+def _settle(w):
+    """Read every pending event, then apply them like the debounce would."""
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        w._read_events()
+        time.sleep(0.05)
+    w._flush()
+
+
+def test_folder_rename_keeps_songs(library):
+    w = watcher.InotifyWatcher([str(library)], lambda updated, removed: None)
+    os.rename(library / "b", library / "renamed")
+    _settle(w)
+    assert _paths() == sorted([
+        str(library / "a/1.mp3"),
+        str(library / "renamed/2.mp3"),
+        str(library / "renamed/inner/3.mp3"),
+    ])
+
+    # The renamed folder is still watched under its new name
+    (library / "renamed/4.mp3").write_bytes(b"not really audio")
+    _settle(w)
+    assert str(library / "renamed/4.mp3") in _paths()
+
+
+def test_folder_move_keeps_songs(library):
+    w = watcher.InotifyWatcher([str(library)], lambda updated, removed: None)
+    os.rename(library / "b", library / "a/c")
+    _settle(w)
+    assert _paths() == sorted([
+        str(library / "a/1.mp3"),
+        str(library / "a/c/2.mp3"),
+        str(library / "a/c/inner/3.mp3"),
+    ])
+
+
+def test_folder_moved_out_is_removed(library, tmp_path):
+    w = watcher.InotifyWatcher([str(library)], lambda updated, removed: None)
+    os.rename(library / "b", tmp_path / "elsewhere")
+    _settle(w)
+    assert _paths() == [str(library / "a/1.mp3")]